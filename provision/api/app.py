@@ -5,239 +5,1128 @@ Run with: /var/www/api/venv/bin/python3 app.py
 """
 
 from flask import Flask, request, jsonify
-import mysql.connector
 from datetime import datetime, date
 import os
 import sys
+import time
 import hashlib
+import math
+import threading
 
 # Add the current directory to Python path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+# Shared runtime package: /usr/local/lib/demo when deployed, provision/lib in a checkout
+sys.path.insert(0, os.environ.get('DEMO_LIB_PATH', '/usr/local/lib/demo'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+
+from authcore import changes
+from authcore import log as logs
+from authcore import storage
+from authcore.bloom import KnownUsernames
+from authcore.cache import AuthCache
+from authcore.cluster import HealthRegistry
+from authcore.config import DEFAULT_ENV_PATH, get_config, load_env_file
+from authcore.health import HealthProber
+from authcore.license import LicenseError, LicenseSigner, credential_version
+from authcore.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, Registry, merge, render
+from authcore.passwords import PasswordHasher, VerifierBusy, VerifierPool, available_cores
+from authcore.pool import PoolTimeout, PoolClosed
+from authcore.ratelimit import SharedTokenBucketLimiter, TokenBucketLimiter
+from authcore.storage import get_repository
 
 app = Flask(__name__)
 
-def load_env_file(env_path="/etc/demo/.venv"):
-    """Load environment variables from .venv file"""
-    env_vars = {}
-    try:
-        with open(env_path, 'r') as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith('#'):
-                    key, value = line.split('=', 1)
-                    env_vars[key.strip()] = value.strip().strip('"\'')
-        return env_vars
-    except FileNotFoundError:
-        print(f"❌ Error: Environment file not found at {env_path}")
-        sys.exit(1)
-    except Exception as e:
-        print(f"❌ Error reading environment file: {e}")
-        sys.exit(1)
+try:
+    logs.setup_from_config(get_config())
+except OSError:
+    # No .venv file yet; the startup check below reports that
+    logs.setup_logging()
+log = logs.get_logger('api')
+
+_auth_cache = None
+_health_prober = None
+_license_signer = None
+_change_watcher = None
+_password_verifier = None
+_rate_limiters = None
+_known_usernames = None
+_long_polls = None
+# username -> time.monotonic() until which its auth lookups go to the primary
+# (this process changed the row; replicas may not have the change yet)
+_recent_writes = {}
+
+metrics = Registry()
+PHASE_SECONDS = metrics.histogram(
+    'auth_phase_seconds', 'Time spent in each phase of authentication requests', ('phase',))
+REQUEST_SECONDS = metrics.histogram(
+    'auth_request_seconds', 'End-to-end request handling time', ('endpoint',))
+REQUESTS = metrics.counter(
+    'auth_requests_total', 'Requests by endpoint and HTTP status', ('endpoint', 'code'))
+IN_FLIGHT = metrics.gauge(
+    'auth_in_flight_requests', 'Requests currently being handled')
+metrics.gauge(
+    'auth_db_pool', 'Connection pool occupancy and counters', ('stat',),
+    callback=lambda: {(key,): value for key, value in get_repository().stats().items()})
+metrics.gauge(
+    'auth_cache', 'Authentication record cache size and counters', ('stat',),
+    callback=lambda: {(key,): value for key, value in get_auth_cache().stats().items()
+                      if isinstance(value, (int, float)) and not isinstance(value, bool)})
+metrics.gauge(
+    'auth_password_pool', 'Password hashing pool size and counters', ('stat',),
+    callback=lambda: {(key,): value for key, value in get_password_verifier().stats().items()})
+metrics.gauge(
+    'auth_username_filter', 'Known-username filter size and counters', ('stat',),
+    callback=lambda: {(key,): value for key, value in
+                      (get_known_usernames().stats().items() if get_known_usernames() else ())
+                      if isinstance(value, (int, float)) and not isinstance(value, bool)})
+metrics.gauge(
+    'auth_db_health', 'Last background database check', ('stat',),
+    callback=lambda: {(key,): value for key, value in get_health_prober().result().items()
+                      if key in ('healthy', 'latency_ms', 'consecutive_failures', 'checks', 'age')
+                      and value is not None})
+metrics.gauge(
+    'auth_replica', 'Read replica rotation, lag and counters', ('replica', 'stat'),
+    callback=lambda: {(name, key): value for name, replica in
+                      (get_repository().replicas.stats()['replicas'].items() if get_repository().replicas else ())
+                      for key, value in replica.items()
+                      if isinstance(value, (int, float))})
 
 def get_db_connection():
-    """Create database connection using credentials from .venv file"""
-    env_vars = load_env_file()
-    
+    """Borrow a pooled connection from the storage backend; close() hands it back"""
     try:
-        connection = mysql.connector.connect(
-            host=env_vars.get('DB_HOST', 'localhost'),
-            database=env_vars.get('DB_NAME', 'auth_demo'),
-            user=env_vars.get('DB_USER', 'auth_user'),
-            password=env_vars.get('DB_PASS', ''),
-            autocommit=True
-        )
-        return connection
-    except mysql.connector.Error as e:
-        print(f"❌ Database connection error: {e}")
+        return get_repository().acquire()
+    except (storage.Error, OSError, PoolTimeout, PoolClosed) as e:
+        log.error("Database connection error", error=str(e))
         return None
 
-def md5_hash(password):
-    """Create MD5 hash of password"""
-    return hashlib.md5(password.encode()).hexdigest()
+def get_db_reader(fresh=False):
+    """
+    Connection for a lag-tolerant read: a replica in rotation (its lag is
+    checked in the background), else the primary as get_db_connection()
+    fresh - the read must see this process's recent writes: use the primary
+    """
+    if not fresh:
+        conn = get_repository().acquire_replica(background=True)
+        if conn is not None:
+            return conn
+    return get_db_connection()
 
-@app.route('/authenticate', methods=['POST'])
-def authenticate():
+def note_write(username):
+    """Read the user from the primary until replicas are sure to have this process's change"""
+    staleness = get_repository().read_staleness
+    if not staleness:
+        return
+    now = time.monotonic()
+    if len(_recent_writes) > 1000:
+        for key, until in list(_recent_writes.items()):
+            if until <= now:
+                _recent_writes.pop(key, None)
+    _recent_writes[username] = now + staleness
+
+def written_recently(usernames):
+    now = time.monotonic()
+    return any(_recent_writes.get(username, 0) > now for username in usernames)
+
+def get_auth_cache():
+    """Create the authentication record cache on first use"""
+    global _auth_cache
+    if _auth_cache is None:
+        config = get_config()
+        _auth_cache = AuthCache(
+            max_entries=config.get_int('AUTH_CACHE_SIZE', 10000),
+            ttl=config.get_float('AUTH_CACHE_TTL', 300),
+            sweep_interval=config.get_float('AUTH_CACHE_SWEEP_INTERVAL', 5),
+            sweep_margin=config.get_int('AUTH_CACHE_SWEEP_MARGIN', 60)
+        )
+        # A row read from a replica is only corrected by sweeps that still look back past its edit
+        staleness = get_repository().read_staleness
+        if staleness + _auth_cache.sweep_interval >= _auth_cache.sweep_margin:
+            log.warning("AUTH_CACHE_SWEEP_MARGIN does not cover replica lag; cached users may miss edits",
+                        read_staleness=staleness, sweep_margin=_auth_cache.sweep_margin)
+    return _auth_cache
+
+def check_database():
+    """Round trip to the database on a pooled connection; raises if it is unreachable"""
+    repository = get_repository()
+    conn = repository.acquire()
+    try:
+        repository.ping(conn)
+    except Exception:
+        conn.invalidate()
+        raise
+    conn.close()
+
+def get_health_prober():
+    """Start the background database prober on first use (once per process)"""
+    global _health_prober
+    if _health_prober is None:
+        config = get_config()
+        interval = config.get_float('HEALTH_CHECK_INTERVAL', 5)
+        _health_prober = HealthProber(
+            check_database,
+            interval=interval,
+            stale_after=config.get_float('HEALTH_CHECK_STALE_AFTER', interval * 3)
+        )
+    _health_prober.start()
+    return _health_prober
+
+def get_license_signer():
     """
-    Authenticate user and check subscription status from database
-    Expected JSON: {"username": "user", "password": "pass"}
+    Load the license signing key on first use
+    Returns None when LICENSE_PRIVATE_KEY is missing or unusable (tokens disabled)
+    """
+    global _license_signer
+    if _license_signer is None:
+        config = get_config()
+        key_path = config.get('LICENSE_PRIVATE_KEY', '/etc/demo/license_key.pem')
+        try:
+            _license_signer = LicenseSigner.from_file(key_path, ttl=config.get_int('LICENSE_TTL', 86400))
+        except (OSError, ValueError, LicenseError) as e:
+            log.warning("License tokens disabled", key_path=key_path, error=str(e))
+            _license_signer = False
+    return _license_signer or None
+
+def attach_license(response_data, password_hash):
+    """
+    Add a signed license token for the user in an active /authenticate response
+    password_hash - the user's stored hash; /license/refresh refuses the token once it changes
     """
+    signer = get_license_signer()
+    if signer is None:
+        return
+    user = response_data['user']
+    token = signer.issue(user['id'], user['username'], user['status'], user['expiry'],
+                         credentials=credential_version(password_hash))
+    response_data['license'] = {
+        'token': token,
+        'valid_until': signer.decode(token)['vu'],
+    }
+
+def latest_change_id():
+    """Newest change feed id, read on a pooled connection"""
+    conn = get_repository().acquire()
+    try:
+        value = changes.latest_id(conn)
+    except Exception:
+        conn.invalidate()
+        raise
+    conn.close()
+    return value
+
+def get_change_watcher():
+    """Start the change feed watcher on first use (once per process)"""
+    global _change_watcher
+    if _change_watcher is None:
+        _change_watcher = changes.ChangeWatcher(
+            latest_change_id,
+            poll_interval=get_config().get_float('CHANGES_POLL_INTERVAL', 0.5)
+        )
+    _change_watcher.start()
+    return _change_watcher
+
+def refresh_auth_cache(cache):
+    """Drop cached users whose rows changed since the last sweep (runs every few seconds)"""
+    if not cache.begin_sweep():
+        return
+    
+    conn = None
     try:
-        data = request.get_json()
+        conn = get_db_connection()
+        if not conn:
+            cache.end_sweep(error=True)
+            return
         
-        print(f"🔍 Received authentication request for user: {data.get('username')}")
+        repository = get_repository()
+        next_watermark = repository.now(conn, cache.sweep_margin)
         
-        if not data:
-            return jsonify({
-                'success': False,
-                'message': 'No JSON data received'
-            }), 400
+        changed = []
+        if cache.watermark is not None:
+            changed = repository.changed_usernames(conn, cache.watermark)
         
-        if 'username' not in data or 'password' not in data:
-            return jsonify({
+        conn.close()
+        cache.end_sweep(changed, next_watermark)
+    except Exception as e:
+        if conn:
+            conn.invalidate()
+        log.warning("Auth cache sweep failed", error=str(e))
+        cache.end_sweep(error=True)
+
+def get_password_verifier():
+    """
+    Create the password hasher and its bounded verification pool on first use
+    Under the pre-fork server the available cores are shared among the workers
+    """
+    global _password_verifier
+    if _password_verifier is None:
+        config = get_config()
+        workers = available_cores()
+        if os.environ.get('DEMO_API_HEALTH_DIR'):
+            workers = max(1, workers // config.get_int('API_WORKERS', workers))
+        _password_verifier = VerifierPool(
+            PasswordHasher.from_config(config),
+            workers=config.get_int('PASSWORD_HASH_WORKERS', workers),
+            max_pending=config.get_int('PASSWORD_HASH_MAX_PENDING', 0) or None
+        )
+    return _password_verifier
+
+def upgrade_password_hash(user, password):
+    """
+    Re-store a just-verified password with the configured algorithm and cost
+    Runs on the hashing pool after the response; updated_at is kept, so the
+    change doesn't invalidate ETags or count as an edit for caches and the updater
+    """
+    verifier = get_password_verifier()
+    new_hash = verifier.hasher.hash(password)
+    conn = get_db_connection()
+    if not conn:
+        return
+    try:
+        # Only replace the hash that was verified (another worker may have upgraded it already)
+        upgraded = get_repository().replace_password(conn, user['id'], user['password'], new_hash)
+        conn.close()
+    except Exception as e:
+        conn.invalidate()
+        log.warning("Password hash upgrade failed", user=user['username'], error=str(e))
+        return
+    note_write(user['username'])
+    get_auth_cache().invalidate([user['username']])
+    if upgraded:
+        log.info("Password hash upgraded", user=user['username'], algorithm=verifier.hasher.default.algorithm)
+
+def schedule_rehash(user, password):
+    """Upgrade the user's stored hash in the background if it uses old settings"""
+    verifier = get_password_verifier()
+    if not get_config().get_bool('PASSWORD_REHASH_ON_LOGIN', True):
+        return
+    if get_repository().read_only:
+        # An edge copy can't store the new hash; the primary upgrades it on a login there
+        return
+    if not verifier.hasher.needs_rehash(user['password']):
+        return
+    try:
+        verifier.submit(upgrade_password_hash, user, password)
+    except VerifierBusy:
+        # Busy with logins; the next successful login tries again
+        pass
+
+def get_rate_limiters():
+    """
+    Create the /authenticate rate limiters on first use: {'client': ..., 'user': ...}
+    client - every attempt from an address spends a token
+    user   - only failed attempts on a username spend one, so a user who
+             logs in correctly is never locked out by their own logins
+    Empty when RATE_LIMIT_ENABLED is off
+    """
+    global _rate_limiters
+    if _rate_limiters is None:
+        config = get_config()
+        limiters = {}
+        if config.get_bool('RATE_LIMIT_ENABLED', True):
+            shared = config.get('RATE_LIMIT_BACKEND', 'memory') == 'shared'
+            for name, rate, burst in (('client', 20, 100), ('user', 0.1, 5)):
+                prefix = f'RATE_LIMIT_{name.upper()}'
+                rate = config.get_float(f'{prefix}_RATE', rate)
+                burst = config.get_float(f'{prefix}_BURST', burst)
+                if shared:
+                    path = config.get(f'{prefix}_PATH', SharedTokenBucketLimiter.default_path(name))
+                    limiters[name] = SharedTokenBucketLimiter(
+                        rate, burst, path, slots=config.get_int('RATE_LIMIT_MAX_KEYS', 100000))
+                else:
+                    limiters[name] = TokenBucketLimiter(
+                        rate, burst, max_keys=config.get_int('RATE_LIMIT_MAX_KEYS', 100000))
+        _rate_limiters = limiters
+    return _rate_limiters
+
+def throttle(client, username):
+    """
+    Spend the client's token and check the username's failure budget
+    Returns seconds to wait (0 = go ahead); no database work is involved
+    """
+    limiters = get_rate_limiters()
+    if client and 'client' in limiters:
+        wait = limiters['client'].acquire(client)
+        if wait:
+            log.info("Rate limited", client=client, limit='client', retry_after=round(wait, 1), result=429)
+            return wait
+    if 'user' in limiters:
+        wait = limiters['user'].check(username.lower())
+        if wait:
+            log.info("Rate limited", client=client, user=username, limit='user',
+                     retry_after=round(wait, 1), result=429)
+            return wait
+    return 0.0
+
+def record_failed_login(username):
+    """Spend a token of the username's failure budget"""
+    limiter = get_rate_limiters().get('user')
+    if limiter:
+        limiter.charge(username.lower())
+
+def rate_limited(wait):
+    return {
+        'success': False,
+        'message': 'Too many attempts, retry later',
+        'retry_after': math.ceil(wait)
+    }, 429
+
+def get_known_usernames():
+    """
+    Create the known-username filter on first use and start maintaining it
+    None when USERNAME_FILTER_ENABLED is off
+    """
+    global _known_usernames
+    config = get_config()
+    if not config.get_bool('USERNAME_FILTER_ENABLED', True):
+        return None
+    if _known_usernames is None:
+        _known_usernames = KnownUsernames(
+            lambda: get_repository().acquire(),
+            error_rate=config.get_float('USERNAME_FILTER_ERROR_RATE', 0.001),
+            max_bytes=config.get_int('USERNAME_FILTER_MAX_BYTES', 0) or None,
+            headroom=config.get_float('USERNAME_FILTER_HEADROOM', 1.5),
+            refresh_interval=config.get_float('USERNAME_FILTER_REFRESH_INTERVAL', 1),
+            rebuild_interval=config.get_float('USERNAME_FILTER_REBUILD_INTERVAL', 3600),
+            gap_wait=config.get_float('CHANGES_GAP_WAIT', 5)
+        )
+    _known_usernames.start()
+    return _known_usernames
+
+def fetch_users(usernames):
+    """
+    Look up auth records for several usernames, from the cache when possible
+    Cache misses are resolved with a single WHERE username IN (...) query, on
+    a replica when one is in rotation (names it lacks are asked of the primary)
+    Returns {username: row or None}, or None if the database is unavailable
+    """
+    cache = get_auth_cache()
+    refresh_auth_cache(cache)
+    
+    found = {}
+    missing = []
+    with PHASE_SECONDS.time(phase='cache_lookup'):
+        for username in dict.fromkeys(usernames):
+            user = cache.get(username)
+            if user is None:
+                missing.append(username)
+            else:
+                found[username] = user
+    
+    # Names the filter has never seen are certainly not in the table
+    known = get_known_usernames()
+    if known is not None:
+        with PHASE_SECONDS.time(phase='username_filter'):
+            for username in [username for username in missing if not known.might_exist(username)]:
+                log.debug("Unknown username rejected by filter", user=username)
+                found[username] = None
+                missing.remove(username)
+    
+    if not missing:
+        return found
+    
+    # Get database connection
+    with PHASE_SECONDS.time(phase='db_connect'):
+        conn = get_db_reader(fresh=written_recently(missing))
+    if not conn:
+        return None
+    
+    repository = get_repository()
+    fill_token = cache.fill_token()
+    replica = getattr(conn, 'replica', None)
+    try:
+        with PHASE_SECONDS.time(phase='user_select'):
+            # Check user credentials and get subscription status from database
+            rows = repository.find_users(conn, missing)
+        conn.close()
+    except storage.Error as e:
+        if replica is None:
+            conn.invalidate()
+            raise
+        # The replica is ejected and the primary answers instead
+        repository.replica_failed(conn, e)
+        rows = []
+    except Exception:
+        # Don't hand a connection in an unknown state back to the pool
+        conn.invalidate()
+        raise
+    
+    if replica is not None:
+        # A user created within the replica's lag is only on the primary yet
+        present = {row['username'].casefold() for row in rows}
+        absent = [username for username in missing if username.casefold() not in present]
+        if absent:
+            conn = get_db_connection()
+            if not conn:
+                return None
+            try:
+                with PHASE_SECONDS.time(phase='user_select'):
+                    rows += repository.find_users(conn, absent)
+                conn.close()
+            except Exception:
+                conn.invalidate()
+                raise
+    
+    by_username = {row['username']: row for row in rows}
+    by_folded = {row['username'].casefold(): row for row in rows}
+    for username in missing:
+        user = by_username.get(username)
+        if user is not None:
+            cache.put(username, user, fill_token)
+        else:
+            # The column collation is case-insensitive, so 'Admin' matches 'admin'.
+            # Such rows are not cached: sweeps invalidate by the stored username.
+            user = by_folded.get(username.casefold())
+        found[username] = user
+    
+    return found
+
+def evaluate_subscription(user, username):
+    """
+    Subscription state of a user row
+    Returns (expiry as 'YYYY-MM-DD' or None, whether the subscription is active)
+    """
+    # Get subscription data from database
+    db_status = user['status']
+    db_expiry = user['expiry']
+    
+    # Format expiry for response
+    if db_expiry:
+        if isinstance(db_expiry, str):
+            expiry_str = db_expiry
+        else:
+            expiry_str = db_expiry.strftime('%Y-%m-%d')
+    else:
+        expiry_str = None
+    
+    # Check subscription validity
+    current_date = date.today()
+    is_subscription_active = False
+    
+    if db_status == 'active':
+        if db_expiry is None:
+            # No expiry date = subscription never expires
+            is_subscription_active = True
+            log.debug("Active subscription with no expiry", user=username)
+        else:
+            # Convert expiry to date for comparison
+            if isinstance(db_expiry, str):
+                db_expiry_date = datetime.strptime(db_expiry, '%Y-%m-%d').date()
+            else:
+                db_expiry_date = db_expiry
+            
+            # Ensure both are date objects for comparison
+            if isinstance(db_expiry_date, datetime):
+                db_expiry_date = db_expiry_date.date()
+            
+            is_subscription_active = db_expiry_date >= current_date
+            log.debug("Subscription expiry checked", user=username, expiry=db_expiry_date,
+                      today=current_date, active=is_subscription_active)
+    
+    return expiry_str, is_subscription_active
+
+def response_version(user):
+    """
+    Validator (ETag) for the /authenticate result of a user row
+    Derived from updated_at and the fields the response shows; today's date is
+    part of it because an unchanged row can still expire overnight
+    """
+    source = f"{user['id']}|{user['username']}|{user['status']}|{user['expiry']}|{user.get('updated_at')}|{date.today()}"
+    return hashlib.sha1(source.encode()).hexdigest()[:20]
+
+def etag_matches(if_none_match, version):
+    """Whether an If-None-Match header value names this version"""
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag.strip('"') in (version, '*'):
+            return True
+    return False
+
+def stored_hash(user):
+    """The user's password hash, or the dummy hash at the current cost when there is no such user"""
+    return user['password'] if user else get_password_verifier().hasher.dummy_hash
+
+def check_credentials(user, username, password, if_none_match=None, verified=None):
+    """
+    Verify a password against a user row and evaluate the subscription
+    verified - Future from get_password_verifier().verify_async() when the
+               caller already started the check (batch requests)
+    Returns (response body, HTTP status) with the semantics of /authenticate;
+    (only the version, 304) when the caller already holds the current result
+    """
+    # The KDF runs on the bounded hashing pool; this thread just waits for it.
+    # Unknown users are checked against a dummy hash, so that the response
+    # time doesn't tell which usernames exist
+    with PHASE_SECONDS.time(phase='hashing'):
+        try:
+            if verified is None:
+                verified = get_password_verifier().verify_async(password, stored_hash(user))
+            password_ok = verified.result()
+        except VerifierBusy:
+            log.warning("Password verification pool busy", user=username, result=503)
+            return {
+                'success': False,
+                'message': 'Server busy, retry shortly'
+            }, 503
+    
+    if not user:
+        log.info("Authentication failed", user=username, reason='unknown_user', result=401)
+        return {
+            'success': False,
+            'message': 'Invalid username or password'
+        }, 401
+    
+    if not password_ok:
+        log.info("Authentication failed", user=username, reason='bad_password', result=401)
+        return {
+            'success': False,
+            'message': 'Invalid username or password'
+        }, 401
+    
+    log.debug("Password verified", user=username)
+    schedule_rehash(user, password)
+    
+    version = response_version(user)
+    if etag_matches(if_none_match, version):
+        log.info("Authentication successful, result unchanged", user=username, result=304)
+        return {'version': version}, 304
+    
+    db_status = user['status']
+    with PHASE_SECONDS.time(phase='date_handling'):
+        expiry_str, is_subscription_active = evaluate_subscription(user, username)
+    
+    # Prepare response
+    response_data = {
+        'success': True,
+        'message': 'Authentication successful',
+        'user': {
+            'id': user['id'],
+            'username': user['username'],
+            'status': db_status,
+            'expiry': expiry_str
+        },
+        'subscription_active': is_subscription_active,
+        'version': version
+    }
+    
+    # Modify message based on subscription status
+    if is_subscription_active:
+        response_data['message'] = 'Authentication successful - Active subscription'
+        log.info("Authentication successful", user=username, result=200)
+        return response_data, 200
+    else:
+        response_data['success'] = False
+        response_data['message'] = 'Subscription inactive or expired'
+        log.info("Authentication successful but subscription inactive", user=username, result=403)
+        return response_data, 403
+
+def authenticate_request(data, if_none_match=None, client=None):
+    """
+    Handle an /authenticate payload
+    if_none_match - If-None-Match header; a matching version gets a bodiless 304
+    client        - client address the per-client rate limit is kept for
+    Returns (response body, HTTP status); shared by the Flask and ASGI servers
+    """
+    if not data:
+        return {
+            'success': False,
+            'message': 'No JSON data received'
+        }, 400
+    
+    log.debug("Authentication request received", user=data.get('username'))
+    
+    if 'username' not in data or 'password' not in data:
+        return {
+            'success': False,
+            'message': 'Username and password required'
+        }, 400
+    
+    username = data['username'].strip()
+    password = data['password'].strip()
+    
+    if not username or not password:
+        return {
+            'success': False,
+            'message': 'Username and password cannot be empty'
+        }, 400
+    
+    wait = throttle(client, username)
+    if wait:
+        return rate_limited(wait)
+    
+    users = fetch_users([username])
+    if users is None:
+        return {
+            'success': False,
+            'message': 'Database connection failed'
+        }, 500
+    
+    # A fresh license token can't be sent in a 304, so token requests always get the full result
+    if data.get('issue_token'):
+        if_none_match = None
+    
+    response_data, status_code = check_credentials(users[username], username, password, if_none_match)
+    if status_code == 401:
+        record_failed_login(username)
+    if status_code == 200 and data.get('issue_token'):
+        attach_license(response_data, users[username]['password'])
+    return response_data, status_code
+
+def authenticate_batch_request(data, client=None):
+    """
+    Handle an /authenticate/batch payload
+    client - client address; every credential counts as one attempt against its rate limit
+    Returns (response body, HTTP status); shared by the Flask and ASGI servers
+    """
+    if not data or not isinstance(data.get('credentials'), list):
+        return {
+            'success': False,
+            'message': 'Expected JSON: {"credentials": [{"username": ..., "password": ...}]}'
+        }, 400
+    
+    credentials = data['credentials']
+    max_batch = get_config().get_int('AUTH_BATCH_MAX', 100)
+    if len(credentials) > max_batch:
+        return {
+            'success': False,
+            'message': f'At most {max_batch} credentials per batch'
+        }, 400
+    
+    log.info("Batch authentication request received", size=len(credentials))
+    
+    entries = []
+    for item in credentials:
+        username = password = None
+        if isinstance(item, dict):
+            username = item.get('username')
+            password = item.get('password')
+        if isinstance(username, str) and isinstance(password, str):
+            entries.append((username.strip(), password.strip()))
+        else:
+            entries.append((None, None))
+    
+    # Rate limits apply per credential; limited entries get a 429 result and no lookup
+    waits = {}
+    for index, (username, password) in enumerate(entries):
+        if username and password:
+            wait = throttle(client, username)
+            if wait:
+                waits[index] = wait
+    
+    users = fetch_users([username for index, (username, password) in enumerate(entries)
+                         if username and password and index not in waits])
+    if users is None:
+        return {
+            'success': False,
+            'message': 'Database connection failed'
+        }, 500
+    
+    # Start every password check at once so they run in parallel on the hashing pool
+    verifier = get_password_verifier()
+    checks = {}
+    for index, (username, password) in enumerate(entries):
+        if username and password and index not in waits:
+            try:
+                checks[index] = verifier.verify_async(password, stored_hash(users[username]))
+            except VerifierBusy:
+                pass
+    
+    results = []
+    summary = {}
+    for index, (username, password) in enumerate(entries):
+        if username is None:
+            response_data, status_code = {
                 'success': False,
                 'message': 'Username and password required'
-            }), 400
-        
-        username = data['username'].strip()
-        password = data['password'].strip()
-        
-        if not username or not password:
-            return jsonify({
+            }, 400
+        elif not username or not password:
+            response_data, status_code = {
                 'success': False,
                 'message': 'Username and password cannot be empty'
-            }), 400
-        
-        # Get database connection
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({
-                'success': False,
-                'message': 'Database connection failed'
-            }), 500
-        
-        cursor = conn.cursor(dictionary=True)
-        
-        # Check user credentials and get subscription status from database
-        cursor.execute("""
-            SELECT id, username, password, status, expiry 
-            FROM users 
-            WHERE username = %s
-        """, (username,))
-        
-        user = cursor.fetchone()
-        
-        if not user:
-            cursor.close()
-            conn.close()
-            print(f"❌ User '{username}' not found in database")
-            return jsonify({
-                'success': False,
-                'message': 'Invalid username or password'
-            }), 401
-        
-        # Hash the provided password with MD5 for comparison
-        hashed_password = md5_hash(password)
-        
-        print(f"🔍 Password comparison:")
-        print(f"   Database MD5: '{user['password']}'")
-        print(f"   Provided MD5: '{hashed_password}'")
-        print(f"   Match: {user['password'] == hashed_password}")
-        
-        # Verify password using MD5 hash
-        if user['password'] != hashed_password:
-            cursor.close()
-            conn.close()
-            print(f"❌ MD5 password mismatch for user '{username}'")
-            return jsonify({
+            }, 400
+        elif index in waits:
+            response_data, status_code = rate_limited(waits[index])
+        elif index not in checks:
+            response_data, status_code = {
                 'success': False,
-                'message': 'Invalid username or password'
-            }), 401
-        
-        print(f"✅ MD5 password verified for user '{username}'")
-        
-        # Get subscription data from database
-        db_status = user['status']
-        db_expiry = user['expiry']
-        
-        # Format expiry for response
-        if db_expiry:
-            if isinstance(db_expiry, str):
-                expiry_str = db_expiry
-            else:
-                expiry_str = db_expiry.strftime('%Y-%m-%d')
+                'message': 'Server busy, retry shortly'
+            }, 503
         else:
-            expiry_str = None
-        
-        # Check subscription validity
-        current_date = date.today()
-        is_subscription_active = False
-        
-        if db_status == 'active':
-            if db_expiry is None:
-                # No expiry date = subscription never expires
-                is_subscription_active = True
-                print(f"✅ User '{username}' has active subscription with no expiry")
-            else:
-                # Convert expiry to date for comparison
-                if isinstance(db_expiry, str):
-                    db_expiry_date = datetime.strptime(db_expiry, '%Y-%m-%d').date()
-                else:
-                    db_expiry_date = db_expiry
-                
-                # Ensure both are date objects for comparison
-                if isinstance(db_expiry_date, datetime):
-                    db_expiry_date = db_expiry_date.date()
-                
-                print(f"🔍 User '{username}' expiry: {db_expiry_date} (type: {type(db_expiry_date)})")
-                print(f"🔍 Today: {current_date} (type: {type(current_date)})")
-                
-                is_subscription_active = db_expiry_date >= current_date
-                print(f"🔍 Subscription active: {is_subscription_active}")
-        
-        cursor.close()
-        conn.close()
+            response_data, status_code = check_credentials(users[username], username, password,
+                                                           verified=checks.get(index))
+            if status_code == 401:
+                record_failed_login(username)
         
-        # Prepare response
-        response_data = {
-            'success': True,
-            'message': 'Authentication successful',
-            'user': {
-                'id': user['id'],
-                'username': user['username'],
-                'status': db_status,
-                'expiry': expiry_str
-            },
-            'subscription_active': is_subscription_active
-        }
-        
-        # Modify message based on subscription status
-        if is_subscription_active:
-            response_data['message'] = 'Authentication successful - Active subscription'
-            print(f"🎉 Authentication successful for '{username}' - Active subscription")
-            return jsonify(response_data), 200
+        response_data['username'] = username
+        response_data['http_status'] = status_code
+        results.append(response_data)
+        summary[str(status_code)] = summary.get(str(status_code), 0) + 1
+    
+    return {
+        'success': True,
+        'results': results,
+        'summary': summary
+    }, 200
+
+def license_refresh_request(data):
+    """
+    Handle a /license/refresh payload: {"token": "..."}
+    Re-checks the user's current subscription and issues a fresh token without
+    a password; tokens lapsed for more than LICENSE_REFRESH_GRACE seconds, or
+    issued before the user's password last changed, are refused with a 401 so
+    the client authenticates again
+    Returns (response body, HTTP status); shared by the Flask and ASGI servers
+    """
+    signer = get_license_signer()
+    if signer is None:
+        return {
+            'success': False,
+            'message': 'License tokens are not enabled on this server'
+        }, 501
+    
+    if not data or not isinstance(data.get('token'), str):
+        return {
+            'success': False,
+            'message': 'Expected JSON: {"token": "..."}'
+        }, 400
+    
+    try:
+        claims = signer.decode(data['token'])
+    except LicenseError as e:
+        log.info("License refresh refused", reason=str(e), result=401)
+        return {
+            'success': False,
+            'message': str(e)
+        }, 401
+    
+    grace = get_config().get_int('LICENSE_REFRESH_GRACE', 7 * 86400)
+    if time.time() > claims['vu'] + grace:
+        log.info("License refresh refused", user=claims['sub'], reason='too_old', result=401)
+        return {
+            'success': False,
+            'message': 'License token too old - authenticate again'
+        }, 401
+    
+    users = fetch_users([claims['sub']])
+    if users is None:
+        return {
+            'success': False,
+            'message': 'Database connection failed'
+        }, 500
+    
+    user = users[claims['sub']]
+    if not user or user['id'] != claims['uid']:
+        log.info("License refresh refused", user=claims['sub'], reason='unknown_user', result=401)
+        return {
+            'success': False,
+            'message': 'License token does not match an existing user - authenticate again'
+        }, 401
+    
+    # A changed password (or an upgraded hash, which the next login settles) ends offline access
+    if claims.get('cv') != credential_version(user['password']):
+        log.info("License refresh refused", user=claims['sub'], reason='credentials_changed', result=401)
+        return {
+            'success': False,
+            'message': 'Credentials changed since the license was issued - authenticate again'
+        }, 401
+    
+    expiry_str, is_subscription_active = evaluate_subscription(user, claims['sub'])
+    response_data = {
+        'success': is_subscription_active,
+        'message': 'License renewed' if is_subscription_active else 'Subscription inactive or expired',
+        'user': {
+            'id': user['id'],
+            'username': user['username'],
+            'status': user['status'],
+            'expiry': expiry_str
+        },
+        'subscription_active': is_subscription_active
+    }
+    if not is_subscription_active:
+        log.info("License refresh refused", user=claims['sub'], reason='inactive', result=403)
+        return response_data, 403
+    
+    attach_license(response_data, user['password'])
+    log.info("License renewed", user=claims['sub'], result=200)
+    return response_data, 200
+
+def parse_changes_args(args):
+    """
+    Validate /changes query parameters (a dict of strings)
+    Returns (since or None, seconds to wait, limit); raises ValueError
+    """
+    config = get_config()
+    since = args.get('since')
+    since = int(since) if since not in (None, '') else None
+    wait = float(args.get('wait', config.get_float('CHANGES_WAIT', 25)))
+    limit = int(args.get('limit', 500))
+    if (since is not None and since < 0) or not math.isfinite(wait) or wait < 0 or limit < 1:
+        raise ValueError('since, wait and limit must be finite and not negative')
+    return since, min(wait, config.get_float('CHANGES_MAX_WAIT', 30)), min(limit, 5000)
+
+def read_changes(since, limit):
+    """
+    One read of the change feed after cursor since (None = start from now)
+    Returns (response body, HTTP status); shared by the Flask and ASGI servers
+    """
+    conn = get_db_connection()
+    if not conn:
+        return {
+            'success': False,
+            'message': 'Database connection failed'
+        }, 500
+    
+    try:
+        if since is None:
+            next_cursor = changes.latest_id(conn)
+            found = []
         else:
-            response_data['success'] = False
-            response_data['message'] = 'Subscription inactive or expired'
-            print(f"⚠️ Authentication successful for '{username}' but subscription inactive")
-            return jsonify(response_data), 403
-            
-    except Exception as e:
-        print(f"❌ Server error in /authenticate: {e}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({
+            found, next_cursor = changes.fetch(
+                conn, since, limit, gap_wait=get_config().get_float('CHANGES_GAP_WAIT', 5))
+        conn.close()
+    except changes.CursorExpired as e:
+        conn.close()
+        return {
+            'success': False,
+            'message': str(e),
+            'reset': True
+        }, 410
+    except Exception:
+        conn.invalidate()
+        raise
+    
+    return {
+        'success': True,
+        'cursor': next_cursor,
+        'changes': found,
+        'more': len(found) >= limit
+    }, 200
+
+def changes_request(args):
+    """
+    Handle GET /changes?since=<cursor>&wait=<seconds>&limit=<n> as a long poll:
+    answers as soon as there are changes after since, or with an empty list
+    once wait seconds pass. Without since, returns the current cursor at once.
+    Each waiting request holds a server thread, so only CHANGES_MAX_WAITERS
+    wait at a time per process; beyond that, a request with nothing to return
+    gets a 503 and Retry-After. The ASGI server waits on the event loop
+    instead (asgi_app.py) and has no such limit
+    """
+    try:
+        since, wait, limit = parse_changes_args(args)
+    except ValueError:
+        return {
+            'success': False,
+            'message': 'since, wait and limit must be non-negative numbers'
+        }, 400
+    
+    if since is None or wait == 0:
+        return read_changes(since, limit)
+    long_polls = get_long_polls()
+    if not long_polls.acquire(blocking=False):
+        # Every long-poll slot is taken: answer from one read, or ask the client to come back
+        response_data, status_code = read_changes(since, limit)
+        if status_code != 200 or response_data['changes']:
+            return response_data, status_code
+        return {
             'success': False,
-            'message': f'Server error: {str(e)}'
-        }), 500
+            'message': 'Too many waiting change feed requests, retry later',
+            'retry_after': 1
+        }, 503
+    try:
+        return wait_for_changes(since, wait, limit)
+    finally:
+        long_polls.release()
+
+def get_long_polls():
+    """Semaphore bounding the /changes requests that wait in server threads"""
+    global _long_polls
+    if _long_polls is None:
+        _long_polls = threading.BoundedSemaphore(get_config().get_int('CHANGES_MAX_WAITERS', 1))
+    return _long_polls
+
+def wait_for_changes(since, wait, limit):
+    """Read the feed after since until there are changes or wait seconds pass"""
+    watcher = get_change_watcher()
+    deadline = time.monotonic() + wait
+    while True:
+        response_data, status_code = read_changes(since, limit)
+        remaining = deadline - time.monotonic()
+        if status_code != 200 or response_data['changes'] or since is None or remaining <= 0:
+            return response_data, status_code
+        if (watcher.latest_id() or 0) > since:
+            # Newer ids exist but are not readable yet (see changes.fetch)
+            time.sleep(min(remaining, watcher.poll_interval))
+        else:
+            watcher.wait(since, remaining)
+
+def status_report():
+    """
+    Build the /status body
+    Returns (response body, HTTP status); shared by the Flask and ASGI servers
+    """
+    # Database state comes from the background prober; /status never connects
+    health = get_health_prober().result()
+    
+    report = {
+        'status': 'online',
+        'database': 'connected' if health['healthy'] else 'disconnected',
+        'health': health,
+        'storage': get_repository().backend,
+        'pool': get_repository().stats(),
+        'replicas': get_repository().replicas.stats() if get_repository().replicas else {'enabled': False},
+        'auth_cache': get_auth_cache().stats(),
+        'password_hashing': get_password_verifier().stats(),
+        'rate_limits': {name: limiter.stats() for name, limiter in get_rate_limiters().items()},
+        'username_filter': get_known_usernames().stats() if get_known_usernames() else {'enabled': False},
+        'logging': logs.stats(),
+        'message': 'Authentication API is running',
+        'timestamp': datetime.now().isoformat()
+    }
+    
+    # Under the pre-fork server (gunicorn.conf.py) also report every worker
+    health_dir = os.environ.get('DEMO_API_HEALTH_DIR')
+    if health_dir:
+        report['worker_pid'] = os.getpid()
+        report['cluster'] = HealthRegistry(health_dir).summary()
+    
+    return report, 200
+
+def liveness_report():
+    """The process is up and serving requests; never touches the database"""
+    return {'status': 'alive', 'pid': os.getpid()}, 200
+
+def readiness_report():
+    """Ready to authenticate if the last background database check succeeded"""
+    health = get_health_prober().result()
+    report = {
+        'status': 'ready' if health['healthy'] else 'unavailable',
+        'database': health,
+    }
+    return report, 200 if health['healthy'] else 503
+
+def server_error(endpoint, e):
+    """Log an unhandled error (call from an except block) and build the 500 response body"""
+    log.exception("Server error", endpoint=endpoint)
+    return {
+        'success': False,
+        'message': f'Server error: {str(e)}'
+    }, 500
+
+def metrics_report():
+    """
+    Prometheus exposition of this process's metrics
+    Under the pre-fork server the other workers' last heartbeat snapshots are merged
+    in: counters and histograms summed, gauges reported per worker (pid label)
+    """
+    snapshot = metrics.snapshot()
+    health_dir = os.environ.get('DEMO_API_HEALTH_DIR')
+    if health_dir:
+        workers = {
+            worker['pid']: worker['metrics'] for worker in HealthRegistry(health_dir).workers()
+            if worker.get('pid') != os.getpid() and worker['healthy'] and worker.get('metrics')
+        }
+        workers[os.getpid()] = snapshot
+        snapshot = merge(workers)
+    return render(snapshot)
+
+def handle_request(endpoint, handler):
+    """Run handler() -> (body, status) with request metrics and JSON serialization"""
+    started = time.perf_counter()
+    IN_FLIGHT.inc()
+    status_code = 500
+    try:
+        try:
+            response_data, status_code = handler()
+        except Exception as e:
+            response_data, status_code = server_error(endpoint, e)
+        with PHASE_SECONDS.time(phase='serialize'):
+            if status_code == 304:
+                response = app.response_class(status=304)
+            else:
+                response = jsonify(response_data)
+        if isinstance(response_data, dict) and response_data.get('version'):
+            response.set_etag(response_data['version'])
+        if status_code in (429, 503) and 'retry_after' in response_data:
+            response.headers['Retry-After'] = str(response_data['retry_after'])
+        return response, status_code
+    finally:
+        IN_FLIGHT.dec()
+        REQUESTS.inc(endpoint=endpoint, code=status_code)
+        REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+
+@app.route('/authenticate', methods=['POST'])
+def authenticate():
+    """
+    Authenticate user and check subscription status from database
+    Expected JSON: {"username": "user", "password": "pass"}
+    Send the last ETag in If-None-Match to get an empty 304 when nothing changed
+    """
+    return handle_request('/authenticate', lambda: authenticate_request(
+        request.get_json(), request.headers.get('If-None-Match'), request.remote_addr))
+
+@app.route('/authenticate/batch', methods=['POST'])
+def authenticate_batch():
+    """
+    Authenticate several users with a single database round trip
+    Expected JSON: {"credentials": [{"username": "user", "password": "pass"}, ...]}
+    Each result carries the HTTP status /authenticate would have returned for it
+    """
+    return handle_request('/authenticate/batch', lambda: authenticate_batch_request(
+        request.get_json(silent=True), request.remote_addr))
+
+@app.route('/license/refresh', methods=['POST'])
+def license_refresh():
+    """
+    Renew a license token without the password
+    Expected JSON: {"token": "..."}
+    """
+    return handle_request('/license/refresh', lambda: license_refresh_request(request.get_json(silent=True)))
+
+@app.route('/changes', methods=['GET'])
+def changes_feed():
+    """
+    Long-poll the user change feed
+    Query: since=<cursor from the last response>, wait=<seconds>, limit=<n>
+    """
+    return handle_request('/changes', lambda: changes_request(request.args))
 
 @app.route('/status', methods=['GET'])
 def status():
     """API status check"""
     try:
-        # Test database connection
-        conn = get_db_connection()
-        if conn and conn.is_connected():
-            db_status = 'connected'
-            conn.close()
-        else:
-            db_status = 'disconnected'
-        
-        return jsonify({
-            'status': 'online',
-            'database': db_status,
-            'message': 'Authentication API is running',
-            'timestamp': datetime.now().isoformat()
-        })
+        response_data, status_code = status_report()
     except Exception as e:
-        return jsonify({
+        response_data, status_code = {
             'status': 'error',
             'message': f'Status check failed: {str(e)}'
-        }), 500
+        }, 500
+    return jsonify(response_data), status_code
+
+@app.route('/health/live', methods=['GET'])
+def health_live():
+    """Liveness probe"""
+    response_data, status_code = liveness_report()
+    return jsonify(response_data), status_code
+
+@app.route('/health/ready', methods=['GET'])
+def health_ready():
+    """Readiness probe, answered from the cached background check"""
+    response_data, status_code = readiness_report()
+    return jsonify(response_data), status_code
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus metrics"""
+    return metrics_report(), 200, {'Content-Type': METRICS_CONTENT_TYPE}
 
 if __name__ == '__main__':
     print("🔧 Starting Flask Authentication API...")
     print("🐍 Using virtual environment:", sys.prefix)
-    print("📁 Loading environment from: /etc/demo/.venv")
+    print("📁 Loading environment from:", DEFAULT_ENV_PATH)
+    load_env_file()
     
     # Test database connection on startup
     print("🔌 Testing database connection...")
@@ -249,6 +1138,11 @@ if __name__ == '__main__':
         print("❌ Database connection failed - check your .venv file")
         sys.exit(1)
     
+    get_health_prober()
+    get_known_usernames()
     print("🚀 Starting Flask server on http://localhost:5000")
-    print("🔍 MD5 password hashing enabled")
+    hasher = get_password_verifier().hasher
+    print(f"🔍 Password hashing: {hasher.default.algorithm} for new hashes, "
+          f"MD5 hashes upgraded on login, {get_password_verifier().workers} hashing threads")
+    print(f"🗄️ Storage: {get_repository().describe()}")
     app.run(host='localhost', port=5000, debug=False)
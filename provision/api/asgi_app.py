@@ -0,0 +1,321 @@
+#!venv/bin/python3
+"""
+ASGI Authentication API
+Async serving mode for the same endpoints as app.py. Requests wait on the
+event loop while the blocking MySQL work runs in a bounded thread pool, so
+thousands of in-flight requests need only a handful of threads.
+Run with: /var/www/api/venv/bin/python3 asgi_app.py
+      or: /var/www/api/venv/bin/uvicorn asgi_app:app --host localhost --port 5000
+"""
+
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import app as auth_app
+from authcore.config import DEFAULT_ENV_PATH, get_config, load_env_file
+
+
+class Overloaded(Exception):
+    """Raised when too many requests are already waiting for a database worker"""
+
+
+class AuthAPI:
+    """
+    Minimal ASGI application
+
+    workers     - threads running blocking DB work (defaults to the pool's
+                  size + max_overflow, so no worker ever waits for a connection)
+    max_pending - requests allowed to wait for a worker; beyond that the
+                  server answers 503 immediately instead of queueing forever
+    """
+
+    def __init__(self, workers=None, max_pending=None):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.rejected = 0
+        self.executor = None
+        self.routes = {
+            ('POST', '/authenticate'): self.authenticate,
+            ('POST', '/authenticate/batch'): self.authenticate_batch,
+            ('POST', '/license/refresh'): self.license_refresh,
+            ('GET', '/changes'): self.changes,
+            ('GET', '/status'): self.status,
+            ('GET', '/health/live'): self.health_live,
+            ('GET', '/health/ready'): self.health_ready,
+            ('GET', '/metrics'): self.metrics,
+        }
+
+    def start(self):
+        """Create the worker pool (called from lifespan startup or on first use)"""
+        if self.executor is not None:
+            return
+        config = get_config()
+        if self.workers is None:
+            self.workers = config.get_int('ASGI_WORKERS', auth_app.get_repository().max_connections)
+        if self.max_pending is None:
+            self.max_pending = config.get_int('ASGI_MAX_PENDING', 1000)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='auth-db')
+        auth_app.get_health_prober()
+        auth_app.get_known_usernames()
+
+    def stop(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    async def run_blocking(self, fn, *args):
+        """Run fn(*args) on a DB worker, applying backpressure"""
+        if self.executor is None:
+            self.start()
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise Overloaded()
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            self.pending -= 1
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        handler = self.routes.get((scope['method'], scope['path']))
+        if handler is None:
+            methods = [method for method, path in self.routes if path == scope['path']]
+            if methods:
+                await self.respond(send, {'success': False, 'message': 'Method not allowed'}, 405)
+            else:
+                await self.respond(send, {'success': False, 'message': 'Not found'}, 404)
+            return
+
+        if handler == self.metrics:
+            await self.respond(send, *await handler(None, scope))
+            return
+
+        started = time.perf_counter()
+        auth_app.IN_FLIGHT.inc()
+        status_code = 500
+        try:
+            body = await self.read_body(receive)
+            try:
+                response_data, status_code = await handler(body, scope)
+            except Overloaded:
+                status_code = 503
+                await self.respond(send, {
+                    'success': False,
+                    'message': 'Server busy, retry shortly'
+                }, 503, extra_headers=[(b'retry-after', b'1')])
+                return
+            await self.respond(send, response_data, status_code)
+        finally:
+            auth_app.IN_FLIGHT.dec()
+            auth_app.REQUESTS.inc(endpoint=scope['path'], code=status_code)
+            auth_app.REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=scope['path'])
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self.start()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.stop()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    @staticmethod
+    async def read_body(receive):
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body'):
+                return b''.join(chunks)
+
+    @staticmethod
+    def header(scope, name):
+        """First value of a request header (name in lower case), or None"""
+        for key, value in scope.get('headers', ()):
+            if key == name:
+                return value.decode('latin-1')
+        return None
+
+    @staticmethod
+    def client(scope):
+        """Client address, or None if the server doesn't report it"""
+        client = scope.get('client')
+        return client[0] if client else None
+
+    @staticmethod
+    def parse_json(body):
+        try:
+            return json.loads(body) if body else None
+        except ValueError:
+            return None
+
+    @staticmethod
+    async def respond(send, data, status_code, extra_headers=()):
+        if isinstance(data, str):
+            payload = data.encode()
+            content_type = auth_app.METRICS_CONTENT_TYPE.encode()
+        elif status_code == 304:
+            payload = content_type = None
+        else:
+            with auth_app.PHASE_SECONDS.time(phase='serialize'):
+                payload = json.dumps(data, default=str).encode()
+            content_type = b'application/json'
+        headers = []
+        if payload is not None:
+            headers.append((b'content-type', content_type))
+            headers.append((b'content-length', str(len(payload)).encode()))
+        if isinstance(data, dict) and data.get('version'):
+            headers.append((b'etag', f'"{data["version"]}"'.encode()))
+        if status_code == 429:
+            headers.append((b'retry-after', str(data['retry_after']).encode()))
+        headers.extend(extra_headers)
+        await send({'type': 'http.response.start', 'status': status_code, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': payload or b''})
+
+    async def authenticate(self, body, scope):
+        data = self.parse_json(body)
+        if data is not None and not isinstance(data, dict):
+            data = None
+        try:
+            return await self.run_blocking(auth_app.authenticate_request, data,
+                                           self.header(scope, b'if-none-match'), self.client(scope))
+        except Overloaded:
+            raise
+        except Exception as e:
+            return auth_app.server_error('/authenticate', e)
+
+    async def authenticate_batch(self, body, scope):
+        data = self.parse_json(body)
+        if data is not None and not isinstance(data, dict):
+            data = None
+        try:
+            return await self.run_blocking(auth_app.authenticate_batch_request, data, self.client(scope))
+        except Overloaded:
+            raise
+        except Exception as e:
+            return auth_app.server_error('/authenticate/batch', e)
+
+    async def license_refresh(self, body, scope):
+        data = self.parse_json(body)
+        if data is not None and not isinstance(data, dict):
+            data = None
+        try:
+            return await self.run_blocking(auth_app.license_refresh_request, data)
+        except Overloaded:
+            raise
+        except Exception as e:
+            return auth_app.server_error('/license/refresh', e)
+
+    async def changes(self, body, scope):
+        # Long poll on the event loop: a DB worker is only held for each short read
+        query = scope.get('query_string', b'').decode('latin-1')
+        try:
+            since, wait, limit = auth_app.parse_changes_args(dict(parse_qsl(query)))
+        except ValueError:
+            return {
+                'success': False,
+                'message': 'since, wait and limit must be non-negative numbers'
+            }, 400
+
+        loop = asyncio.get_running_loop()
+        moved = asyncio.Event()
+        notify = lambda: loop.call_soon_threadsafe(moved.set)
+        watcher = None
+        try:
+            watcher = await self.run_blocking(auth_app.get_change_watcher)
+            watcher.add_listener(notify)
+            deadline = time.monotonic() + wait
+            while True:
+                moved.clear()
+                response_data, status_code = await self.run_blocking(auth_app.read_changes, since, limit)
+                remaining = deadline - time.monotonic()
+                if status_code != 200 or response_data['changes'] or since is None or remaining <= 0:
+                    return response_data, status_code
+                if (watcher.latest_id() or 0) > since:
+                    # Newer ids exist but are not readable yet (see changes.fetch)
+                    remaining = min(remaining, watcher.poll_interval)
+                try:
+                    await asyncio.wait_for(moved.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+        except Overloaded:
+            raise
+        except Exception as e:
+            return auth_app.server_error('/changes', e)
+        finally:
+            if watcher is not None:
+                watcher.remove_listener(notify)
+
+    async def status(self, body, scope):
+        try:
+            response_data, status_code = await self.run_blocking(auth_app.status_report)
+        except Overloaded:
+            raise
+        except Exception as e:
+            return {
+                'status': 'error',
+                'message': f'Status check failed: {str(e)}'
+            }, 500
+        response_data['server'] = {
+            'mode': 'asgi',
+            'workers': self.workers,
+            'pending': self.pending,
+            'max_pending': self.max_pending,
+            'rejected': self.rejected,
+        }
+        return response_data, status_code
+
+    async def health_live(self, body, scope):
+        # Answered on the event loop: still responds when every DB worker is busy
+        return auth_app.liveness_report()
+
+    async def health_ready(self, body, scope):
+        # Reads the prober's cached result, no database work
+        return auth_app.readiness_report()
+
+    async def metrics(self, body, scope):
+        # Merging worker snapshots reads files; keep it off the event loop
+        return await asyncio.get_running_loop().run_in_executor(None, auth_app.metrics_report), 200
+
+
+app = AuthAPI()
+
+if __name__ == '__main__':
+    import uvicorn
+
+    print("🔧 Starting ASGI Authentication API...")
+    print("🐍 Using virtual environment:", sys.prefix)
+    print("📁 Loading environment from:", DEFAULT_ENV_PATH)
+    config = load_env_file()
+
+    # Test database connection on startup
+    print("🔌 Testing database connection...")
+    conn = auth_app.get_db_connection()
+    if conn:
+        print("✅ Database connection successful")
+        conn.close()
+    else:
+        print("❌ Database connection failed - check your .venv file")
+        sys.exit(1)
+
+    host = config.get('FLASK_HOST', 'localhost')
+    port = int(config.get('FLASK_PORT', 5000))
+    print(f"🚀 Starting ASGI server on http://{host}:{port}")
+    uvicorn.run(app, host=host, port=port, log_level='warning')
@@ -0,0 +1,96 @@
+"""
+Gunicorn Configuration for the Authentication API
+Pre-fork production server: several worker processes, each with its own DB
+pool (created lazily after fork), recycled after a bounded number of requests.
+The master aggregates worker heartbeats so /status reports every worker.
+Run with: /var/www/api/venv/bin/gunicorn -c gunicorn.conf.py app:app
+"""
+
+import os
+import sys
+import threading
+import time
+
+# Shared runtime package: /usr/local/lib/demo when deployed, provision/lib in a checkout
+sys.path.insert(0, os.environ.get('DEMO_LIB_PATH', '/usr/local/lib/demo'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+
+from authcore.cluster import HealthRegistry
+from authcore.config import get_config
+
+_config = get_config()
+
+bind = f"{_config.get('FLASK_HOST', 'localhost')}:{_config.get('FLASK_PORT', '5000')}"
+workers = _config.get_int('API_WORKERS', os.cpu_count() or 2)
+worker_class = 'gthread'
+threads = _config.get_int('API_THREADS', 4)
+
+# Graceful recycling: a worker finishes in-flight requests and is replaced
+# after max_requests (+ jitter, so workers don't all restart together)
+max_requests = _config.get_int('API_MAX_REQUESTS', 10000)
+max_requests_jitter = _config.get_int('API_MAX_REQUESTS_JITTER', max(1, max_requests // 10))
+graceful_timeout = _config.get_int('API_GRACEFUL_TIMEOUT', 30)
+timeout = _config.get_int('API_WORKER_TIMEOUT', 60)
+
+# Never open DB connections in the master; each worker builds its own pool
+preload_app = False
+
+accesslog = None
+errorlog = '-'
+
+health_interval = _config.get_float('API_HEALTH_INTERVAL', 2)
+health_dir = _config.get('API_HEALTH_DIR', '/tmp/demo-api-health')
+# Read by app.status_report() in the workers
+os.environ['DEMO_API_HEALTH_DIR'] = health_dir
+registry = HealthRegistry(health_dir, stale_after=health_interval * 5)
+
+
+def _every(interval, fn, name):
+    def loop():
+        stop = threading.Event()
+        while not stop.wait(interval):
+            try:
+                fn()
+            except Exception as e:
+                print(f"⚠️ {name} failed: {e}", file=sys.stderr)
+    threading.Thread(target=loop, name=name, daemon=True).start()
+
+
+def on_starting(server):
+    registry.reset()
+
+
+def when_ready(server):
+    master_pid = os.getpid()
+    _every(health_interval, lambda: registry.aggregate(master_pid, server.num_workers), 'health-aggregator')
+
+
+def post_worker_init(worker):
+    import app
+
+    started = time.time()
+    prober = app.get_health_prober()
+    app.get_known_usernames()
+
+    def beat():
+        registry.heartbeat(os.getpid(), {
+            'requests': worker.nr,
+            'max_requests': worker.max_requests,
+            'started': started,
+            'pool': app.get_repository().stats(),
+            'auth_cache': app.get_auth_cache().stats(),
+            'password_hashing': app.get_password_verifier().stats(),
+            'database': prober.result(),
+            'metrics': app.metrics.snapshot(),
+        })
+
+    beat()
+    _every(health_interval, beat, 'health-heartbeat')
+
+
+def worker_exit(server, worker):
+    registry.remove(worker.pid)
+
+
+def child_exit(server, worker):
+    registry.remove(worker.pid)
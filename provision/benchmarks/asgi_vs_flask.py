@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+ASGI vs Flask Benchmark
+Drives /authenticate on the threaded Flask server and the ASGI server with
+the same closed-loop load and reports requests/sec and latency percentiles
+
+Both servers are started as subprocesses against the database configured in
+DEMO_ENV_FILE (default /etc/demo/.venv) unless --flask-url / --asgi-url point
+at servers that are already running.
+
+Usage: python3 benchmarks/asgi_vs_flask.py --username demo_user --password demo123 \
+           [--concurrency 10,100,1000] [--duration 10]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from urllib.parse import urlsplit
+
+PROVISION_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+API_DIR = os.path.join(PROVISION_DIR, 'api')
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return float('nan')
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def read_response(reader):
+    """Read one HTTP/1.x response; returns (status, keep_alive)"""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("connection closed")
+    version, status = status_line.split(b' ', 2)[:2]
+    length = 0
+    keep_alive = version == b'HTTP/1.1'
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.partition(b':')
+        name = name.strip().lower()
+        if name == b'content-length':
+            length = int(value.strip())
+        elif name == b'connection':
+            keep_alive = value.strip().lower() == b'keep-alive'
+    await reader.readexactly(length)
+    return int(status), keep_alive
+
+
+async def client(host, port, request, deadline, latencies, codes):
+    """One closed-loop client: sends the next request as soon as the last one finishes"""
+    reader = writer = None
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            writer.write(request)
+            await writer.drain()
+            status, keep_alive = await read_response(reader)
+        except (ConnectionError, OSError, asyncio.IncompleteReadError, ValueError):
+            codes['error'] = codes.get('error', 0) + 1
+            if writer is not None:
+                writer.close()
+            reader = writer = None
+            await asyncio.sleep(0.01)
+            continue
+        latencies.append(time.perf_counter() - start)
+        codes[status] = codes.get(status, 0) + 1
+        if not keep_alive:
+            writer.close()
+            reader = writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def run_load(url, payload, concurrency, duration):
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    body = json.dumps(payload).encode()
+    request = (
+        f"POST /authenticate HTTP/1.1\r\nHost: {host}:{port}\r\n"
+        f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+        f"Connection: keep-alive\r\n\r\n"
+    ).encode() + body
+
+    latencies = []
+    codes = {}
+    started = time.perf_counter()
+    deadline = started + duration
+    await asyncio.gather(*(client(host, port, request, deadline, latencies, codes)
+                           for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'rps': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'codes': codes,
+    }
+
+
+def wait_for(url, timeout=15):
+    import urllib.request
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f"{url}/status", timeout=1).read()
+            return True
+        except Exception:
+            time.sleep(0.2)
+    return False
+
+
+def start_server(kind, port):
+    if kind == 'flask':
+        code = f"import app; app.app.run(host='127.0.0.1', port={port}, threaded=True)"
+        cmd = [sys.executable, '-c', code]
+    else:
+        cmd = [sys.executable, '-m', 'uvicorn', 'asgi_app:app',
+               '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning']
+    return subprocess.Popen(cmd, cwd=API_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--username', required=True)
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--concurrency', default='10,100,1000',
+                        help='comma-separated client counts (default: 10,100,1000)')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per run')
+    parser.add_argument('--flask-url', help='use an already running Flask server')
+    parser.add_argument('--asgi-url', help='use an already running ASGI server')
+    args = parser.parse_args()
+
+    processes = []
+    targets = {}
+    for kind, url, port in (('flask', args.flask_url, 5601), ('asgi', args.asgi_url, 5602)):
+        if not url:
+            processes.append(start_server(kind, port))
+            url = f"http://127.0.0.1:{port}"
+        if not wait_for(url):
+            print(f"❌ {kind} server at {url} did not come up")
+            for process in processes:
+                process.terminate()
+            sys.exit(1)
+        targets[kind] = url
+
+    payload = {'username': args.username, 'password': args.password}
+    levels = [int(level) for level in args.concurrency.split(',')]
+
+    try:
+        print(f"{'Server':<8} {'Clients':>8} {'Requests':>9} {'Req/s':>9} {'p50 ms':>8} {'p99 ms':>8}  Status codes")
+        print("-" * 80)
+        for concurrency in levels:
+            for kind, url in targets.items():
+                result = asyncio.run(run_load(url, payload, concurrency, args.duration))
+                codes = ', '.join(f"{code}: {count}" for code, count in sorted(result['codes'].items(), key=str))
+                print(f"{kind:<8} {concurrency:>8} {result['requests']:>9} {result['rps']:>9.1f} "
+                      f"{result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f}  {codes}")
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Backup/Restore Benchmark
+Wall-clock time to back up and restore a synthetic 1M-user database with
+lib/authcore/backup.py (parallel chunked dump, bulk load with deferred
+indexes) against the mysqldump | gzip / gunzip | mysql path it replaces
+
+Seeds bench_br_* users into the database configured in DEMO_ENV_FILE
+(default /etc/demo/.venv) and restores over its tables repeatedly - only
+run it against a scratch database (--scratch confirms that you are)
+
+Usage: python3 benchmarks/backup_restore.py --scratch [--users 1000000] \
+           [--workers 1,4] [--methods infile,insert] [--skip-legacy] [--keep DIR]
+"""
+
+import argparse
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+PROVISION_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(PROVISION_DIR, 'lib'))
+
+from authcore import backup
+from authcore import db
+from authcore.config import get_config
+
+PREFIX = 'bench_br_'
+BENCH_PASSWORD = hashlib.md5(b'bench').hexdigest()
+
+
+def seed(users):
+    conn = db.connect(autocommit=False)
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM users WHERE username LIKE %s", (PREFIX + '%',))
+    existing = cursor.fetchone()[0]
+    if existing < users:
+        print(f"🌱 Seeding {users - existing} bench users...")
+        today = date.today()
+        for start in range(existing, users, 10000):
+            batch = []
+            for n in range(start, min(users, start + 10000)):
+                expiry = None if n % 10 == 0 else today + timedelta(days=n % 800 - 400)
+                batch.append((f'{PREFIX}{n}', BENCH_PASSWORD, 'active' if n % 3 else 'inactive', expiry))
+            cursor.executemany(
+                "INSERT IGNORE INTO users (username, password, status, expiry) VALUES (%s, %s, %s, %s)", batch)
+            conn.commit()
+    cursor.close()
+    conn.close()
+
+
+def count_users():
+    conn = db.connect()
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM users")
+    rows = cursor.fetchone()[0]
+    cursor.close()
+    conn.close()
+    return rows
+
+
+def legacy(directory):
+    """mysqldump | gzip, then gunzip | mysql, as mysql_backup.sh and 03_mysql_setup.sh used to"""
+    settings = db.connection_settings(get_config())
+    env = dict(os.environ, MYSQL_PWD=settings['password'] or '')
+    login = ['-h', settings['host'], '-u', settings['user']]
+    path = os.path.join(directory, 'legacy.sql.gz')
+
+    started = time.perf_counter()
+    subprocess.run(f"mysqldump {' '.join(login)} {settings['database']} | gzip > {path}",
+                   shell=True, check=True, env=env)
+    dumped = time.perf_counter() - started
+
+    started = time.perf_counter()
+    subprocess.run(f"gunzip -c {path} | mysql {' '.join(login)} {settings['database']}",
+                   shell=True, check=True, env=env)
+    restored = time.perf_counter() - started
+    return dumped, restored, os.path.getsize(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scratch', action='store_true', help='confirm the configured database is disposable')
+    parser.add_argument('--users', type=int, default=1000000)
+    parser.add_argument('--workers', default='1,4', help='comma-separated worker counts')
+    parser.add_argument('--methods', default='infile,insert', help='restore load methods to time')
+    parser.add_argument('--skip-legacy', action='store_true', help="don't time mysqldump/mysql")
+    parser.add_argument('--keep', help='also leave the last backup in this directory')
+    args = parser.parse_args()
+    if not args.scratch:
+        parser.error("this benchmark replaces the database's tables; pass --scratch on a scratch database")
+
+    seed(args.users)
+    rows = count_users()
+    print(f"\n{'Run':<36} {'Backup s':>9} {'Restore s':>10} {'MiB':>8} {'Rows/s restore':>15}")
+    print("-" * 82)
+    work = tempfile.mkdtemp(prefix='bench-backup-')
+    try:
+        if not args.skip_legacy and shutil.which('mysqldump') and shutil.which('mysql'):
+            dumped, restored, size = legacy(work)
+            print(f"{'mysqldump | gzip / gunzip | mysql':<36} {dumped:>9.1f} {restored:>10.1f} "
+                  f"{size / 2 ** 20:>8.1f} {rows / restored:>15,.0f}")
+
+        for workers in (int(value) for value in args.workers.split(',')):
+            directory = os.path.join(work, f'backup-{workers}')
+            manifest = backup.backup(directory, workers=workers)
+            size = sum(chunk['bytes'] for table in manifest['tables'] for chunk in table['chunks'])
+            for method in args.methods.split(','):
+                summary = backup.restore(directory, workers=workers, method=method)
+                restored = summary['seconds']['total']
+                if count_users() != rows:
+                    raise SystemExit(f"❌ Row count mismatch after restore ({method}, {workers} workers)")
+                label = f"authcore.backup, {workers} workers, {summary['method']}"
+                print(f"{label:<36} {manifest['seconds']:>9.1f} {restored:>10.1f} "
+                      f"{size / 2 ** 20:>8.1f} {rows / restored:>15,.0f}")
+                print(f"{'':<4}load {summary['seconds']['load']:.1f}s, "
+                      f"indexes {summary['seconds']['indexes']:.1f}s")
+            if args.keep:
+                shutil.rmtree(args.keep, ignore_errors=True)
+                shutil.copytree(directory, args.keep)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Bulk Subscription Edit Benchmark
+Rows/sec for user_management.py --bulk at several batch sizes, against the
+one-UPDATE-and-commit-per-user path of the interactive editor
+
+Seeds bench_bulk_* users into the database configured in DEMO_ENV_FILE
+(default /etc/demo/.venv) and edits them - use a scratch database, not production
+
+Usage: python3 benchmarks/bulk_edit.py [--rows 100000] [--batches 100,1000,5000] \
+           [--single-rows 2000] [--cleanup]
+"""
+
+import argparse
+import hashlib
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+PROVISION_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(PROVISION_DIR, 'lib'))
+sys.path.insert(0, os.path.join(PROVISION_DIR, 'system_scripts', 'user_management_software'))
+
+from authcore import db
+from authcore import log as logs
+
+import user_management
+
+PREFIX = 'bench_bulk_'
+BENCH_PASSWORD = hashlib.md5(b'bench').hexdigest()
+
+
+def seed(rows):
+    """Insert missing bench users"""
+    conn = db.connect(autocommit=True)
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM users WHERE username LIKE %s", (PREFIX + '%',))
+    existing = cursor.fetchone()[0]
+    if existing < rows:
+        print(f"🌱 Seeding {rows - existing} bench users...")
+        for start in range(existing, rows, 5000):
+            batch = [(f'{PREFIX}{n}', BENCH_PASSWORD, 'inactive', None)
+                     for n in range(start, min(rows, start + 5000))]
+            cursor.executemany(
+                "INSERT IGNORE INTO users (username, password, status, expiry) VALUES (%s, %s, %s, %s)", batch)
+    cursor.close()
+    conn.close()
+
+
+def cleanup():
+    conn = db.connect(autocommit=True)
+    cursor = conn.cursor()
+    deleted = 0
+    while True:
+        cursor.execute("DELETE FROM users WHERE username LIKE %s LIMIT 5000", (PREFIX + '%',))
+        deleted += cursor.rowcount
+        if cursor.rowcount == 0:
+            break
+    cursor.close()
+    conn.close()
+    print(f"🧹 Removed {deleted} bench users")
+
+
+def edit_records(rows, round_no):
+    """A promotion: every bench user active with a new expiry (different each round, so every row changes)"""
+    expiry = (date.today() + timedelta(days=30 + round_no)).isoformat()
+    for n in range(rows):
+        yield n + 1, {'username': f'{PREFIX}{n}', 'status': 'active', 'expiry': expiry}
+
+
+def run_bulk(rows, batch_size, round_no):
+    connection = db.connect(autocommit=False)
+    summary = user_management.apply_bulk_edits(
+        connection, edit_records(rows, round_no), batch_size=batch_size, progress=False)
+    connection.close()
+    return summary
+
+
+def run_single_rows(rows, round_no):
+    """The interactive editor's path: look the user up, one UPDATE and commit per user"""
+    connection = db.connect(autocommit=False)
+    cursor = connection.cursor()
+    expiry = date.today() + timedelta(days=30 + round_no)
+    started = time.perf_counter()
+    for n in range(rows):
+        cursor.execute("SELECT id FROM users WHERE username = %s", (f'{PREFIX}{n}',))
+        user_id = cursor.fetchone()[0]
+        user_management.update_user_subscription(connection, user_id, 'active', expiry)
+    elapsed = time.perf_counter() - started
+    cursor.close()
+    connection.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000, help='bench users to edit')
+    parser.add_argument('--batches', default='100,1000,5000',
+                        help='comma-separated bulk batch sizes (edits per transaction)')
+    parser.add_argument('--single-rows', type=int, default=2000,
+                        help='users edited one at a time for the baseline (0 = skip)')
+    parser.add_argument('--cleanup', action='store_true', help='delete the bench users afterwards')
+    args = parser.parse_args()
+
+    # Keep per-edit log lines out of the results table
+    logs.setup_logging('WARNING', stream=sys.stderr)
+    seed(args.rows)
+
+    print(f"{'Mode':<24} {'Rows':>8} {'Seconds':>9} {'Rows/s':>10}")
+    print("-" * 54)
+    round_no = 0
+    try:
+        if args.single_rows:
+            round_no += 1
+            rows = min(args.single_rows, args.rows)
+            elapsed = run_single_rows(rows, round_no)
+            print(f"{'one row per commit':<24} {rows:>8} {elapsed:>9.2f} {rows / elapsed:>10,.0f}")
+        for batch_size in (int(value) for value in args.batches.split(',')):
+            round_no += 1
+            summary = run_bulk(args.rows, batch_size, round_no)
+            status = '' if summary['changed'] == args.rows else f"  ({summary['changed']} changed)"
+            print(f"{f'bulk, batch {batch_size}':<24} {args.rows:>8} {summary['seconds']:>9.2f} "
+                  f"{args.rows / summary['seconds']:>10,.0f}{status}")
+    finally:
+        if args.cleanup:
+            cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Index Migration Benchmark
+Query plans (EXPLAIN) and timings of the API's auth lookups and the
+subscription updater's queries with the original index set, then again after
+migration 1 (lib/authcore/migrations.py) has been applied
+
+Seeds bench_idx_* users into the database configured in DEMO_ENV_FILE
+(default /etc/demo/.venv) and rebuilds indexes on the users table - use a
+scratch database, not production
+
+Usage: python3 benchmarks/index_migration.py [--rows 200000] [--repeat 200] \
+           [--output plans.json] [--cleanup]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+PROVISION_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(PROVISION_DIR, 'lib'))
+
+from authcore import db
+from authcore import migrations
+
+PREFIX = 'bench_idx_'
+BENCH_PASSWORD = hashlib.md5(b'bench').hexdigest()
+TODAY = date.today()
+
+
+def seed(rows):
+    """Insert missing bench users: a mix of lifetime, active, lapsed and inactive subscriptions"""
+    conn = db.connect(autocommit=True)
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM users WHERE username LIKE %s", (PREFIX + '%',))
+    existing = cursor.fetchone()[0]
+    if existing < rows:
+        print(f"🌱 Seeding {rows - existing} bench users...")
+        rng = random.Random(1)
+        for start in range(existing, rows, 5000):
+            batch = []
+            for n in range(start, min(rows, start + 5000)):
+                kind = n % 10
+                expiry = None if kind == 0 else TODAY + timedelta(days=rng.randint(-400, 400))
+                status = 'active' if kind < 7 else 'inactive'
+                batch.append((f'{PREFIX}{n}', BENCH_PASSWORD, status, expiry))
+            cursor.executemany(
+                "INSERT IGNORE INTO users (username, password, status, expiry) VALUES (%s, %s, %s, %s)", batch)
+    cursor.close()
+    conn.close()
+
+
+def cleanup():
+    conn = db.connect(autocommit=True)
+    cursor = conn.cursor()
+    deleted = 0
+    while True:
+        cursor.execute("DELETE FROM users WHERE username LIKE %s LIMIT 5000", (PREFIX + '%',))
+        deleted += cursor.rowcount
+        if cursor.rowcount == 0:
+            break
+    cursor.close()
+    conn.close()
+    print(f"🧹 Removed {deleted} bench users")
+
+
+def restore_original_indexes(cursor):
+    """Put back the index set 03_mysql_setup.sh used to create, and forget migration 1"""
+    for name in ('idx_status_expiry', 'idx_auth_lookup'):
+        migrations.drop_index(cursor, 'users', name)
+    for name, column in (('idx_username', 'username'), ('idx_status', 'status'), ('idx_expiry', 'expiry')):
+        migrations.add_index(cursor, 'users', name, (column,))
+    migrations.ensure_migrations_table(cursor)
+    cursor.execute("DELETE FROM schema_migrations WHERE version = 1")
+    cursor.execute("ANALYZE TABLE users")
+    cursor.fetchall()
+
+
+def queries(rows):
+    """(label, SQL to EXPLAIN, SQL to time, params) for the statements the API and updater run"""
+    rng = random.Random(2)
+    names = lambda count: tuple(f'{PREFIX}{rng.randrange(rows)}' for _ in range(count))
+    auth = """
+        SELECT id, username, password, status, expiry, updated_at
+        FROM users
+        WHERE username IN ({})
+    """
+    result = [
+        ('auth lookup (1 user)', auth.format('%s'), None, lambda: names(1)),
+        ('auth lookup (20 users)', auth.format(', '.join(['%s'] * 20)), None, lambda: names(20)),
+    ]
+    # The updater's UPDATE statements are EXPLAINed as written and timed as
+    # the equivalent COUNT(*), so the benchmark never changes any rows
+    for name, new_status, condition, uses_date in (
+            ('expire', 'inactive', "status = 'active' AND expiry IS NOT NULL AND expiry < %s", True),
+            ('reactivate', 'active', "status = 'inactive' AND expiry IS NOT NULL AND expiry >= %s", True),
+            ('lifetime', 'active', "status = 'inactive' AND expiry IS NULL", False)):
+        params = (TODAY,) if uses_date else ()
+        result.append((f'updater {name} (whole table)',
+                       f"UPDATE users SET status = '{new_status}' WHERE {condition}",
+                       f"SELECT COUNT(*) FROM users WHERE {condition}",
+                       lambda params=params: params))
+    result.append(('updater incremental expiry', """
+        SELECT id
+        FROM users
+        WHERE expiry >= %s AND expiry < %s
+        AND status = 'active'
+    """, None, lambda: (TODAY - timedelta(days=3), TODAY)))
+    return result
+
+
+def explain(cursor, sql, params):
+    cursor.execute("EXPLAIN " + sql, params)
+    columns = [d[0] for d in cursor.description]
+    return [{key: row[columns.index(key)] for key in ('table', 'type', 'key', 'rows', 'Extra') if key in columns}
+            for row in cursor.fetchall()]
+
+
+def time_query(cursor, sql, make_params, repeat):
+    timings = []
+    for _ in range(repeat):
+        params = make_params()
+        started = time.perf_counter()
+        cursor.execute(sql, params)
+        cursor.fetchall()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return {
+        'p50_ms': round(timings[len(timings) // 2] * 1000, 3),
+        'p99_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1000, 3),
+    }
+
+
+def time_writes(cursor, rows, repeat):
+    """Single-row status/expiry updates like login.php's renewal (every index on those columns is maintained)"""
+    rng = random.Random(3)
+    timings = []
+    for _ in range(repeat):
+        username = f'{PREFIX}{rng.randrange(rows)}'
+        started = time.perf_counter()
+        cursor.execute("UPDATE users SET status = IF(status = 'active', 'inactive', 'active'), "
+                       "expiry = expiry + INTERVAL 1 DAY WHERE username = %s", (username,))
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return {
+        'p50_ms': round(timings[len(timings) // 2] * 1000, 3),
+        'p99_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1000, 3),
+    }
+
+
+def measure(cursor, label, rows, repeat):
+    print(f"\n📐 {label}")
+    results = []
+    for name, explain_sql, timed_sql, make_params in queries(rows):
+        plan = explain(cursor, explain_sql, make_params())
+        # Whole-table queries are slow by nature; a tenth of the repetitions is plenty
+        runs = repeat if timed_sql is None else max(repeat // 10, 5)
+        timing = time_query(cursor, timed_sql or explain_sql, make_params, runs)
+        results.append({'query': name, 'plan': plan, **timing})
+        keys = ', '.join(f"{step['type']}:{step['key']}" for step in plan)
+        extra = '; '.join(str(step.get('Extra') or '') for step in plan)
+        print(f"  {name:<32} {timing['p50_ms']:>9.3f} {timing['p99_ms']:>9.3f}  {keys}  {extra}")
+    writes = time_writes(cursor, rows, repeat)
+    results.append({'query': 'single-row status/expiry update', 'plan': None, **writes})
+    print(f"  {'single-row status/expiry update':<32} {writes['p50_ms']:>9.3f} {writes['p99_ms']:>9.3f}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200000, help='bench users to seed')
+    parser.add_argument('--repeat', type=int, default=200, help='timed runs per point query')
+    parser.add_argument('--output', help='write plans and timings as JSON')
+    parser.add_argument('--cleanup', action='store_true', help='delete the bench users afterwards')
+    args = parser.parse_args()
+
+    seed(args.rows)
+    conn = db.connect(autocommit=True)
+    cursor = conn.cursor()
+    print(f"{'':<34} {'p50 ms':>9} {'p99 ms':>9}  plan (type:key)  extra")
+    try:
+        restore_original_indexes(cursor)
+        before = measure(cursor, 'Original indexes (idx_username, idx_status, idx_expiry)', args.rows, args.repeat)
+
+        for version, description, actions in migrations.migrate(conn):
+            print(f"\n✅ Applied migration {version}: {'; '.join(actions)}")
+        cursor.execute("ANALYZE TABLE users")
+        cursor.fetchall()
+        after = measure(cursor, 'After migrations', args.rows, args.repeat)
+    finally:
+        cursor.close()
+        conn.close()
+        if args.cleanup:
+            cleanup()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'rows': args.rows, 'before': before, 'after': after}, f, indent=2, default=str)
+        print(f"\n📝 Wrote plans and timings to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
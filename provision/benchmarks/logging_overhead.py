@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Logging Overhead Benchmark
+Per-request cost of the log output of a successful /authenticate call:
+the former synchronous print() sequence versus authcore's queue-backed logger
+
+Usage: python3 benchmarks/logging_overhead.py [--requests 20000]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import subprocess
+import sys
+import time
+from datetime import date
+
+PROVISION_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(PROVISION_DIR, 'lib'))
+
+from authcore import log as logs
+
+USERNAME = 'john_doe'
+STORED = '482c811da5d5b4bc6d497ffa98491e38'
+EXPIRY = date(2030, 1, 1)
+
+
+def print_request():
+    """The print() calls a successful authenticate() used to make"""
+    today = date.today()
+    print(f"🔍 Received authentication request for user: {USERNAME}")
+    print(f"🔍 Password comparison:")
+    print(f"   Database MD5: '{STORED}'")
+    print(f"   Provided MD5: '{STORED}'")
+    print(f"   Match: {STORED == STORED}")
+    print(f"✅ MD5 password verified for user '{USERNAME}'")
+    print(f"🔍 User '{USERNAME}' expiry: {EXPIRY} (type: {type(EXPIRY)})")
+    print(f"🔍 Today: {today} (type: {type(today)})")
+    print(f"🔍 Subscription active: {EXPIRY >= today}")
+    print(f"🎉 Authentication successful for '{USERNAME}' - Active subscription")
+
+
+def logger_request(log):
+    """The log calls a successful authenticate() makes now"""
+    today = date.today()
+    log.debug("Authentication request received", user=USERNAME)
+    log.debug("Password verified", user=USERNAME)
+    log.debug("Subscription expiry checked", user=USERNAME, expiry=EXPIRY, today=today, active=EXPIRY >= today)
+    log.info("Authentication successful", user=USERNAME, result=200)
+
+
+def measure(fn, requests):
+    start = time.perf_counter()
+    for _ in range(requests):
+        fn()
+    return (time.perf_counter() - start) / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=20000)
+    args = parser.parse_args()
+
+    # Like the API under screen/systemd: line-buffered stdout into a pipe
+    reader = subprocess.Popen(['cat'], stdin=subprocess.PIPE, stdout=subprocess.DEVNULL)
+    results = []
+    with io.TextIOWrapper(reader.stdin, line_buffering=True) as sink:
+        with contextlib.redirect_stdout(sink):
+            results.append(('print() x10 (before)', measure(print_request, args.requests)))
+
+        log = logs.get_logger('api')
+        for label, level, rate in (('logger, INFO', 'INFO', 1.0),
+                                   ('logger, DEBUG sampled 1%', 'DEBUG', 0.01),
+                                   ('logger, DEBUG (all records)', 'DEBUG', 1.0)):
+            logs.setup_logging(level, debug_sample_rate=rate, stream=sink, queue_size=args.requests * 4)
+            cost = measure(lambda: logger_request(log), args.requests)
+            logs.flush(timeout=60)
+            results.append((label, cost))
+        logs.setup_logging(stream=sys.stderr)
+    reader.wait()
+
+    print(f"📝 Log overhead per successful /authenticate ({args.requests} requests)")
+    print(f"{'Mode':<32} {'µs/request':>12}")
+    print("-" * 46)
+    for label, cost in results:
+        print(f"{label:<32} {cost * 1e6:>12.2f}")
+
+
+if __name__ == '__main__':
+    main()
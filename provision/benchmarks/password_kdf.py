@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Password KDF Calibration
+Finds the cost factor (PBKDF2 iterations or scrypt n) whose single verify
+takes about --target-ms on this machine, then measures verifies/sec with
+the API's hashing pool at 1 thread and at every available core
+
+Put the suggested value into PASSWORD_PBKDF2_ITERATIONS / PASSWORD_SCRYPT_N
+in /etc/demo/.venv; existing users are upgraded on their next login.
+No database needed.
+
+Usage: python3 benchmarks/password_kdf.py [--algorithm pbkdf2_sha256|scrypt] \
+           [--target-ms 50] [--seconds 3] [--output calibration.json]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+PROVISION_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(PROVISION_DIR, 'lib'))
+
+from authcore.passwords import PasswordHasher, VerifierPool, available_cores
+
+PASSWORD = 'correct horse battery staple'
+
+
+def make_hasher(algorithm, cost):
+    if algorithm == 'scrypt':
+        return PasswordHasher('scrypt', scrypt_n=cost)
+    return PasswordHasher('pbkdf2_sha256', pbkdf2_iterations=cost)
+
+
+def verify_ms(hasher, encoded, repeat=5):
+    """Median single-thread verify time"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        hasher.verify(PASSWORD, encoded)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return timings[len(timings) // 2] * 1000
+
+
+def calibrate(algorithm, target_ms):
+    """Double the cost until a verify takes target_ms; PBKDF2 is then scaled linearly between steps"""
+    cost = 10000 if algorithm == 'pbkdf2_sha256' else 2 ** 10
+    while True:
+        hasher = make_hasher(algorithm, cost)
+        elapsed = verify_ms(hasher, hasher.hash(PASSWORD))
+        print(f"  {algorithm} cost {cost:>10}: {elapsed:8.2f} ms")
+        if elapsed >= target_ms:
+            break
+        cost *= 2
+    if algorithm == 'pbkdf2_sha256':
+        # Time is linear in iterations; round to a readable number
+        cost = max(10000, int(round(cost * target_ms / elapsed, -3)))
+    elif elapsed > target_ms * 1.5 and cost > 2 ** 10:
+        # scrypt n must be a power of two: take the one closest to the target
+        cost //= 2
+    return cost
+
+
+def throughput(hasher, workers, seconds):
+    """Verifies/sec through a VerifierPool of `workers` threads kept full for `seconds`"""
+    pool = VerifierPool(hasher, workers=workers, max_pending=workers * 4)
+    encoded = hasher.hash(PASSWORD)
+    done = 0
+    pending = []
+    started = time.perf_counter()
+    deadline = started + seconds
+    while time.perf_counter() < deadline:
+        while len(pending) < workers * 2:
+            pending.append(pool.verify_async(PASSWORD, encoded))
+        pending.pop(0).result()
+        done += 1
+    for future in pending:
+        future.result()
+        done += 1
+    return done / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--algorithm', choices=('pbkdf2_sha256', 'scrypt'), default='pbkdf2_sha256')
+    parser.add_argument('--target-ms', type=float, default=50, help='target single verify latency')
+    parser.add_argument('--seconds', type=float, default=3, help='duration of each throughput run')
+    parser.add_argument('--output', help='write the results as JSON')
+    args = parser.parse_args()
+
+    cores = available_cores()
+    print(f"🔧 Calibrating {args.algorithm} for ~{args.target_ms:g} ms per verify ({cores} cores)")
+    cost = calibrate(args.algorithm, args.target_ms)
+    hasher = make_hasher(args.algorithm, cost)
+    latency = verify_ms(hasher, hasher.hash(PASSWORD), repeat=9)
+
+    print(f"\n{'Threads':>8} {'Verifies/s':>12} {'Per core':>10}")
+    print("-" * 32)
+    runs = []
+    for workers in sorted({1, cores}):
+        rate = throughput(hasher, workers, args.seconds)
+        runs.append({'threads': workers, 'verifies_per_sec': round(rate, 1),
+                     'per_core': round(rate / min(workers, cores), 1)})
+        print(f"{workers:>8} {rate:>12.1f} {rate / min(workers, cores):>10.1f}")
+
+    key = 'PASSWORD_PBKDF2_ITERATIONS' if args.algorithm == 'pbkdf2_sha256' else 'PASSWORD_SCRYPT_N'
+    print(f"\n✅ {key}={cost}  ({latency:.1f} ms per verify, "
+          f"~{runs[-1]['verifies_per_sec']:.0f} logins/sec on this machine)")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'algorithm': args.algorithm, 'cost': cost, 'target_ms': args.target_ms,
+                       'verify_ms': round(latency, 2), 'cores': cores, 'throughput': runs}, f, indent=2)
+        print(f"📝 Wrote calibration to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
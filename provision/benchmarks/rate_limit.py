@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Rate Limiter Overhead Benchmark
+Cost of one limiter decision for the in-process and shared (memory-mapped)
+backends of lib/authcore/ratelimit.py, with few hot keys and with a key
+space far larger than the table (constant eviction), from 1 and N threads
+
+No database needed; the shared table is created in a temporary directory.
+
+Usage: python3 benchmarks/rate_limit.py [--ops 200000] [--threads 4] [--keys 100000]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+PROVISION_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(PROVISION_DIR, 'lib'))
+
+from authcore.ratelimit import SharedTokenBucketLimiter, TokenBucketLimiter
+
+
+def run(limiter, keys, ops, threads):
+    """Microseconds per acquire() with `threads` threads sharing the limiter"""
+    names = [f'10.{n // 65536 % 256}.{n // 256 % 256}.{n % 256}' for n in range(keys)]
+    per_thread = ops // threads
+
+    def work(offset):
+        for i in range(per_thread):
+            limiter.acquire(names[(i * 7919 + offset) % len(names)])
+
+    workers = [threading.Thread(target=work, args=(n * 104729,)) for n in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return (time.perf_counter() - started) / (per_thread * threads) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--ops', type=int, default=200000, help='decisions per run')
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--keys', type=int, default=100000, help='distinct keys in the churn runs')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"{'Backend':<10} {'Keys':>8} {'Threads':>8} {'us/decision':>12}")
+        print("-" * 42)
+        for keys in (100, args.keys):
+            for threads in sorted({1, args.threads}):
+                for name in ('memory', 'shared'):
+                    # Table much smaller than the churn key space, so evictions are exercised
+                    if name == 'memory':
+                        limiter = TokenBucketLimiter(20, 100, max_keys=10000)
+                    else:
+                        limiter = SharedTokenBucketLimiter(20, 100, os.path.join(directory, f'rl-{keys}-{threads}'),
+                                                           slots=10000)
+                    micros = run(limiter, keys, args.ops, threads)
+                    print(f"{name:<10} {keys:>8} {threads:>8} {micros:>12.2f}")
+
+
+if __name__ == '__main__':
+    main()
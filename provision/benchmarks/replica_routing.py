@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Replica Routing Benchmark
+Latency of the API's user lookup (UserRepository.find_users on a pooled
+connection, as fetch_users() does on a cache miss) on the primary alone and
+routed to the replicas in DB_REPLICAS by each strategy, from several
+threads, and how the reads spread over the databases. --pause-replication
+then stops each replica's SQL thread in turn and times how long the router
+takes to eject it and, once replication resumes, to readmit it.
+
+Uses the databases configured in DEMO_ENV_FILE (default /etc/demo/.venv);
+two local instances are enough, e.g. a primary on 3306 and its replica on
+3307 with DB_REPLICAS=127.0.0.1:3307. Only reads, apart from the heartbeat
+and, with --pause-replication, STOP/START REPLICA SQL_THREAD on the replicas.
+
+Usage: python3 benchmarks/replica_routing.py [--lookups 20000] [--threads 8] \
+           [--strategies round_robin,least_in_flight] [--pause-replication]
+"""
+
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+PROVISION_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(PROVISION_DIR, 'lib'))
+
+from authcore import db
+from authcore import replicas
+from authcore import storage
+from authcore.config import get_config
+
+
+def sample_usernames(repository, count):
+    conn = repository.acquire()
+    cursor = conn.cursor()
+    cursor.execute("SELECT username FROM users ORDER BY id LIMIT %s", (count * 10,))
+    names = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    conn.close()
+    return random.sample(names, min(count, len(names)))
+
+
+def run(repository, names, lookups, threads, routed):
+    """Lookup timings in microseconds and reads per database, from `threads` threads"""
+    timings = []
+    targets = Counter()
+    lock = threading.Lock()
+
+    def worker(count):
+        local_timings = []
+        local_targets = Counter()
+        for _ in range(count):
+            started = time.perf_counter()
+            conn = (repository.acquire_replica(background=True) if routed else None) or repository.acquire()
+            repository.find_users(conn, [random.choice(names)])
+            local_targets[getattr(conn, 'replica', None) or 'primary'] += 1
+            conn.close()
+            local_timings.append((time.perf_counter() - started) * 1e6)
+        with lock:
+            timings.extend(local_timings)
+            targets.update(local_targets)
+
+    workers = [threading.Thread(target=worker, args=(lookups // threads,)) for _ in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    timings.sort()
+    return timings, targets, elapsed
+
+
+def report(label, timings, targets, elapsed):
+    p50 = timings[len(timings) // 2]
+    p99 = timings[int(len(timings) * 0.99)]
+    total = sum(targets.values())
+    share = ', '.join(f"{name} {count / total:.0%}" for name, count in sorted(targets.items()))
+    print(f"{label:<24} {p50:>9.1f} {p99:>9.1f} {len(timings) / elapsed:>12,.0f}   {share}")
+
+
+def replication_sql(conn, action):
+    """STOP or START the replica's SQL thread (REPLICA syntax first, SLAVE on older servers)"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"{action} REPLICA SQL_THREAD")
+    except db.Error:
+        cursor.execute(f"{action} SLAVE SQL_THREAD")
+    cursor.close()
+
+
+def wait_for(router, name, in_rotation, timeout):
+    """Seconds until the replica's rotation state becomes in_rotation, or None after timeout"""
+    started = time.monotonic()
+    while time.monotonic() - started < timeout:
+        if router.stats()['replicas'][name]['in_rotation'] == in_rotation:
+            return time.monotonic() - started
+        time.sleep(0.05)
+    return None
+
+
+def seconds(value):
+    return 'never' if value is None else f"{value:.2f}s"
+
+
+def pause_replication(router):
+    timeout = router.max_staleness * 4 + 10
+    print(f"\n⏸️  Pausing replication (max lag {router.max_lag}s, checks every {router.check_interval}s)")
+    for name in router.stats()['replicas']:
+        if wait_for(router, name, True, timeout) is None:
+            print(f"   {name}: not in rotation to begin with, skipped")
+            continue
+        conn = router.connection(name)
+        try:
+            replication_sql(conn, 'STOP')
+            ejected = wait_for(router, name, False, timeout)
+        finally:
+            replication_sql(conn, 'START')
+        readmitted = wait_for(router, name, True, timeout)
+        conn.close()
+        print(f"   {name}: ejected {seconds(ejected)} after STOP, readmitted {seconds(readmitted)} after START")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--lookups', type=int, default=20000, help='lookups timed per case')
+    parser.add_argument('--threads', type=int, default=8, help='concurrent lookup threads')
+    parser.add_argument('--strategies', default='round_robin,least_in_flight', help='routing strategies to time')
+    parser.add_argument('--pause-replication', action='store_true',
+                        help='stop and restart each replica\'s SQL thread to time ejection and readmission')
+    args = parser.parse_args()
+
+    repository = storage.MySQLRepository(get_config())
+    router = repository.replicas
+    if router is None:
+        parser.error("no replicas configured: set DB_REPLICAS in the .venv file")
+    print(f"🗄️ {repository.describe()}")
+    names = sample_usernames(repository, 10000)
+
+    print(f"\n{'Lookup':<24} {'p50 us':>9} {'p99 us':>9} {'lookups/s':>12}   Reads")
+    print("-" * 80)
+    report('primary only', *run(repository, names, args.lookups, args.threads, routed=False))
+    for strategy in args.strategies.split(','):
+        if strategy not in replicas.STRATEGIES:
+            parser.error(f"unknown strategy {strategy!r} (one of {', '.join(replicas.STRATEGIES)})")
+        router.strategy = strategy
+        report(strategy, *run(repository, names, args.lookups, args.threads, routed=True))
+
+    if args.pause_replication:
+        pause_replication(router)
+    router.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Stand-in Authentication Server
+Serves /authenticate and /status with the same request/response contract as
+api/app.py, backed by an in-memory SQLite users table, so the client
+benchmark can run in CI without MySQL or the real API deployment
+
+Usage: python3 benchmarks/standin_server.py [--port 5700] [--users 1000] [--expired 100] \
+           [--db-latency-ms 0] [--write-credentials creds.csv]
+Then:  python3 system_scripts/software_client.py --api-url http://127.0.0.1:5700 \
+           --benchmark creds.csv --duration 10
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import sqlite3
+import sys
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def md5_hash(password):
+    return hashlib.md5(password.encode()).hexdigest()
+
+
+class UserStore:
+    """In-memory users table shaped like the MySQL one"""
+
+    def __init__(self, active, expired, db_latency=0.0):
+        self.db_latency = db_latency
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(':memory:', check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT UNIQUE NOT NULL,
+                password TEXT NOT NULL,
+                status TEXT DEFAULT 'inactive',
+                expiry TEXT NULL
+            )
+        """)
+        self.credentials = []
+        rows = []
+        today = date.today()
+        for n in range(active):
+            username, password = f'bench_user_{n}', f'pass_{n}'
+            expiry = None if n % 4 == 0 else str(today + timedelta(days=30 + n % 300))
+            rows.append((username, md5_hash(password), 'active', expiry))
+            self.credentials.append((username, password, 'valid'))
+        for n in range(expired):
+            username, password = f'bench_expired_{n}', f'pass_{n}'
+            rows.append((username, md5_hash(password), 'inactive', str(today - timedelta(days=1 + n % 60))))
+            self.credentials.append((username, password, 'expired'))
+        self.conn.executemany(
+            "INSERT INTO users (username, password, status, expiry) VALUES (?, ?, ?, ?)", rows)
+        self.conn.commit()
+
+    def find(self, username):
+        if self.db_latency:
+            time.sleep(self.db_latency)
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT id, username, password, status, expiry FROM users WHERE username = ?",
+                (username,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('id', 'username', 'password', 'status', 'expiry'), row))
+
+
+def authenticate(store, data):
+    """Same status codes and bodies as app.authenticate_request()"""
+    if not isinstance(data, dict) or not data:
+        return {'success': False, 'message': 'No JSON data received'}, 400
+    username = data.get('username')
+    password = data.get('password')
+    if not isinstance(username, str) or not isinstance(password, str):
+        return {'success': False, 'message': 'Username and password required'}, 400
+    username, password = username.strip(), password.strip()
+    if not username or not password:
+        return {'success': False, 'message': 'Username and password cannot be empty'}, 400
+
+    user = store.find(username)
+    if not user or user['password'] != md5_hash(password):
+        return {'success': False, 'message': 'Invalid username or password'}, 401
+
+    active = user['status'] == 'active' and (
+        user['expiry'] is None or date.fromisoformat(user['expiry']) >= date.today())
+    body = {
+        'success': active,
+        'message': 'Authentication successful - Active subscription' if active else 'Subscription inactive or expired',
+        'user': {
+            'id': user['id'],
+            'username': user['username'],
+            'status': user['status'],
+            'expiry': user['expiry']
+        },
+        'subscription_active': active
+    }
+    return body, 200 if active else 403
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 drops SYNs under benchmark concurrency (1s+ retransmits)
+    request_queue_size = 128
+
+
+def make_handler(store):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # Headers and body are written separately; without this, delayed ACKs add ~40ms per request
+        disable_nagle_algorithm = True
+
+        def send_json(self, data, status_code):
+            payload = json.dumps(data).encode()
+            self.send_response(status_code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            if self.path == '/status':
+                self.send_json({'status': 'online', 'database': 'connected',
+                                'message': 'Stand-in authentication server'}, 200)
+            else:
+                self.send_json({'success': False, 'message': 'Not found'}, 404)
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            if self.path != '/authenticate':
+                self.send_json({'success': False, 'message': 'Not found'}, 404)
+                return
+            try:
+                data = json.loads(body) if body else None
+            except ValueError:
+                data = None
+            self.send_json(*authenticate(store, data))
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5700)
+    parser.add_argument('--users', type=int, default=1000, help='active users to create')
+    parser.add_argument('--expired', type=int, default=100, help='expired users to create')
+    parser.add_argument('--db-latency-ms', type=float, default=0,
+                        help='simulated database round trip per lookup')
+    parser.add_argument('--write-credentials', metavar='PATH',
+                        help='write a credential CSV for software_client.py --benchmark')
+    args = parser.parse_args()
+
+    store = UserStore(args.users, args.expired, args.db_latency_ms / 1000)
+    if args.write_credentials:
+        with open(args.write_credentials, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['username', 'password', 'kind'])
+            writer.writerows(store.credentials)
+        print(f"📝 Wrote {len(store.credentials)} credentials to {args.write_credentials}")
+
+    server = StandInServer((args.host, args.port), make_handler(store))
+    print(f"🚀 Stand-in auth server on http://{args.host}:{server.server_port} "
+          f"({args.users} active, {args.expired} expired users)")
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
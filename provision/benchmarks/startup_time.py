@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Startup Time Benchmark
+Measures cold-start cost of the cron job, the admin CLI and the API module,
+plus the cost of reading configuration through authcore
+
+Usage: python3 benchmarks/startup_time.py [--runs 20] [--env-file PATH]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+PROVISION_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LIB_DIR = os.path.join(PROVISION_DIR, 'lib')
+
+# name -> (directory to put on sys.path, module to import)
+TARGETS = {
+    'python (baseline)': (None, None),
+    'subscription_updater': (os.path.join(PROVISION_DIR, 'system_scripts', 'subscription_updater'), 'subscription_updater'),
+    'user_management': (os.path.join(PROVISION_DIR, 'system_scripts', 'user_management_software'), 'user_management'),
+    'api app': (os.path.join(PROVISION_DIR, 'api'), 'app'),
+    'mysql.connector (reference)': (None, 'mysql.connector'),
+}
+
+
+def time_import(directory, module, runs, env):
+    """Wall-clock seconds for `python -c "import module"` over several fresh interpreters"""
+    code = 'pass'
+    if module:
+        code = f'import sys; sys.path.insert(0, {directory!r}); import {module}' if directory else f'import {module}'
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, '-c', code], env=env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        samples.append(time.perf_counter() - start)
+        if result.returncode != 0:
+            return None, result.stderr.decode(errors='replace').strip().splitlines()[-1]
+    return samples, None
+
+
+def bench_config(env_file, iterations):
+    """Per-call cost of parsing the .venv file versus the cached EnvConfig"""
+    sys.path.insert(0, LIB_DIR)
+    from authcore.config import EnvConfig, parse_env_file
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        parse_env_file(env_file)
+    parse_cost = (time.perf_counter() - start) / iterations
+
+    config = EnvConfig(env_file)
+    config.values()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        config.values()
+    cached_cost = (time.perf_counter() - start) / iterations
+
+    return parse_cost, cached_cost
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=20, help='interpreter launches per target')
+    parser.add_argument('--env-file', help='.venv file to benchmark (default: provision/config/.venv)')
+    args = parser.parse_args()
+
+    env_file = args.env_file or os.path.join(PROVISION_DIR, 'config', '.venv')
+    env = dict(os.environ, DEMO_ENV_FILE=env_file, DEMO_LIB_PATH=LIB_DIR)
+
+    print(f"⏱️  Cold-start import time ({args.runs} runs each)")
+    print(f"{'Target':<30} {'min ms':>8} {'median ms':>10} {'max ms':>8}")
+    print("-" * 60)
+    for name, (directory, module) in TARGETS.items():
+        samples, error = time_import(directory, module, args.runs, env)
+        if samples is None:
+            print(f"{name:<30} skipped ({error})")
+            continue
+        print(f"{name:<30} {min(samples) * 1000:>8.1f} {statistics.median(samples) * 1000:>10.1f} "
+              f"{max(samples) * 1000:>8.1f}")
+
+    if not os.path.exists(env_file):
+        # Fall back to a throwaway file so the config numbers are still comparable
+        with tempfile.NamedTemporaryFile('w', suffix='.venv', delete=False) as f:
+            f.write("DB_HOST=localhost\nDB_NAME=auth_server\nDB_USER=admin\nDB_PASS=secret\n")
+            env_file = f.name
+
+    parse_cost, cached_cost = bench_config(env_file, 20000)
+    print()
+    print("📁 Configuration access (per call)")
+    print(f"   parse .venv file:   {parse_cost * 1e6:8.2f} µs")
+    print(f"   cached EnvConfig:   {cached_cost * 1e6:8.2f} µs")
+
+
+if __name__ == '__main__':
+    main()
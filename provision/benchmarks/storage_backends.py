@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Storage Backend Benchmark
+Latency of the API's user lookup (UserRepository.find_users on a pooled
+connection, as fetch_users() does on a cache miss) against a read-only
+SQLite copy, and optionally against the configured MySQL database
+
+Builds a synthetic SQLite database in a temporary directory (or reuses
+--sqlite PATH); --mysql samples usernames from the database configured in
+DEMO_ENV_FILE (default /etc/demo/.venv) and only reads from it.
+
+Usage: python3 benchmarks/storage_backends.py [--users 1000000] [--lookups 20000] \
+           [--batch 100] [--sqlite PATH] [--mysql]
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+PROVISION_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(PROVISION_DIR, 'lib'))
+
+from authcore import storage
+from authcore.config import get_config
+
+BENCH_PASSWORD = 'pbkdf2_sha256$600000$YmVuY2hzYWx0$YmVuY2hoYXNo'
+
+
+def build_sqlite(path, users):
+    print(f"🌱 Building a SQLite database with {users} users...")
+    started = time.perf_counter()
+    repository = storage.SQLiteRepository(path)
+    conn = repository.connect(autocommit=False)
+    cursor = conn.cursor()
+    today = date.today()
+    for start in range(0, users, 10000):
+        cursor.executemany(
+            "INSERT INTO users (username, password, status, expiry) VALUES (%s, %s, %s, %s)",
+            [(f'user_{n}', BENCH_PASSWORD, 'active' if n % 3 else 'inactive',
+              None if n % 10 == 0 else today + timedelta(days=n % 800 - 400))
+             for n in range(start, min(users, start + 10000))])
+        conn.commit()
+    cursor.close()
+    conn.close()
+    print(f"   {time.perf_counter() - started:.1f}s, {os.path.getsize(path) / 2 ** 20:.1f} MiB")
+
+
+def sample_usernames(repository, count):
+    conn = repository.acquire()
+    cursor = conn.cursor()
+    cursor.execute("SELECT username FROM users ORDER BY id LIMIT %s", (count * 10,))
+    names = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    conn.close()
+    return random.sample(names, min(count, len(names)))
+
+
+def time_lookups(repository, batches):
+    """Microseconds per find_users() call, each on an acquired and returned connection"""
+    timings = []
+    for usernames in batches:
+        started = time.perf_counter()
+        conn = repository.acquire()
+        repository.find_users(conn, usernames)
+        conn.close()
+        timings.append((time.perf_counter() - started) * 1e6)
+    timings.sort()
+    return timings
+
+
+def report(label, timings):
+    p50 = timings[len(timings) // 2]
+    p99 = timings[int(len(timings) * 0.99)]
+    mean = sum(timings) / len(timings)
+    print(f"{label:<34} {p50:>9.1f} {p99:>9.1f} {mean:>9.1f} {1e6 / mean:>12,.0f}")
+
+
+def run(name, repository, names, args):
+    unknown = [f'stuffing_{n}@example.com' for n in range(args.lookups)]
+    report(f"{name}: existing user", time_lookups(repository, [[random.choice(names)] for _ in range(args.lookups)]))
+    report(f"{name}: unknown user", time_lookups(repository, [[username] for username in unknown]))
+    calls = max(args.lookups // args.batch, 10)
+    report(f"{name}: batch of {args.batch}",
+           time_lookups(repository, [random.sample(names, min(args.batch, len(names))) for _ in range(calls)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=1000000, help='users in the synthetic SQLite database')
+    parser.add_argument('--lookups', type=int, default=20000, help='single-user lookups timed per case')
+    parser.add_argument('--batch', type=int, default=100, help='usernames per batch lookup')
+    parser.add_argument('--sqlite', help='use (and keep) this SQLite file instead of a temporary one')
+    parser.add_argument('--mysql', action='store_true', help='also time the configured MySQL database')
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix='bench-storage-')
+    try:
+        path = args.sqlite or os.path.join(work, 'auth.sqlite3')
+        if not os.path.exists(path):
+            build_sqlite(path, args.users)
+        sqlite = storage.SQLiteRepository(path, read_only=True)
+        names = sample_usernames(sqlite, 10000)
+
+        print(f"\n{'Lookup':<34} {'p50 us':>9} {'p99 us':>9} {'mean us':>9} {'calls/s':>12}")
+        print("-" * 77)
+        run('sqlite (read-only)', sqlite, names, args)
+        if args.mysql:
+            mysql = storage.MySQLRepository(get_config())
+            run('mysql', mysql, sample_usernames(mysql, 10000), args)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
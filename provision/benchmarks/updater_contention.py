@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Subscription Updater Contention Benchmark
+Measures the latency of the API's user lookup (and of a single-row write like
+the one login.php does on renewal) while subscription_updater.py runs, for
+the old whole-table update (--batch-size 0) and for chunked batches
+
+Seeds bench_upd_* users into the database configured in DEMO_ENV_FILE
+(default /etc/demo/.venv) and runs the real updater over the whole users
+table - use a scratch database, not production
+
+Usage: python3 benchmarks/updater_contention.py [--rows 200000] [--batches 0,1000,5000] \
+           [--sleep 0] [--readers 4] [--cleanup]
+"""
+
+import argparse
+import hashlib
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+PROVISION_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(PROVISION_DIR, 'lib'))
+sys.path.insert(0, os.path.join(PROVISION_DIR, 'system_scripts', 'subscription_updater'))
+
+from authcore import db
+from authcore import log as logs
+
+import subscription_updater
+
+PREFIX = 'bench_upd_'
+BENCH_PASSWORD = hashlib.md5(b'bench').hexdigest()
+
+
+def seed(rows):
+    """Insert missing bench users; returns their usernames"""
+    conn = db.connect(autocommit=True)
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM users WHERE username LIKE %s", (PREFIX + '%',))
+    existing = cursor.fetchone()[0]
+    if existing < rows:
+        print(f"🌱 Seeding {rows - existing} bench users...")
+        for start in range(existing, rows, 5000):
+            batch = [(f'{PREFIX}{n}', BENCH_PASSWORD, 'inactive', None)
+                     for n in range(start, min(rows, start + 5000))]
+            cursor.executemany(
+                "INSERT IGNORE INTO users (username, password, status, expiry) VALUES (%s, %s, %s, %s)", batch)
+    cursor.close()
+    conn.close()
+    return [f'{PREFIX}{n}' for n in range(rows)]
+
+
+def make_work():
+    """Put every bench user in a state the updater will change (done in small batches)"""
+    conn = db.connect(autocommit=True)
+    cursor = conn.cursor()
+    today = date.today()
+    cursor.execute("SELECT MIN(id), MAX(id) FROM users WHERE username LIKE %s", (PREFIX + '%',))
+    low, high = cursor.fetchone()
+    for start in range(low, high + 1, 5000):
+        # Alternate: active-but-expired, inactive-with-future-expiry, inactive lifetime
+        cursor.execute("""
+            UPDATE users
+            SET status = IF(id %% 3 = 0, 'active', 'inactive'),
+                expiry = CASE id %% 3 WHEN 0 THEN %s WHEN 1 THEN %s ELSE NULL END
+            WHERE id >= %s AND id < %s AND username LIKE %s
+        """, (today - timedelta(days=1), today + timedelta(days=30), start, start + 5000, PREFIX + '%'))
+    cursor.close()
+    conn.close()
+
+
+def cleanup():
+    conn = db.connect(autocommit=True)
+    cursor = conn.cursor()
+    deleted = 0
+    while True:
+        cursor.execute("DELETE FROM users WHERE username LIKE %s LIMIT 5000", (PREFIX + '%',))
+        deleted += cursor.rowcount
+        if cursor.rowcount == 0:
+            break
+    cursor.close()
+    conn.close()
+    print(f"🧹 Removed {deleted} bench users")
+
+
+def probe(kind, usernames, stop, latencies):
+    """Repeat the API lookup (kind='read') or a single-row locking write (kind='write')"""
+    conn = db.connect(autocommit=True)
+    cursor = conn.cursor()
+    rng = random.Random()
+    while not stop.is_set():
+        username = rng.choice(usernames)
+        start = time.perf_counter()
+        if kind == 'read':
+            cursor.execute("""
+                SELECT id, username, password, status, expiry, updated_at
+                FROM users
+                WHERE username IN (%s)
+            """, (username,))
+            cursor.fetchall()
+        else:
+            cursor.execute("UPDATE users SET expiry = expiry WHERE username = %s", (username,))
+        latencies.append(time.perf_counter() - start)
+        time.sleep(0.001)
+    cursor.close()
+    conn.close()
+
+
+def summarize(values):
+    if not values:
+        return '-'
+    values = sorted(values)
+    p = lambda pct: values[min(len(values) - 1, int(pct / 100 * (len(values) - 1)))] * 1000
+    return f"{p(50):7.2f} {p(99):8.2f} {values[-1] * 1000:8.2f} {len(values):>7}"
+
+
+def run_scenario(label, usernames, readers, writers, batch_size, batch_sleep, idle_seconds):
+    stop = threading.Event()
+    reads, writes = [], []
+    threads = [threading.Thread(target=probe, args=('read', usernames, stop, reads)) for _ in range(readers)]
+    threads += [threading.Thread(target=probe, args=('write', usernames, stop, writes)) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+
+    started = time.perf_counter()
+    if batch_size is None:
+        time.sleep(idle_seconds)
+        ok = True
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            ok = subscription_updater.update_subscription_statuses(
+                batch_size=batch_size, batch_sleep=batch_sleep,
+                checkpoint_path=os.path.join(tmp, 'checkpoint.json'), restart=True)
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    for thread in threads:
+        thread.join()
+    status = '' if ok else '  (updater failed)'
+    print(f"{label:<22} {elapsed:8.2f}  read {summarize(reads)}  write {summarize(writes)}{status}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200000, help='bench users to seed')
+    parser.add_argument('--batches', default='0,1000,5000',
+                        help='comma-separated batch sizes to compare; 0 = whole table in one pass')
+    parser.add_argument('--sleep', type=float, default=0, help='seconds between batches')
+    parser.add_argument('--readers', type=int, default=4, help='threads repeating the API lookup')
+    parser.add_argument('--writers', type=int, default=1, help='threads doing single-row writes')
+    parser.add_argument('--cleanup', action='store_true', help='delete the bench users afterwards')
+    args = parser.parse_args()
+
+    # Keep the updater's own log lines out of the results table
+    logs.setup_logging('WARNING', stream=sys.stderr)
+    usernames = seed(args.rows)
+
+    print(f"{'Scenario':<22} {'Seconds':>8}  read {'p50 ms':>7} {'p99 ms':>8} {'max ms':>8} {'samples':>7}"
+          f"  write {'p50 ms':>7} {'p99 ms':>8} {'max ms':>8} {'samples':>7}")
+    print("-" * 118)
+    try:
+        run_scenario('no updater (baseline)', usernames, args.readers, args.writers, None, 0, 5)
+        for batch_size in (int(value) for value in args.batches.split(',')):
+            make_work()
+            label = 'whole table' if batch_size == 0 else f'batch {batch_size}'
+            if batch_size and args.sleep:
+                label += f' +{args.sleep}s'
+            run_scenario(label, usernames, args.readers, args.writers, batch_size, args.sleep, 0)
+    finally:
+        if args.cleanup:
+            cleanup()
+
+
+if __name__ == '__main__':
+    main()
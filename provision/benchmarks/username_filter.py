@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Known-Username Filter Benchmark
+Memory, measured false-positive rate and lookup cost of the Bloom filter in
+lib/authcore/bloom.py for a given user count at several target error rates
+
+No database needed: random names stand in for the users table.
+
+Usage: python3 benchmarks/username_filter.py [--users 1000000] [--probes 200000] \
+           [--rates 0.01,0.001,0.0001]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+PROVISION_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(PROVISION_DIR, 'lib'))
+
+from authcore.bloom import BloomFilter, normalize_username
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=1000000, help='usernames in the filter')
+    parser.add_argument('--probes', type=int, default=200000, help='unknown names looked up')
+    parser.add_argument('--rates', default='0.01,0.001,0.0001', help='comma-separated target error rates')
+    args = parser.parse_args()
+
+    users = [normalize_username(f'user_{n}') for n in range(args.users)]
+    probes = [normalize_username(f'stuffing_{n}@example.com') for n in range(args.probes)]
+
+    print(f"{'Target':>8} {'Hashes':>7} {'MiB':>8} {'B/user':>7} {'Measured FP':>12} "
+          f"{'Build s':>8} {'us/lookup':>10}")
+    print("-" * 66)
+    for rate in (float(value) for value in args.rates.split(',')):
+        bloom = BloomFilter(args.users, rate)
+        started = time.perf_counter()
+        for name in users:
+            bloom.add(name)
+        build = time.perf_counter() - started
+
+        started = time.perf_counter()
+        false_positives = sum(1 for name in probes if name in bloom)
+        lookup = (time.perf_counter() - started) / len(probes) * 1e6
+
+        size = bloom.stats()['bytes']
+        print(f"{rate:>8g} {bloom.hashes:>7} {size / 2 ** 20:>8.2f} {size / args.users:>7.2f} "
+              f"{false_positives / len(probes):>12.5f} {build:>8.2f} {lookup:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+"""
+Shared runtime for the authentication platform
+Configuration loading, database access and the storage backends used by
+the API, the subscription updater and the user management CLI
+
+Submodules are imported on first attribute access so that short-lived
+processes (cron jobs, CLI tools) only pay for what they actually use
+"""
+
+import importlib
+
+# Public name -> submodule that defines it
+_EXPORTS = {
+    'DEFAULT_ENV_PATH': 'config',
+    'EnvConfig': 'config',
+    'get_config': 'config',
+    'load_env_file': 'config',
+    'ConnectionPool': 'pool',
+    'PoolTimeout': 'pool',
+    'PoolClosed': 'pool',
+    'connect': 'db',
+    'get_pool': 'db',
+    'close_pool': 'db',
+    'get_repository': 'storage',
+    'ReplicaRouter': 'replicas',
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module 'authcore' has no attribute '{name}'")
+    value = getattr(importlib.import_module(f'.{module_name}', __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
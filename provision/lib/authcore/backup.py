@@ -0,0 +1,565 @@
+"""
+Backup and Restore
+Logical backups of the application database: a directory of compressed
+chunk files and a manifest, dumped by several connections in parallel from
+one consistent snapshot, and restored through a bulk-load path.
+
+Backup directory:
+    manifest.json           schema, triggers and chunk list with SHA-256 (written last:
+                            a directory without it is an incomplete backup)
+    <table>.<n>.tsv.gz      rows in LOAD DATA format (tab separated, \\N for NULL)
+
+Rows are streamed from unbuffered cursors and compressed as they arrive, so
+no table is ever held in memory; each worker compresses its own chunks
+(zlib releases the GIL, so compression runs in parallel).
+
+Restore recreates every table without its secondary indexes and triggers,
+loads the chunks in parallel (LOAD DATA LOCAL INFILE when the server allows
+it, multi-row INSERTs otherwise), builds each table's secondary indexes in
+a single ALTER, recreates the triggers and applies pending schema migrations.
+
+    PYTHONPATH=/usr/local/lib/demo python3 -m authcore.backup --backup DIR
+    PYTHONPATH=/usr/local/lib/demo python3 -m authcore.backup --verify DIR
+    PYTHONPATH=/usr/local/lib/demo python3 -m authcore.backup --restore DIR
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import queue
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from . import db
+from . import migrations
+from .config import get_config
+
+FORMAT_VERSION = 1
+MANIFEST = 'manifest.json'
+INSERT_BATCH = 2000
+
+# MySQL errors meaning LOAD DATA LOCAL is disabled on the server or client
+LOCAL_INFILE_ERRORS = (1148, 2068, 3948, 3950)
+
+_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r', '\0': '\\0'})
+_UNESCAPES = {'t': '\t', 'n': '\n', 'r': '\r', '0': '\0'}
+_ESCAPED = re.compile(r'\\(.)')
+_DEFINER = re.compile(r'\s+DEFINER\s*=\s*\S+@\S+', re.IGNORECASE)
+
+
+class BackupError(Exception):
+    """A backup is incomplete or corrupt, or could not be written or restored"""
+
+
+def encode_value(value):
+    """One field in LOAD DATA's default format"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, str):
+        return value.translate(_ESCAPES)
+    if isinstance(value, (bytes, bytearray)):
+        raise BackupError("Binary columns are not supported")
+    # int, Decimal, float, date and datetime all print the way MySQL parses them
+    return str(value)
+
+
+def decode_value(field):
+    if field == '\\N':
+        return None
+    if '\\' in field:
+        return _ESCAPED.sub(lambda m: _UNESCAPES.get(m.group(1), m.group(1)), field)
+    return field
+
+
+class _ChecksumWriter:
+    """File wrapper that hashes and counts the bytes written through it"""
+
+    def __init__(self, path):
+        self.file = open(path, 'wb')
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.file.write(data)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _quote(name):
+    return '`' + name.replace('`', '``') + '`'
+
+
+# ---- Schema ---------------------------------------------------------------
+
+def list_tables(cursor):
+    cursor.execute("SHOW FULL TABLES WHERE Table_type = 'BASE TABLE'")
+    return [row[0] for row in cursor.fetchall()]
+
+
+def table_columns(cursor, table):
+    cursor.execute("""
+        SELECT column_name, data_type, column_key
+        FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = %s
+        ORDER BY ordinal_position
+    """, (table,))
+    return cursor.fetchall()
+
+
+def secondary_indexes(cursor, table):
+    """[(name, 'ADD ... INDEX ...' clause)] for every index except the primary key"""
+    cursor.execute("""
+        SELECT index_name, non_unique, index_type, column_name, sub_part
+        FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s AND index_name <> 'PRIMARY'
+        ORDER BY index_name, seq_in_index
+    """, (table,))
+    indexes = {}
+    for name, non_unique, index_type, column, sub_part in cursor.fetchall():
+        if name not in indexes:
+            kind = 'UNIQUE INDEX' if int(non_unique) == 0 else 'INDEX'
+            if index_type in ('FULLTEXT', 'SPATIAL'):
+                kind = f'{index_type} INDEX'
+            indexes[name] = (kind, [])
+        indexes[name][1].append(_quote(column) + (f'({sub_part})' if sub_part else ''))
+    return [(name, f"ADD {kind} {_quote(name)} ({', '.join(columns)})")
+            for name, (kind, columns) in indexes.items()]
+
+
+def plan_chunks(cursor, table, key, chunk_rows):
+    """
+    [(low, high)] ranges of an integer primary key with about chunk_rows rows
+    each; the last range is open-ended, so rows added after planning are still
+    dumped if the snapshot includes them. [(None, None)] = the whole table at once
+    """
+    if key is None:
+        return [(None, None)]
+    cursor.execute(f"SELECT MIN({_quote(key)}), MAX({_quote(key)}), COUNT(*) FROM {_quote(table)}")
+    low, high, rows = cursor.fetchone()
+    if not rows:
+        return [(None, None)]
+    step = max(1, (int(high) - int(low) + 1) * chunk_rows // int(rows))
+    bounds = list(range(int(low), int(high) + 1, step))
+    return [(start, end) for start, end in zip(bounds, bounds[1:] + [None])]
+
+
+def describe_tables(cursor, chunk_rows):
+    tables = []
+    for name in list_tables(cursor):
+        cursor.execute(f"SHOW CREATE TABLE {_quote(name)}")
+        create_sql = cursor.fetchone()[1]
+        columns = table_columns(cursor, name)
+        primary = [column for column, data_type, column_key in columns if column_key == 'PRI']
+        integer_key = None
+        if len(primary) == 1 and dict((c, t) for c, t, k in columns)[primary[0]] in (
+                'tinyint', 'smallint', 'mediumint', 'int', 'bigint'):
+            integer_key = primary[0]
+        tables.append({
+            'name': name,
+            'create_sql': create_sql,
+            'columns': [column for column, data_type, column_key in columns],
+            'order_by': primary,
+            'ranges': plan_chunks(cursor, name, integer_key, chunk_rows),
+            'range_key': integer_key,
+        })
+    return tables
+
+
+def describe_triggers(cursor):
+    cursor.execute("SHOW TRIGGERS")
+    names = [(row[0], row[2]) for row in cursor.fetchall()]
+    triggers = []
+    for name, table in names:
+        cursor.execute(f"SHOW CREATE TRIGGER {_quote(name)}")
+        row = cursor.fetchone()
+        columns = [d[0] for d in cursor.description]
+        triggers.append({'name': name, 'table': table,
+                         'sql': _DEFINER.sub('', row[columns.index('SQL Original Statement')], count=1)})
+    return triggers
+
+
+# ---- Backup ---------------------------------------------------------------
+
+def dump_chunk(conn, directory, table, number, low, high, compresslevel):
+    """Stream one primary key range of a table into a compressed chunk file"""
+    sql = f"SELECT {', '.join(_quote(c) for c in table['columns'])} FROM {_quote(table['name'])}"
+    params = ()
+    if low is not None:
+        key = _quote(table['range_key'])
+        sql += f" WHERE {key} >= %s" + (f" AND {key} < %s" if high is not None else '')
+        params = (low,) if high is None else (low, high)
+    if table['order_by']:
+        sql += f" ORDER BY {', '.join(_quote(c) for c in table['order_by'])}"
+
+    filename = f"{table['name']}.{number:05d}.tsv.gz"
+    writer = _ChecksumWriter(os.path.join(directory, filename))
+    rows = 0
+    try:
+        with gzip.GzipFile(filename='', mode='wb', fileobj=writer, compresslevel=compresslevel, mtime=0) as gz:
+            cursor = conn.cursor()
+            cursor.execute(sql, params)
+            while True:
+                batch = cursor.fetchmany(5000)
+                if not batch:
+                    break
+                gz.write(''.join('\t'.join(encode_value(value) for value in row) + '\n'
+                                 for row in batch).encode())
+                rows += len(batch)
+            cursor.close()
+    finally:
+        writer.close()
+    return {'file': filename, 'rows': rows, 'bytes': writer.size, 'sha256': writer.sha256.hexdigest()}
+
+
+def _run_workers(connections, tasks, work):
+    """Run work(conn, task) for every task, one thread per connection; re-raises the first error"""
+    pending = queue.Queue()
+    for task in tasks:
+        pending.put(task)
+    errors = []
+
+    def run(conn):
+        while not errors:
+            try:
+                task = pending.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                work(conn, task)
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(conn,), daemon=True) for conn in connections]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+
+
+def backup(directory, workers=4, chunk_rows=100000, compresslevel=6, config=None, progress=None):
+    """
+    Dump the database into directory (created; must not hold a backup already)
+    Returns the manifest
+    """
+    config = config or get_config()
+    progress = progress or (lambda message: None)
+    if os.path.exists(os.path.join(directory, MANIFEST)):
+        raise BackupError(f"{directory} already contains a backup")
+    os.makedirs(directory, exist_ok=True)
+    started = time.monotonic()
+
+    coordinator = db.connect(autocommit=True, config=config)
+    connections = []
+    try:
+        cursor = coordinator.cursor()
+        cursor.execute("SELECT DATABASE(), VERSION()")
+        database, server_version = cursor.fetchone()
+        tables = describe_tables(cursor, chunk_rows)
+        triggers = describe_triggers(cursor)
+
+        # Every worker reads the same snapshot: writes are held for the
+        # moment it takes to open one transaction per connection
+        connections = [db.connect(autocommit=False, config=config) for _ in range(max(1, workers))]
+        if tables:
+            cursor.execute("LOCK TABLES " + ', '.join(f"{_quote(t['name'])} READ" for t in tables))
+        try:
+            for conn in connections:
+                conn.start_transaction(consistent_snapshot=True, isolation_level='REPEATABLE READ',
+                                       readonly=True)
+        finally:
+            cursor.execute("UNLOCK TABLES")
+        cursor.close()
+        progress(f"📸 Snapshot taken, dumping {len(tables)} tables with {len(connections)} connections")
+
+        tasks = [(table, number, low, high)
+                 for table in tables for number, (low, high) in enumerate(table['ranges'])]
+        chunks = {}
+
+        def work(conn, task):
+            table, number, low, high = task
+            chunks[(table['name'], number)] = dump_chunk(conn, directory, table, number, low, high, compresslevel)
+
+        _run_workers(connections, tasks, work)
+    finally:
+        for conn in connections:
+            conn.close()
+        coordinator.close()
+
+    manifest = {
+        'format': FORMAT_VERSION,
+        'database': database,
+        'server_version': server_version,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'tables': [],
+        'triggers': triggers,
+    }
+    for table in tables:
+        table_chunks = [chunks[(table['name'], number)] for number in range(len(table['ranges']))]
+        manifest['tables'].append({
+            'name': table['name'],
+            'create_sql': table['create_sql'],
+            'columns': table['columns'],
+            'rows': sum(chunk['rows'] for chunk in table_chunks),
+            'chunks': table_chunks,
+        })
+    manifest['seconds'] = round(time.monotonic() - started, 3)
+
+    path = os.path.join(directory, MANIFEST)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + '.tmp', path)
+    return manifest
+
+
+# ---- Restore --------------------------------------------------------------
+
+def read_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST)) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        raise BackupError(f"No {MANIFEST} in {directory}: not a backup, or an incomplete one")
+    if manifest.get('format') != FORMAT_VERSION:
+        raise BackupError(f"Unsupported backup format {manifest.get('format')!r}")
+    return manifest
+
+
+def verify(directory):
+    """Check every chunk against the manifest's checksums; returns the manifest"""
+    manifest = read_manifest(directory)
+    problems = []
+    for table in manifest['tables']:
+        for chunk in table['chunks']:
+            path = os.path.join(directory, chunk['file'])
+            if not os.path.exists(path):
+                problems.append(f"{chunk['file']}: missing")
+            elif file_sha256(path) != chunk['sha256']:
+                problems.append(f"{chunk['file']}: checksum mismatch")
+    if problems:
+        raise BackupError("Backup is damaged: " + '; '.join(problems))
+    return manifest
+
+
+def _connect_loader(config, local_infile):
+    import mysql.connector
+
+    conn = mysql.connector.connect(autocommit=False, allow_local_infile=local_infile,
+                                   **db.connection_settings(config))
+    cursor = conn.cursor()
+    # Constraints were checked when the data was written; the unique index is
+    # rebuilt (and so re-checked) after the load
+    cursor.execute("SET SESSION unique_checks = 0, foreign_key_checks = 0")
+    cursor.close()
+    return conn
+
+
+def load_chunk_infile(conn, directory, table, chunk):
+    with tempfile.NamedTemporaryFile(prefix='restore-', suffix='.tsv') as plain:
+        with gzip.open(os.path.join(directory, chunk['file']), 'rb') as gz:
+            shutil.copyfileobj(gz, plain, 1 << 20)
+        plain.flush()
+        cursor = conn.cursor()
+        cursor.execute(f"LOAD DATA LOCAL INFILE %s INTO TABLE {_quote(table['name'])} CHARACTER SET utf8mb4 "
+                       f"({', '.join(_quote(c) for c in table['columns'])})", (plain.name,))
+        loaded = cursor.rowcount
+        cursor.close()
+    return loaded
+
+
+def load_chunk_insert(conn, directory, table, chunk):
+    # executemany() sends each batch as one multi-row INSERT
+    sql = (f"INSERT INTO {_quote(table['name'])} ({', '.join(_quote(c) for c in table['columns'])}) "
+           f"VALUES ({', '.join(['%s'] * len(table['columns']))})")
+    cursor = conn.cursor()
+    loaded = 0
+    batch = []
+    with gzip.open(os.path.join(directory, chunk['file']), 'rt', encoding='utf-8', newline='\n') as f:
+        for line in f:
+            batch.append(tuple(decode_value(field) for field in line[:-1].split('\t')))
+            if len(batch) >= INSERT_BATCH:
+                cursor.executemany(sql, batch)
+                loaded += len(batch)
+                batch = []
+    if batch:
+        cursor.executemany(sql, batch)
+        loaded += len(batch)
+    cursor.close()
+    return loaded
+
+
+def restore(directory, workers=4, method='auto', migrate=True, config=None, progress=None):
+    """
+    Replace the tables in the backup with its contents
+    method - 'infile' (LOAD DATA LOCAL), 'insert', or 'auto' (infile, falling
+             back to insert when the server refuses local files)
+    Returns a summary with the rows loaded and time spent per phase
+    """
+    config = config or get_config()
+    progress = progress or (lambda message: None)
+    manifest = verify(directory)
+    timings = {}
+    started = time.monotonic()
+
+    conn = db.connect(autocommit=True, config=config)
+    cursor = conn.cursor()
+    cursor.execute("SET SESSION foreign_key_checks = 0")
+    deferred = {}
+    for table in manifest['tables']:
+        cursor.execute(f"DROP TABLE IF EXISTS {_quote(table['name'])}")
+        cursor.execute(table['create_sql'])
+        indexes = secondary_indexes(cursor, table['name'])
+        if indexes:
+            cursor.execute(f"ALTER TABLE {_quote(table['name'])} "
+                           + ', '.join(f"DROP INDEX {_quote(name)}" for name, clause in indexes))
+        deferred[table['name']] = indexes
+    timings['schema'] = time.monotonic() - started
+    progress(f"🏗️  Recreated {len(manifest['tables'])} tables, secondary indexes deferred")
+
+    # Biggest chunks first so one large table doesn't finish last on a single worker
+    tasks = sorted(((table, chunk) for table in manifest['tables'] for chunk in table['chunks'] if chunk['rows']),
+                   key=lambda task: -task[1]['bytes'])
+    use_infile = [method != 'insert']
+    loaded = {}
+    lock = threading.Lock()
+
+    def work(loader, task):
+        table, chunk = task
+        rows = None
+        if use_infile[0]:
+            try:
+                rows = load_chunk_infile(loader, directory, table, chunk)
+            except db.Error as e:
+                if method == 'infile' or e.errno not in LOCAL_INFILE_ERRORS:
+                    raise
+                loader.rollback()
+                use_infile[0] = False
+                progress(f"ℹ️  LOAD DATA LOCAL unavailable ({e.msg}); loading with INSERTs")
+        if rows is None:
+            rows = load_chunk_insert(loader, directory, table, chunk)
+        loader.commit()
+        if rows != chunk['rows']:
+            raise BackupError(f"{chunk['file']}: loaded {rows} rows, expected {chunk['rows']}")
+        with lock:
+            loaded[table['name']] = loaded.get(table['name'], 0) + rows
+
+    phase = time.monotonic()
+    loaders = [_connect_loader(config, method != 'insert') for _ in range(max(1, min(workers, len(tasks))))]
+    try:
+        _run_workers(loaders, tasks, work)
+    finally:
+        for loader in loaders:
+            loader.close()
+    timings['load'] = time.monotonic() - phase
+    progress(f"📥 Loaded {sum(loaded.values())} rows in {timings['load']:.1f}s "
+             f"({'LOAD DATA' if use_infile[0] else 'INSERT'})")
+
+    # One ALTER per table builds all of its indexes in a single pass over the rows
+    phase = time.monotonic()
+    index_tasks = [(name, indexes) for name, indexes in deferred.items() if indexes]
+
+    def build_indexes(builder, task):
+        name, indexes = task
+        builder_cursor = builder.cursor()
+        builder_cursor.execute(f"ALTER TABLE {_quote(name)} " + ', '.join(clause for index, clause in indexes))
+        builder_cursor.close()
+
+    builders = [db.connect(autocommit=True, config=config) for _ in range(max(1, min(workers, len(index_tasks))))]
+    try:
+        _run_workers(builders, index_tasks, build_indexes)
+    finally:
+        for builder in builders:
+            builder.close()
+    timings['indexes'] = time.monotonic() - phase
+    progress(f"🗂️  Built {sum(len(indexes) for name, indexes in index_tasks)} secondary indexes "
+             f"in {timings['indexes']:.1f}s")
+
+    # Triggers last: the restored rows (user_stats included) are already consistent
+    for trigger in manifest['triggers']:
+        cursor.execute(f"DROP TRIGGER IF EXISTS {_quote(trigger['name'])}")
+        cursor.execute(trigger['sql'])
+    for table in manifest['tables']:
+        cursor.execute(f"ANALYZE TABLE {_quote(table['name'])}")
+        cursor.fetchall()
+    cursor.close()
+
+    applied = []
+    if migrate:
+        applied = migrations.migrate(conn)
+    conn.close()
+    timings['total'] = time.monotonic() - started
+    return {
+        'tables': len(manifest['tables']),
+        'rows': sum(loaded.values()),
+        'method': 'infile' if use_infile[0] else 'insert',
+        'migrations': [version for version, description, actions in applied],
+        'seconds': {phase: round(value, 3) for phase, value in timings.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Parallel chunked backup and bulk restore of the database')
+    action = parser.add_mutually_exclusive_group(required=True)
+    action.add_argument('--backup', metavar='DIR', help='dump the database into a new backup directory')
+    action.add_argument('--verify', metavar='DIR', help='check a backup against its manifest')
+    action.add_argument('--restore', metavar='DIR', help='replace the database tables with a backup')
+    parser.add_argument('--workers', type=int, help='parallel connections (default BACKUP_WORKERS or 4)')
+    parser.add_argument('--chunk-rows', type=int, help='rows per chunk file (default BACKUP_CHUNK_ROWS or 100000)')
+    parser.add_argument('--compress-level', type=int, help='gzip level 1-9 (default BACKUP_COMPRESS_LEVEL or 6)')
+    parser.add_argument('--load-method', choices=('auto', 'infile', 'insert'), default='auto',
+                        help='restore with LOAD DATA LOCAL, multi-row INSERTs, or infile with fallback')
+    parser.add_argument('--no-migrate', action='store_true', help="don't apply schema migrations after a restore")
+    args = parser.parse_args()
+
+    config = get_config()
+    workers = args.workers or config.get_int('BACKUP_WORKERS', 4)
+    try:
+        if args.backup:
+            manifest = backup(args.backup, workers=workers,
+                              chunk_rows=args.chunk_rows or config.get_int('BACKUP_CHUNK_ROWS', 100000),
+                              compresslevel=args.compress_level or config.get_int('BACKUP_COMPRESS_LEVEL', 6),
+                              config=config, progress=print)
+            size = sum(chunk['bytes'] for table in manifest['tables'] for chunk in table['chunks'])
+            print(f"✅ Backup of {manifest['database']} written to {args.backup}: "
+                  f"{sum(table['rows'] for table in manifest['tables'])} rows, "
+                  f"{size / 2 ** 20:.1f} MiB, {manifest['seconds']:.1f}s")
+        elif args.verify:
+            manifest = verify(args.verify)
+            print(f"✅ Backup of {manifest['database']} from {manifest['created_at']} is intact "
+                  f"({sum(len(table['chunks']) for table in manifest['tables'])} chunks)")
+        else:
+            summary = restore(args.restore, workers=workers, method=args.load_method,
+                              migrate=not args.no_migrate, config=config, progress=print)
+            print(f"✅ Restored {summary['rows']} rows into {summary['tables']} tables "
+                  f"in {summary['seconds']['total']:.1f}s")
+            for version in summary['migrations']:
+                print(f"✅ Applied migration {version}")
+    except (BackupError, db.Error, OSError, RuntimeError) as e:
+        print(f"❌ {'Backup' if args.backup else 'Verification' if args.verify else 'Restore'} failed: {e}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+"""
+Known-Username Filter
+A Bloom filter of every username in the users table, so lookups for names
+that certainly don't exist (most of the traffic in a credential-stuffing
+attack) are answered without touching MySQL. A "maybe" still goes to the
+database, so false positives only cost the lookup that would have happened
+anyway; there are no false negatives once the filter has caught up.
+
+Built from a streamed scan of users, kept current from the user_changes log
+(every insert writes a row there, see changes.py) and rebuilt periodically,
+which also drops deleted names and resizes it as the table grows.
+"""
+
+import hashlib
+import math
+import os
+import threading
+import time
+import unicodedata
+
+from . import changes
+
+
+def normalize_username(username):
+    """
+    Key a username the way the users.username collation compares it:
+    case-insensitive and, with the default utf8mb4 collation, accent-insensitive.
+    Folding a little too much only adds false positives, never misses.
+    """
+    decomposed = unicodedata.normalize('NFKD', username.casefold())
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).rstrip(' ')
+
+
+def _discard(conn):
+    # A pooled connection in an unknown state must not go back to the pool
+    invalidate = getattr(conn, 'invalidate', None)
+    if invalidate:
+        invalidate()
+    else:
+        conn.close()
+
+
+class BloomFilter:
+    """
+    capacity   - entries the filter is sized for
+    error_rate - false-positive rate at capacity
+    max_bytes  - memory cap; a capped filter has a higher error rate than asked
+                 for (see estimated_error_rate())
+    """
+
+    def __init__(self, capacity, error_rate=0.001, max_bytes=None):
+        self.capacity = max(1, capacity)
+        self.error_rate = error_rate
+        self.bits = max(64, int(math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2)))
+        if max_bytes:
+            self.bits = min(self.bits, max_bytes * 8)
+        self.hashes = max(1, int(round(self.bits / self.capacity * math.log(2))))
+        self.count = 0
+        self._array = bytearray((self.bits + 7) // 8)
+
+    def _positions(self, key):
+        # Double hashing (Kirsch-Mitzenmacher): k positions from one 128-bit digest
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self._array[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        array = self._array
+        return all(array[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def estimated_error_rate(self):
+        """False-positive rate expected with the entries added so far"""
+        return (1 - math.exp(-self.hashes * self.count / self.bits)) ** self.hashes
+
+    def stats(self):
+        return {
+            'entries': self.count,
+            'capacity': self.capacity,
+            'bits': self.bits,
+            'hashes': self.hashes,
+            'bytes': len(self._array),
+            'target_error_rate': self.error_rate,
+            'estimated_error_rate': round(self.estimated_error_rate(), 6),
+        }
+
+
+class KnownUsernames:
+    """
+    Bloom filter of existing usernames, maintained by a background thread
+
+    connect          - callable returning a DB connection for the scan and refreshes
+                       (a pooled one is invalidated instead of returned after an error)
+    error_rate       - target false-positive rate
+    max_bytes        - memory cap for the filter (None = sized by error_rate alone)
+    headroom         - capacity as a multiple of the row count at build time,
+                       so new users don't push the error rate up before the next rebuild
+    refresh_interval - seconds between reads of the change log (new users)
+    rebuild_interval - seconds between full rebuilds
+    gap_wait         - see changes.fetch()
+    """
+
+    def __init__(self, connect, error_rate=0.001, max_bytes=None, headroom=1.5, min_capacity=10000,
+                 refresh_interval=1, rebuild_interval=3600, gap_wait=5):
+        self.connect = connect
+        self.error_rate = error_rate
+        self.max_bytes = max_bytes
+        self.headroom = headroom
+        self.min_capacity = min_capacity
+        self.refresh_interval = refresh_interval
+        self.rebuild_interval = rebuild_interval
+        self.gap_wait = gap_wait
+
+        self._filter = None       # None until the first build: everything "might exist"
+        self._cursor = 0
+        self._built_at = None
+        self._build_seconds = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._counters = {'checks': 0, 'rejected': 0, 'added': 0, 'rebuilds': 0, 'errors': 0}
+
+    def start(self):
+        """Build in the background and keep refreshing (again in a forked child)"""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        threading.Thread(target=self._run, name='username-filter', daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                if self._filter is None or time.monotonic() - self._built_at >= self.rebuild_interval \
+                        or self._filter.count > self._filter.capacity:
+                    self.rebuild()
+                else:
+                    self.refresh()
+            except Exception:
+                self._counters['errors'] += 1
+            time.sleep(self.refresh_interval)
+
+    def rebuild(self):
+        """Scan every username into a new filter and swap it in"""
+        started = time.monotonic()
+        conn = self.connect()
+        try:
+            # Take the change cursor first: users inserted during the scan are applied after it
+            cursor_id = changes.latest_id(conn)
+            cursor = conn.cursor()
+            cursor.execute("SELECT COUNT(*) FROM users")
+            rows = cursor.fetchone()[0]
+            bloom = BloomFilter(max(self.min_capacity, int(rows * self.headroom)), self.error_rate,
+                                self.max_bytes)
+            # Unbuffered: rows stream in batches instead of the whole column in memory
+            cursor.execute("SELECT username FROM users")
+            while True:
+                batch = cursor.fetchmany(10000)
+                if not batch:
+                    break
+                for (username,) in batch:
+                    bloom.add(normalize_username(username))
+            cursor.close()
+            conn.commit()
+            cursor_id = self._apply_changes(conn, bloom, cursor_id)
+        except Exception:
+            _discard(conn)
+            raise
+        conn.close()
+        with self._lock:
+            self._filter = bloom
+            self._cursor = cursor_id
+            self._built_at = time.monotonic()
+            self._build_seconds = round(self._built_at - started, 3)
+            self._counters['rebuilds'] += 1
+
+    def refresh(self):
+        """Add the usernames of changes logged since the last build or refresh"""
+        conn = self.connect()
+        try:
+            cursor_id = self._apply_changes(conn, self._filter, self._cursor)
+        except changes.CursorExpired:
+            conn.close()
+            self.rebuild()
+            return
+        except Exception:
+            _discard(conn)
+            raise
+        conn.close()
+        self._cursor = cursor_id
+
+    def _apply_changes(self, conn, bloom, since):
+        while True:
+            batch, since = changes.fetch(conn, since, limit=1000, gap_wait=self.gap_wait)
+            for change in batch:
+                key = normalize_username(change['username'])
+                if key not in bloom:
+                    bloom.add(key)
+                    self._counters['added'] += 1
+            if len(batch) < 1000:
+                return since
+
+    def might_exist(self, username):
+        """False only if no user with this name exists (as of the last refresh)"""
+        bloom = self._filter
+        if bloom is None:
+            return True
+        self._counters['checks'] += 1
+        if normalize_username(username) in bloom:
+            return True
+        self._counters['rejected'] += 1
+        return False
+
+    def stats(self):
+        bloom = self._filter
+        report = dict(self._counters, ready=bloom is not None, change_cursor=self._cursor,
+                      build_seconds=self._build_seconds,
+                      age=round(time.monotonic() - self._built_at, 1) if self._built_at else None)
+        if bloom is not None:
+            report.update(bloom.stats())
+        return report
@@ -0,0 +1,157 @@
+"""
+Authentication Record Cache
+Bounded in-process LRU cache of user rows with a TTL, invalidated by
+periodic `updated_at` sweeps so edits made by other processes show up
+within a bounded staleness window
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class AuthCache:
+    """
+    LRU + TTL cache keyed by username
+
+    max_entries    - entries kept before the least recently used is evicted
+                     (0 disables caching)
+    ttl            - seconds an entry may be served without re-reading the row
+    sweep_interval - seconds between `updated_at` invalidation sweeps
+    sweep_margin   - seconds each sweep looks back past the previous one, so
+                     rows committed late or within the same second are not missed
+    """
+
+    def __init__(self, max_entries=10000, ttl=300, sweep_interval=5, sweep_margin=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self.sweep_margin = sweep_margin
+
+        self._entries = OrderedDict()   # username -> (expires_at, record)
+        self._lock = threading.Lock()
+        self._sweep_lock = threading.Lock()
+        self._last_sweep = 0.0
+        self._sweeps = 0
+        self.watermark = None            # DB time the next sweep looks back to
+
+        self._counters = {
+            'hits': 0,
+            'misses': 0,
+            'expired': 0,
+            'evictions': 0,
+            'invalidations': 0,
+            'sweeps': 0,
+            'sweep_errors': 0,
+        }
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def get(self, username):
+        """Cached record for username, or None on a miss"""
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            item = self._entries.get(username)
+            if item is None:
+                self._counters['misses'] += 1
+                return None
+            expires_at, record = item
+            if expires_at <= now:
+                del self._entries[username]
+                self._counters['expired'] += 1
+                self._counters['misses'] += 1
+                return None
+            self._entries.move_to_end(username)
+            self._counters['hits'] += 1
+            return record
+
+    def fill_token(self):
+        """Token to pass to put(); taken before reading the row from the DB"""
+        return self._sweeps
+
+    def put(self, username, record, token):
+        """
+        Cache a freshly read record
+        Skipped if a sweep ran since `token` was taken, because the row read
+        may predate a change that sweep has already accounted for
+        """
+        if not self.enabled:
+            return
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            if token != self._sweeps:
+                return
+            self._entries[username] = (expires_at, record)
+            self._entries.move_to_end(username)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters['evictions'] += 1
+
+    def invalidate(self, usernames):
+        """Drop the given usernames from the cache"""
+        with self._lock:
+            for username in usernames:
+                if self._entries.pop(username, None) is not None:
+                    self._counters['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def begin_sweep(self):
+        """
+        True if this caller should run an invalidation sweep now
+        Only one caller at a time wins; it must call end_sweep() afterwards
+        """
+        if not self.enabled or time.monotonic() - self._last_sweep < self.sweep_interval:
+            return False
+        if not self._sweep_lock.acquire(blocking=False):
+            return False
+        if time.monotonic() - self._last_sweep < self.sweep_interval:
+            self._sweep_lock.release()
+            return False
+        return True
+
+    def end_sweep(self, changed_usernames=(), watermark=None, error=False):
+        """
+        Finish a sweep started with begin_sweep()
+        On the first sweep (no watermark yet) everything cached so far is
+        dropped, since there was no baseline to compare it against
+        """
+        try:
+            if error:
+                self._counters['sweep_errors'] += 1
+                return
+            with self._lock:
+                if self.watermark is None:
+                    self._entries.clear()
+                else:
+                    for username in changed_usernames:
+                        if self._entries.pop(username, None) is not None:
+                            self._counters['invalidations'] += 1
+                if watermark is not None:
+                    self.watermark = watermark
+                self._sweeps += 1
+                self._counters['sweeps'] += 1
+        finally:
+            self._last_sweep = time.monotonic()
+            self._sweep_lock.release()
+
+    def stats(self):
+        """Snapshot of size, settings and counters"""
+        with self._lock:
+            stats = {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'sweep_interval': self.sweep_interval,
+                'watermark': self.watermark.isoformat() if hasattr(self.watermark, 'isoformat') else self.watermark,
+            }
+            stats.update(self._counters)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else None
+        return stats
@@ -0,0 +1,204 @@
+"""
+User Change Feed
+Append-only log of user and subscription changes (the user_changes table, see
+03_mysql_setup.sh). Writers add a row in the same transaction as the change;
+caches, gateways and replicas follow the log by cursor (the last row id they
+saw), so catching up costs O(changes) instead of a scan over users.
+"""
+
+import os
+import threading
+import time
+
+from . import db
+
+COLUMNS = ('id', 'user_id', 'username', 'status', 'expiry', 'source', 'changed_at')
+
+# Seconds since a row was logged, by connection dialect (see storage.py)
+AGE_SQL = {
+    'mysql': "TIMESTAMPDIFF(MICROSECOND, changed_at, NOW(6)) / 1000000",
+    'sqlite': "(julianday('now', 'localtime') - julianday(changed_at)) * 86400",
+}
+
+
+class CursorExpired(Exception):
+    """The cursor points at log rows that were already pruned; resync from scratch"""
+
+
+def record(cursor, where, params, source, status=None):
+    """
+    Log the users rows matching `where` with one INSERT ... SELECT; call it in
+    the transaction that makes the change. status overrides the logged status,
+    so a change can be logged just before the UPDATE that applies it.
+    Returns the number of rows logged
+    """
+    status_sql = '%s' if status is not None else 'status'
+    status_params = (status,) if status is not None else ()
+    cursor.execute(f"""
+        INSERT INTO user_changes (user_id, username, status, expiry, source)
+        SELECT id, username, {status_sql}, expiry, %s
+        FROM users
+        WHERE {where}
+    """, status_params + (source,) + tuple(params))
+    return cursor.rowcount
+
+
+def latest_id(conn):
+    """Cursor of the newest change (0 when the log is empty)"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM user_changes")
+    value = cursor.fetchone()[0]
+    cursor.close()
+    conn.commit()
+    return int(value)
+
+
+def fetch(conn, since, limit=500, gap_wait=5):
+    """
+    Changes after cursor `since`, oldest first; returns (changes, next cursor)
+
+    An AUTO_INCREMENT id is taken when a row is inserted but only becomes
+    visible at commit, so a missing id may be a change that is about to
+    appear. Reading stops before a gap until the row after it is gap_wait
+    seconds old; older gaps are rollbacks or unused ids and are skipped.
+    gap_wait must exceed the longest transaction that writes the log.
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT MIN(id) FROM user_changes")
+    oldest = cursor.fetchone()[0]
+    if oldest is not None and since + 1 < oldest:
+        cursor.close()
+        conn.commit()
+        raise CursorExpired(f"Changes after {since} are no longer retained (oldest is {oldest})")
+
+    cursor.execute(f"""
+        SELECT id, user_id, username, status, expiry, source, changed_at,
+               {AGE_SQL[db.dialect(conn)]} AS age
+        FROM user_changes
+        WHERE id > %s
+        ORDER BY id
+        LIMIT %s
+    """, (since, limit))
+    rows = cursor.fetchall()
+    cursor.close()
+    conn.commit()
+
+    changes = []
+    next_id = since
+    for row in rows:
+        if row[0] != next_id + 1 and float(row[-1]) < gap_wait:
+            break
+        change = dict(zip(COLUMNS, row))
+        change['expiry'] = change['expiry'].strftime('%Y-%m-%d') if change['expiry'] else None
+        change['changed_at'] = change['changed_at'].isoformat()
+        changes.append(change)
+        next_id = row[0]
+    return changes, next_id
+
+
+def prune(conn, older_than_days, batch_size=5000):
+    """Delete log rows older than older_than_days, a batch per transaction; returns rows deleted"""
+    if db.dialect(conn) == 'sqlite':
+        # Stock SQLite builds have no DELETE ... ORDER BY ... LIMIT
+        sql = """
+            DELETE FROM user_changes
+            WHERE id IN (
+                SELECT id FROM user_changes
+                WHERE changed_at < datetime('now', 'localtime', %s)
+                ORDER BY id
+                LIMIT %s
+            )
+        """
+        params = (f'-{int(older_than_days)} days', batch_size)
+    else:
+        sql = """
+            DELETE FROM user_changes
+            WHERE changed_at < NOW() - INTERVAL %s DAY
+            ORDER BY id
+            LIMIT %s
+        """
+        params = (older_than_days, batch_size)
+    cursor = conn.cursor()
+    deleted = 0
+    while True:
+        cursor.execute(sql, params)
+        conn.commit()
+        deleted += cursor.rowcount
+        if cursor.rowcount < batch_size:
+            break
+    cursor.close()
+    return deleted
+
+
+class ChangeWatcher:
+    """
+    Tracks the newest change id with one cheap query every poll_interval
+    seconds, so any number of long-poll requests wait in memory instead of
+    each polling the database
+
+    latest - callable returning the newest change id (raises on failure)
+    """
+
+    def __init__(self, latest, poll_interval=0.5):
+        self.latest = latest
+        self.poll_interval = poll_interval
+
+        self._cond = threading.Condition()
+        self._pid = None
+        self._latest_id = None
+        self._listeners = []
+
+    def start(self):
+        """Start the polling thread (again in a forked child, where it does not survive)"""
+        with self._cond:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        self.poll()
+        threading.Thread(target=self._run, name='change-watcher', daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.poll_interval)
+            self.poll()
+
+    def poll(self):
+        """Read the newest id once and wake waiters if it moved"""
+        try:
+            value = self.latest()
+        except Exception:
+            return
+        with self._cond:
+            if value == self._latest_id:
+                return
+            self._latest_id = value
+            listeners = list(self._listeners)
+            self._cond.notify_all()
+        for listener in listeners:
+            listener()
+
+    def latest_id(self):
+        """Newest change id seen by the last successful poll (None before the first)"""
+        with self._cond:
+            return self._latest_id
+
+    def wait(self, since, timeout):
+        """Block until a change newer than since is known or timeout passes; True if there is one"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._latest_id is None or self._latest_id <= since:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def add_listener(self, callback):
+        """Call callback() from the polling thread whenever the newest id moves"""
+        with self._cond:
+            self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        with self._cond:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
@@ -0,0 +1,130 @@
+"""
+Multi-Worker Health Registry
+Each pre-forked API worker writes a small heartbeat file; the master process
+folds them into a single cluster summary that any worker can serve from /status
+"""
+
+import json
+import os
+import tempfile
+import time
+
+SUMMARY_FILE = 'cluster.json'
+
+
+def _write_json(path, data):
+    """Atomically replace path with data serialized as JSON"""
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, default=str)
+        os.replace(tmp_path, path)
+    except Exception:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class HealthRegistry:
+    """
+    Heartbeat files in a shared directory
+
+    directory   - writable directory shared by the master and its workers
+    stale_after - seconds without a heartbeat before a worker counts as unhealthy
+    """
+
+    def __init__(self, directory, stale_after=10):
+        self.directory = directory
+        self.stale_after = stale_after
+
+    def _worker_path(self, pid):
+        return os.path.join(self.directory, f'worker-{pid}.json')
+
+    def reset(self):
+        """Create the directory and drop heartbeats left by a previous master"""
+        os.makedirs(self.directory, exist_ok=True)
+        for name in os.listdir(self.directory):
+            if name.startswith('worker-') or name == SUMMARY_FILE:
+                try:
+                    os.unlink(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    def heartbeat(self, pid, data):
+        """Record the current state of one worker"""
+        record = dict(data)
+        record['pid'] = pid
+        record['heartbeat'] = time.time()
+        _write_json(self._worker_path(pid), record)
+
+    def remove(self, pid):
+        try:
+            os.unlink(self._worker_path(pid))
+        except FileNotFoundError:
+            pass
+
+    def workers(self):
+        """Heartbeat records of all workers, each marked healthy or not"""
+        now = time.time()
+        records = []
+        for name in sorted(os.listdir(self.directory)):
+            if not (name.startswith('worker-') and name.endswith('.json')):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    record = json.load(f)
+            except (OSError, ValueError):
+                continue
+            age = now - record.get('heartbeat', 0)
+            record['heartbeat_age'] = round(age, 3)
+            record['healthy'] = age <= self.stale_after and _pid_alive(record.get('pid', 0))
+            records.append(record)
+        return records
+
+    def aggregate(self, master_pid, expected_workers):
+        """Build and store the cluster summary (called by the master)"""
+        workers = self.workers()
+        for record in workers:
+            if not _pid_alive(record.get('pid', 0)):
+                self.remove(record['pid'])
+        # Metric snapshots are merged by /metrics; keep the summary small
+        workers = [
+            {key: value for key, value in record.items() if key != 'metrics'}
+            for record in workers if _pid_alive(record.get('pid', 0))
+        ]
+        healthy = sum(1 for record in workers if record['healthy'])
+        summary = {
+            'master_pid': master_pid,
+            'expected_workers': expected_workers,
+            'running_workers': len(workers),
+            'healthy_workers': healthy,
+            'status': 'healthy' if healthy >= expected_workers else 'degraded',
+            'requests_total': sum(record.get('requests', 0) for record in workers),
+            'updated': time.time(),
+            'workers': workers,
+        }
+        _write_json(os.path.join(self.directory, SUMMARY_FILE), summary)
+        return summary
+
+    def summary(self):
+        """Last cluster summary written by the master, or None"""
+        try:
+            with open(os.path.join(self.directory, SUMMARY_FILE)) as f:
+                summary = json.load(f)
+        except (OSError, ValueError):
+            return None
+        summary['age'] = round(time.time() - summary.get('updated', 0), 3)
+        return summary
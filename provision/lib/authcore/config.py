@@ -0,0 +1,132 @@
+"""
+Environment Configuration
+Parses the shared .venv file once and re-parses it only when it changes on disk
+"""
+
+import os
+import sys
+import threading
+import time
+
+DEFAULT_ENV_PATH = os.environ.get('DEMO_ENV_FILE', '/etc/demo/.venv')
+
+# Fallbacks used when a key is missing from the .venv file
+# (kept in line with 03_mysql_setup.sh)
+DEFAULTS = {
+    'DB_HOST': 'localhost',
+    'DB_NAME': 'auth_server',
+    'DB_USER': 'auth_admin',
+    'DB_PASS': '',
+}
+
+
+def parse_env_file(env_path):
+    """Parse KEY=VALUE lines from a .venv file into a dict"""
+    env_vars = {}
+    with open(env_path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                key, value = line.split('=', 1)
+                env_vars[key.strip()] = value.strip().strip('"\'')
+    return env_vars
+
+
+class EnvConfig:
+    """
+    Cached view of one .venv file
+
+    The file is stat()ed at most once per `check_interval` seconds and only
+    re-parsed when its mtime or size changed. Each reload swaps in a new dict,
+    so a snapshot obtained by a caller never changes underneath it.
+    """
+
+    def __init__(self, env_path, check_interval=1.0):
+        self.env_path = env_path
+        self.check_interval = check_interval
+        self.version = 0
+        self._values = None
+        self._signature = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._listeners = []
+
+    def values(self):
+        """Current settings (a dict that must be treated as read-only)"""
+        now = time.monotonic()
+        if self._values is None or now - self._checked_at >= self.check_interval:
+            self._refresh(now)
+        return self._values
+
+    def get(self, key, default=None):
+        values = self.values()
+        if key in values:
+            return values[key]
+        if default is None:
+            return DEFAULTS.get(key)
+        return default
+
+    def get_int(self, key, default):
+        return int(self.get(key, default))
+
+    def get_float(self, key, default):
+        return float(self.get(key, default))
+
+    def get_bool(self, key, default):
+        value = self.get(key, default)
+        if isinstance(value, bool):
+            return value
+        return str(value).strip().lower() in ('1', 'true', 'yes', 'on')
+
+    def on_reload(self, callback):
+        """Register callback(config) to run after the file has been re-parsed"""
+        self._listeners.append(callback)
+
+    def _refresh(self, now):
+        with self._lock:
+            if self._values is not None and now - self._checked_at < self.check_interval:
+                return
+            st = os.stat(self.env_path)
+            signature = (st.st_mtime_ns, st.st_size)
+            self._checked_at = now
+            if signature == self._signature:
+                return
+            values = parse_env_file(self.env_path)
+            reloaded = self._values is not None
+            self._values = values
+            self._signature = signature
+            self.version += 1
+
+        if reloaded:
+            for callback in list(self._listeners):
+                callback(self)
+
+
+_configs = {}
+_configs_lock = threading.Lock()
+
+
+def get_config(env_path=None):
+    """Shared EnvConfig for env_path (defaults to DEMO_ENV_FILE or /etc/demo/.venv)"""
+    env_path = env_path or DEFAULT_ENV_PATH
+    config = _configs.get(env_path)
+    if config is None:
+        with _configs_lock:
+            config = _configs.get(env_path)
+            if config is None:
+                config = EnvConfig(env_path)
+                _configs[env_path] = config
+    return config
+
+
+def load_env_file(env_path=None):
+    """Load environment variables from .venv file, exiting if it is unreadable"""
+    env_path = env_path or DEFAULT_ENV_PATH
+    try:
+        return get_config(env_path).values()
+    except FileNotFoundError:
+        print(f"❌ Error: Environment file not found at {env_path}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"❌ Error reading environment file: {e}")
+        sys.exit(1)
@@ -0,0 +1,151 @@
+"""
+Database Access
+Connection helpers shared by the API, the subscription updater and the CLI
+mysql.connector is only imported once a connection is actually opened
+"""
+
+import os
+import threading
+
+from .config import get_config
+from .pool import ConnectionPool
+
+
+def __getattr__(name):
+    # db.Error resolves to mysql.connector.Error without importing the driver
+    # at module load; `except db.Error` is only evaluated when something raised
+    if name == 'Error':
+        import mysql.connector
+        return mysql.connector.Error
+    raise AttributeError(f"module 'authcore.db' has no attribute '{name}'")
+
+
+def connection_settings(config):
+    """MySQL connect() keyword arguments from a config"""
+    return {
+        'host': config.get('DB_HOST'),
+        'database': config.get('DB_NAME'),
+        'user': config.get('DB_USER'),
+        'password': config.get('DB_PASS'),
+    }
+
+
+def pool_settings(config):
+    """ConnectionPool keyword arguments from a config"""
+    return {
+        'size': config.get_int('DB_POOL_SIZE', 5),
+        'max_overflow': config.get_int('DB_POOL_MAX_OVERFLOW', 10),
+        'timeout': config.get_float('DB_POOL_TIMEOUT', 5),
+        'recycle': config.get_int('DB_POOL_RECYCLE', 3600),
+        'pre_ping': config.get_bool('DB_POOL_PRE_PING', True),
+    }
+
+
+def dialect(conn):
+    """SQL dialect of a connection: 'mysql', or 'sqlite' for a storage.SQLiteConnection"""
+    return getattr(conn, 'dialect', 'mysql')
+
+
+def connect(autocommit=True, env_path=None, config=None):
+    """Open a new, unpooled MySQL connection"""
+    import mysql.connector
+
+    config = config or get_config(env_path)
+    return mysql.connector.connect(autocommit=autocommit, **connection_settings(config))
+
+
+class _PoolHolder:
+    """Owns the pool for one config and swaps it when DB settings change"""
+
+    def __init__(self, config):
+        self.config = config
+        self.pool = None
+        self.settings = None
+        self.lock = threading.RLock()
+        config.on_reload(self._on_reload)
+
+    def get(self):
+        pool = self.pool
+        if pool is None:
+            with self.lock:
+                if self.pool is None:
+                    self._install(self._current_settings())
+                pool = self.pool
+        return pool
+
+    def _current_settings(self):
+        return connection_settings(self.config), pool_settings(self.config)
+
+    def _install(self, settings):
+        connect_kwargs, pool_kwargs = settings
+
+        def connect_fn():
+            import mysql.connector
+            return mysql.connector.connect(autocommit=True, **connect_kwargs)
+
+        old = self.pool
+        # Readers pick up the new pool with a single reference swap; requests
+        # holding connections from the old pool return them to it, and the
+        # closed pool disposes of them
+        self.pool = ConnectionPool(connect_fn, **pool_kwargs)
+        self.settings = settings
+        if old is not None:
+            old.close()
+
+    def _on_reload(self, config):
+        with self.lock:
+            if self.pool is None:
+                return
+            settings = self._current_settings()
+            if settings != self.settings:
+                self._install(settings)
+
+    def close(self):
+        with self.lock:
+            if self.pool is not None:
+                self.pool.close()
+                self.pool = None
+                self.settings = None
+
+
+_holders = {}
+_holders_lock = threading.Lock()
+
+
+def get_pool(env_path=None):
+    """Shared connection pool for the given .venv file, created on first use"""
+    config = get_config(env_path)
+    holder = _holders.get(config.env_path)
+    if holder is None:
+        with _holders_lock:
+            holder = _holders.get(config.env_path)
+            if holder is None:
+                holder = _PoolHolder(config)
+                _holders[config.env_path] = holder
+    # Touch the config so a changed file is noticed (and the pool swapped)
+    config.values()
+    return holder.get()
+
+
+def close_pool(env_path=None):
+    """Close the shared pool; the next get_pool() call creates a fresh one"""
+    config = get_config(env_path)
+    holder = _holders.get(config.env_path)
+    if holder is not None:
+        holder.close()
+
+
+def _reset_after_fork():
+    """
+    A forked child inherits its parent's pools, whose sockets are shared with
+    the parent. Drop them without closing (closing would end the parent's
+    sessions) so each worker process lazily builds its own pool.
+    """
+    for holder in list(_holders.values()):
+        holder.pool = None
+        holder.settings = None
+        holder.lock = threading.RLock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
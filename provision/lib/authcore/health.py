@@ -0,0 +1,93 @@
+"""
+Background Health Prober
+Runs a dependency check (e.g. a database round trip) on a fixed interval in a
+daemon thread and caches the outcome, so health endpoints answer from memory
+and probe traffic never reaches the database
+"""
+
+import os
+import threading
+import time
+
+
+class HealthProber:
+    """
+    Periodically run check() and remember the result
+
+    check       - callable that raises on failure; its return value is ignored
+    interval    - seconds between checks
+    stale_after - seconds after which a result no longer counts as healthy
+                  (covers a prober thread that is stuck inside check())
+    """
+
+    def __init__(self, check, interval=5, stale_after=None):
+        self.check = check
+        self.interval = interval
+        self.stale_after = stale_after if stale_after is not None else interval * 3
+
+        self._lock = threading.Lock()
+        self._pid = None
+        self._result = {
+            'healthy': False,
+            'checked_at': None,
+            'latency_ms': None,
+            'last_error': None,
+            'last_error_at': None,
+            'last_success_at': None,
+            'consecutive_failures': 0,
+            'checks': 0,
+        }
+
+    def start(self):
+        """
+        Run a first check synchronously and start the prober thread
+        Also restarts the thread in a forked child, where it does not survive
+        """
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        self.probe()
+        threading.Thread(target=self._run, name='health-prober', daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.probe()
+
+    def probe(self):
+        """Run the check once and record the outcome"""
+        started = time.perf_counter()
+        error = None
+        try:
+            self.check()
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        latency_ms = round((time.perf_counter() - started) * 1000, 3)
+        now = time.time()
+
+        with self._lock:
+            result = self._result
+            result['checks'] += 1
+            result['checked_at'] = now
+            result['latency_ms'] = latency_ms
+            if error is None:
+                result['healthy'] = True
+                result['last_success_at'] = now
+                result['consecutive_failures'] = 0
+            else:
+                result['healthy'] = False
+                result['last_error'] = error
+                result['last_error_at'] = now
+                result['consecutive_failures'] += 1
+
+    def result(self):
+        """Copy of the last result, with its age; healthy is False once it is stale"""
+        with self._lock:
+            result = dict(self._result)
+        checked_at = result['checked_at']
+        result['age'] = round(time.time() - checked_at, 3) if checked_at else None
+        if result['age'] is None or result['age'] > self.stale_after:
+            result['healthy'] = False
+        result['interval'] = self.interval
+        return result
@@ -0,0 +1,151 @@
+"""
+Signed License Tokens
+Compact Ed25519-signed tokens stating a user's subscription, so clients can
+check it offline for a short validity window instead of calling the API on
+every launch. The server signs with a private key; clients only hold the
+public key and can verify but never mint tokens.
+
+Token: base64url(JSON claims) "." base64url(signature)
+Claims: v (format), uid, sub (username), st (status), exp (expiry date or
+null), iat (issued at), vu (valid until, never past the expiry date), cv
+(credential version: changes with the user's password, so a refresh after a
+password reset is refused)
+
+Requires the optional 'cryptography' package.
+Keys are PEM files, e.g.:
+    openssl genpkey -algorithm ed25519 -out license_key.pem
+    openssl pkey -in license_key.pem -pubout -out license_public.pem
+"""
+
+import base64
+import hashlib
+import json
+import time
+from datetime import date, datetime, timedelta
+
+TOKEN_VERSION = 1
+
+
+class LicenseError(Exception):
+    """Token is malformed, has a bad signature, or is not usable"""
+
+
+def _crypto():
+    try:
+        from cryptography.exceptions import InvalidSignature
+        from cryptography.hazmat.primitives import serialization
+    except ImportError:
+        raise LicenseError("License tokens require the 'cryptography' package (pip install cryptography)")
+    return serialization, InvalidSignature
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def expiry_cutoff(expiry):
+    """Epoch seconds at which a subscription expiring on `expiry` (a date) ends"""
+    return datetime.combine(expiry + timedelta(days=1), datetime.min.time()).timestamp()
+
+
+def credential_version(password_hash):
+    """Short digest of a user's stored password hash, for the cv claim"""
+    return hashlib.sha256(password_hash.encode()).hexdigest()[:16]
+
+
+def _parse_expiry(expiry):
+    if expiry is None or isinstance(expiry, date):
+        return expiry.date() if isinstance(expiry, datetime) else expiry
+    return datetime.strptime(expiry, '%Y-%m-%d').date()
+
+
+class LicenseVerifier:
+    """Checks token signatures against a public key (PEM bytes)"""
+
+    def __init__(self, public_key_pem):
+        serialization, self._invalid_signature = _crypto()
+        self._public_key = serialization.load_pem_public_key(public_key_pem)
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, 'rb') as f:
+            return cls(f.read())
+
+    def decode(self, token):
+        """Claims of a correctly signed token, whether or not it is still valid"""
+        try:
+            payload_b64, signature_b64 = token.split('.')
+            payload = _b64decode(payload_b64)
+            signature = _b64decode(signature_b64)
+        except (AttributeError, ValueError):
+            raise LicenseError("Malformed license token")
+        try:
+            self._public_key.verify(signature, payload)
+        except self._invalid_signature:
+            raise LicenseError("Invalid license token signature")
+        claims = json.loads(payload)
+        if claims.get('v') != TOKEN_VERSION:
+            raise LicenseError(f"Unsupported license token version {claims.get('v')}")
+        return claims
+
+    def verify(self, token, now=None):
+        """Claims of a signed token that is still inside its validity window"""
+        claims = self.decode(token)
+        now = time.time() if now is None else now
+        if now >= claims['vu']:
+            raise LicenseError("License token expired")
+        if claims['iat'] > now + 300:
+            raise LicenseError("License token issued in the future (check the system clock)")
+        return claims
+
+
+class LicenseSigner(LicenseVerifier):
+    """
+    Issues tokens with a private key (PEM bytes)
+
+    ttl - seconds a token stays valid; clients must come back after that
+    """
+
+    def __init__(self, private_key_pem, ttl=86400):
+        serialization, self._invalid_signature = _crypto()
+        self._private_key = serialization.load_pem_private_key(private_key_pem, password=None)
+        self._public_key = self._private_key.public_key()
+        self.ttl = ttl
+
+    @classmethod
+    def from_file(cls, path, ttl=86400):
+        with open(path, 'rb') as f:
+            return cls(f.read(), ttl)
+
+    def public_key_pem(self):
+        serialization, _ = _crypto()
+        return self._public_key.public_bytes(
+            serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
+
+    def issue(self, user_id, username, status, expiry, credentials=None, now=None):
+        """
+        Token for an active subscription; valid for ttl seconds, but never
+        past the end of the expiry date the subscription updater enforces
+        credentials - credential_version() of the user's stored password hash
+        """
+        now = int(time.time() if now is None else now)
+        expiry = _parse_expiry(expiry)
+        valid_until = now + self.ttl
+        if expiry is not None:
+            valid_until = min(valid_until, int(expiry_cutoff(expiry)))
+        claims = {
+            'v': TOKEN_VERSION,
+            'uid': user_id,
+            'sub': username,
+            'st': status,
+            'exp': expiry.strftime('%Y-%m-%d') if expiry else None,
+            'iat': now,
+            'vu': valid_until,
+            'cv': credentials,
+        }
+        payload = json.dumps(claims, separators=(',', ':'), sort_keys=True).encode()
+        return f"{_b64encode(payload)}.{_b64encode(self._private_key.sign(payload))}"
@@ -0,0 +1,246 @@
+"""
+Structured Logging
+Queue-backed logging: callers only format a record and put it on a bounded
+queue, a background thread does the actual writing. Records carry key=value
+fields, debug records can be sampled, and secret-looking fields are redacted.
+
+    log = get_logger('api')
+    log.info("Authentication successful", user=username, result=200)
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+# Field names whose values are never written out, alone or as the last
+# underscore-separated word (api_key, new_password; not key_path or tokens)
+SECRET_FIELDS = ('password', 'passwd', 'hash', 'secret', 'token', 'key')
+
+_state = {
+    'listener': None,
+    'queue': None,
+    'handler': None,
+    'settings': None,
+    'debug_sample_rate': 1.0,
+}
+_lock = threading.Lock()
+
+
+class StructuredLogger(logging.LoggerAdapter):
+    """Logger adapter that turns keyword arguments into structured fields"""
+
+    _RESERVED = ('exc_info', 'stack_info', 'stacklevel', 'extra')
+
+    def debug(self, msg, *args, **kwargs):
+        # Sample before a LogRecord is even built; that is most of the cost
+        rate = _state['debug_sample_rate']
+        if rate < 1 and random.random() >= rate:
+            return
+        self.log(logging.DEBUG, msg, *args, **kwargs)
+
+    def process(self, msg, kwargs):
+        fields = {key: kwargs.pop(key) for key in list(kwargs) if key not in self._RESERVED}
+        extra = dict(kwargs.get('extra') or {})
+        if fields:
+            extra['fields'] = dict(extra.get('fields') or {}, **fields)
+        kwargs['extra'] = extra
+        return msg, kwargs
+
+    def isEnabledFor(self, level):
+        return self.logger.isEnabledFor(level)
+
+
+def _redact(fields):
+    return {
+        key: '[redacted]' if key.lower().rsplit('_', 1)[-1] in SECRET_FIELDS else value
+        for key, value in fields.items()
+    }
+
+
+class TextFormatter(logging.Formatter):
+    """`2024-01-01 12:00:00 INFO api: message key=value ...`"""
+
+    def format(self, record):
+        line = f"{self.formatTime(record, '%Y-%m-%d %H:%M:%S')} {record.levelname} {record.name}: {record.getMessage()}"
+        fields = getattr(record, 'fields', None)
+        if fields:
+            line += ' ' + ' '.join(f"{key}={value}" for key, value in _redact(fields).items())
+        if record.exc_info:
+            line += '\n' + self.formatException(record.exc_info)
+        return line
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record):
+        data = {
+            'ts': round(record.created, 6),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'pid': record.process,
+        }
+        fields = getattr(record, 'fields', None)
+        if fields:
+            data.update(_redact(fields))
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Let through only a fraction of records at or below `level`
+    (covers plain logging.getLogger() callers; StructuredLogger samples earlier)
+    """
+
+    def __init__(self, rate, level=logging.DEBUG):
+        super().__init__()
+        self.rate = rate
+        self.level = level
+
+    def filter(self, record):
+        if record.levelno > self.level or self.rate >= 1:
+            return True
+        return random.random() < self.rate
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks: when the queue is full the record is dropped and counted"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Render the message now (args may change later) but skip the
+        # formatting the base class does; the listener thread formats
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_text = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _ExcTextFormatter(logging.Formatter):
+    """Wraps a formatter so pre-rendered exception text (exc_text) is kept"""
+
+    def __init__(self, inner):
+        super().__init__()
+        self.inner = inner
+
+    def format(self, record):
+        text = self.inner.format(record)
+        if record.exc_text and not record.exc_info:
+            text += '\n' + record.exc_text
+        return text
+
+
+def setup_logging(level='INFO', fmt='text', debug_sample_rate=1.0, stream=None, queue_size=10000):
+    """
+    Route all loggers through a background writer thread
+    Safe to call more than once; later calls replace the settings
+    """
+    with _lock:
+        _stop_listener()
+
+        # Skip per-record work nobody reads (see "Optimization" in the logging HOWTO)
+        logging._srcfile = None
+        logging.logThreads = False
+        logging.logMultiprocessing = False
+
+        log_queue = queue.Queue(maxsize=queue_size)
+        handler = DroppingQueueHandler(log_queue)
+        if debug_sample_rate < 1:
+            handler.addFilter(SamplingFilter(debug_sample_rate))
+
+        output = logging.StreamHandler(stream or sys.stdout)
+        formatter = JSONFormatter() if fmt == 'json' else TextFormatter()
+        output.setFormatter(_ExcTextFormatter(formatter))
+
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            if isinstance(existing, DroppingQueueHandler):
+                root.removeHandler(existing)
+        root.addHandler(handler)
+        root.setLevel(level.upper() if isinstance(level, str) else level)
+
+        listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=False)
+        listener.start()
+
+        _state.update(listener=listener, queue=log_queue, handler=handler,
+                      debug_sample_rate=debug_sample_rate,
+                      settings=(level, fmt, debug_sample_rate, stream, queue_size))
+
+
+def setup_from_config(config, stream=None):
+    """setup_logging() using LOG_LEVEL, LOG_FORMAT and LOG_DEBUG_SAMPLE_RATE"""
+    setup_logging(
+        level=config.get('LOG_LEVEL', 'INFO'),
+        fmt=config.get('LOG_FORMAT', 'text'),
+        debug_sample_rate=config.get_float('LOG_DEBUG_SAMPLE_RATE', 1.0),
+        stream=stream,
+        queue_size=config.get_int('LOG_QUEUE_SIZE', 10000),
+    )
+
+
+def get_logger(name):
+    return StructuredLogger(logging.getLogger(name), {})
+
+
+def stats():
+    handler = _state['handler']
+    log_queue = _state['queue']
+    return {
+        'queued': log_queue.qsize() if log_queue is not None else 0,
+        'dropped': handler.dropped if handler is not None else 0,
+    }
+
+
+def flush(timeout=5.0):
+    """Wait until the writer thread has drained the queue"""
+    log_queue = _state['queue']
+    deadline = time.monotonic() + timeout
+    while log_queue is not None and not log_queue.empty() and time.monotonic() < deadline:
+        time.sleep(0.005)
+
+
+def _stop_listener():
+    listener = _state['listener']
+    if listener is not None:
+        try:
+            listener.stop()
+        except Exception:
+            pass
+        _state['listener'] = None
+
+
+def _restart_after_fork():
+    # The writer thread does not survive fork(); give the child its own
+    global _lock
+    _lock = threading.Lock()
+    settings = _state['settings']
+    if settings is not None:
+        _state['listener'] = None
+        setup_logging(*settings)
+
+
+atexit.register(_stop_listener)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_after_fork)
@@ -0,0 +1,191 @@
+"""
+Schema Migrations
+Versioned schema changes applied in order and recorded in the
+schema_migrations table. Every step checks the live schema before acting,
+so migrations are idempotent: re-running them, or running them after a
+restore of a backup taken before or after they were applied, is safe.
+
+Run at provisioning (06_finalize.sh) and after restores:
+    PYTHONPATH=/usr/local/lib/demo python3 -m authcore.migrations [--status] [--dry-run]
+"""
+
+import argparse
+import sys
+
+from . import db
+
+LOCK_NAME = 'demo_schema_migrations'
+
+
+def index_columns(cursor, table, name):
+    """Columns of an index in order, or None if the index does not exist"""
+    cursor.execute("""
+        SELECT column_name
+        FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+        ORDER BY seq_in_index
+    """, (table, name))
+    columns = [row[0] for row in cursor.fetchall()]
+    return columns or None
+
+
+def add_index(cursor, table, name, columns, dry_run=False):
+    """Create an index online unless it exists; returns a description of what was done"""
+    if index_columns(cursor, table, name):
+        return None
+    if not dry_run:
+        cursor.execute(f"ALTER TABLE {table} ADD INDEX {name} ({', '.join(columns)}), "
+                       f"ALGORITHM=INPLACE, LOCK=NONE")
+    return f"add index {table}.{name} ({', '.join(columns)})"
+
+
+def drop_index(cursor, table, name, dry_run=False):
+    """Drop an index if it exists; returns a description of what was done"""
+    if not index_columns(cursor, table, name):
+        return None
+    if not dry_run:
+        cursor.execute(f"ALTER TABLE {table} DROP INDEX {name}, ALGORITHM=INPLACE, LOCK=NONE")
+    return f"drop index {table}.{name}"
+
+
+def tune_user_indexes(cursor, dry_run=False):
+    """
+    - idx_username duplicated the UNIQUE key on username: every write paid
+      for the same B-tree twice
+    - idx_status_expiry (status, expiry) serves the updater's
+      status = ... AND expiry < / >= / IS NULL predicates with one range scan,
+      and replaces the single-column idx_status (a prefix of it) and idx_expiry
+    - idx_auth_lookup covers every column the API's auth lookup selects, so a
+      multi-username lookup (/authenticate/batch) never touches the table rows.
+      A single-username lookup still resolves through the UNIQUE key (MySQL
+      reads unique-key equality as a constant row, one primary key hop)
+    """
+    return [
+        add_index(cursor, 'users', 'idx_status_expiry', ('status', 'expiry'), dry_run),
+        add_index(cursor, 'users', 'idx_auth_lookup',
+                  ('username', 'password', 'status', 'expiry', 'updated_at'), dry_run),
+        drop_index(cursor, 'users', 'idx_username', dry_run),
+        drop_index(cursor, 'users', 'idx_status', dry_run),
+        drop_index(cursor, 'users', 'idx_expiry', dry_run),
+    ]
+
+
+def add_replication_heartbeat(cursor, dry_run=False):
+    """
+    replication_heartbeat holds one row whose timestamp the API rewrites on
+    the primary every DB_REPLICA_CHECK_INTERVAL; on a replica, its clock minus
+    the replicated timestamp is the lag (replicas.py, DB_REPLICA_LAG_SOURCE)
+    """
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.tables
+        WHERE table_schema = DATABASE() AND table_name = 'replication_heartbeat'
+    """)
+    if cursor.fetchone()[0]:
+        return []
+    if not dry_run:
+        cursor.execute("""
+            CREATE TABLE replication_heartbeat (
+                id TINYINT UNSIGNED PRIMARY KEY,
+                beat TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6)
+            )
+        """)
+        cursor.execute("INSERT INTO replication_heartbeat (id, beat) VALUES (1, NOW(6))")
+    return ['create table replication_heartbeat']
+
+
+# (version, description, function(cursor, dry_run) -> list of actions taken)
+# Append new migrations; never renumber or edit one that has shipped
+MIGRATIONS = (
+    (1, 'Composite status/expiry and covering auth indexes, drop duplicate username index', tune_user_indexes),
+    (2, 'Replication heartbeat table for replica lag checks', add_replication_heartbeat),
+)
+
+
+def ensure_migrations_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            description VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def applied_versions(cursor):
+    """{version: applied_at} of the migrations recorded as applied"""
+    ensure_migrations_table(cursor)
+    cursor.execute("SELECT version, applied_at FROM schema_migrations")
+    return dict(cursor.fetchall())
+
+
+def migrate(conn, dry_run=False, lock_timeout=60):
+    """
+    Apply every pending migration in version order (conn should autocommit:
+    DDL commits implicitly anyway). Only one process migrates at a time.
+    Returns [(version, description, actions)] for the migrations applied
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT GET_LOCK(%s, %s)", (LOCK_NAME, lock_timeout))
+    if cursor.fetchone()[0] != 1:
+        cursor.close()
+        raise RuntimeError("Another process is running migrations")
+    try:
+        done = applied_versions(cursor)
+        results = []
+        for version, description, upgrade in MIGRATIONS:
+            if version in done:
+                continue
+            actions = [action for action in upgrade(cursor, dry_run) if action]
+            if not dry_run:
+                cursor.execute(
+                    "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                    (version, description))
+                conn.commit()
+            results.append((version, description, actions))
+        return results
+    finally:
+        cursor.execute("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+        cursor.fetchall()
+        cursor.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Apply pending database schema migrations')
+    parser.add_argument('--status', action='store_true', help='list migrations and exit')
+    parser.add_argument('--dry-run', action='store_true', help='show what would change without changing it')
+    args = parser.parse_args()
+
+    try:
+        conn = db.connect(autocommit=True)
+    except db.Error as e:
+        print(f"❌ Database connection failed: {e}")
+        sys.exit(1)
+
+    if args.status:
+        cursor = conn.cursor()
+        done = applied_versions(cursor)
+        cursor.close()
+        for version, description, upgrade in MIGRATIONS:
+            state = f"applied {done[version]}" if version in done else 'pending'
+            print(f"{version:>4}  {state:<28} {description}")
+        conn.close()
+        return
+
+    try:
+        results = migrate(conn, dry_run=args.dry_run)
+    except (db.Error, RuntimeError) as e:
+        print(f"❌ Migration failed: {e}")
+        conn.close()
+        sys.exit(1)
+    conn.close()
+
+    if not results:
+        print("✅ Database schema is up to date")
+    for version, description, actions in results:
+        print(f"{'🔍 Would apply' if args.dry_run else '✅ Applied'} migration {version}: {description}")
+        for action in actions or ['(schema already matched)']:
+            print(f"   - {action}")
+
+
+if __name__ == '__main__':
+    main()
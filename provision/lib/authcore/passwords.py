@@ -0,0 +1,233 @@
+"""
+Password Hashing
+Salted, cost-parameterized password hashes that name their algorithm, so
+several algorithms and cost settings can coexist in the users table while
+each user is upgraded on their next successful login
+
+Stored formats (salt and hash are unpadded base64):
+    pbkdf2_sha256$<iterations>$<salt>$<hash>
+    scrypt$<n>$<r>$<p>$<salt>$<hash>
+    <32 hex digits>                          legacy unsalted MD5, verify only
+
+The web pages (www/password_hash.php) understand pbkdf2_sha256 and MD5;
+keep the default on pbkdf2_sha256 while they are in use.
+"""
+
+import base64
+import hashlib
+import hmac
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_ALGORITHM = 'pbkdf2_sha256'
+DEFAULT_PBKDF2_ITERATIONS = 600000
+
+
+class VerifierBusy(Exception):
+    """Too many password checks are already queued"""
+
+
+def _b64encode(data):
+    return base64.b64encode(data).rstrip(b'=').decode()
+
+
+def _b64decode(text):
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+
+class PBKDF2Hasher:
+    algorithm = 'pbkdf2_sha256'
+
+    def __init__(self, iterations=DEFAULT_PBKDF2_ITERATIONS):
+        self.iterations = iterations
+
+    def encode(self, password, salt=None):
+        salt = salt or os.urandom(16)
+        digest = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, self.iterations)
+        return f"{self.algorithm}${self.iterations}${_b64encode(salt)}${_b64encode(digest)}"
+
+    def verify(self, password, encoded):
+        try:
+            algorithm, iterations, salt, digest = encoded.split('$')
+            salt, digest, iterations = _b64decode(salt), _b64decode(digest), int(iterations)
+        except ValueError:
+            return False
+        computed = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, iterations)
+        return hmac.compare_digest(computed, digest)
+
+    def needs_rehash(self, encoded):
+        return encoded.split('$')[1] != str(self.iterations)
+
+
+class ScryptHasher:
+    algorithm = 'scrypt'
+
+    def __init__(self, n=2 ** 15, r=8, p=1):
+        self.n = n
+        self.r = r
+        self.p = p
+
+    @staticmethod
+    def _derive(password, salt, n, r, p):
+        # hashlib's default 32 MiB memory cap is below what larger n need
+        return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                              maxmem=256 * n * r * p, dklen=32)
+
+    def encode(self, password, salt=None):
+        salt = salt or os.urandom(16)
+        digest = self._derive(password, salt, self.n, self.r, self.p)
+        return f"{self.algorithm}${self.n}${self.r}${self.p}${_b64encode(salt)}${_b64encode(digest)}"
+
+    def verify(self, password, encoded):
+        try:
+            algorithm, n, r, p, salt, digest = encoded.split('$')
+            computed = self._derive(password, _b64decode(salt), int(n), int(r), int(p))
+        except ValueError:
+            return False
+        return hmac.compare_digest(computed, _b64decode(digest))
+
+    def needs_rehash(self, encoded):
+        return encoded.split('$')[1:4] != [str(self.n), str(self.r), str(self.p)]
+
+
+class MD5Hasher:
+    """The original unsalted hex MD5; only kept to verify (and then replace) old hashes"""
+    algorithm = 'md5'
+
+    def encode(self, password, salt=None):
+        return hashlib.md5(password.encode()).hexdigest()
+
+    def verify(self, password, encoded):
+        return hmac.compare_digest(self.encode(password), encoded.lower())
+
+    def needs_rehash(self, encoded):
+        return True
+
+
+def identify(encoded):
+    """Algorithm name of a stored hash, or None if it is not recognised"""
+    if not encoded:
+        return None
+    if '$' in encoded:
+        return encoded.split('$', 1)[0]
+    if len(encoded) == 32 and all(c in '0123456789abcdefABCDEF' for c in encoded):
+        return 'md5'
+    return None
+
+
+class PasswordHasher:
+    """
+    Hashes new passwords with the configured algorithm and verifies any known one
+
+    algorithm - 'pbkdf2_sha256' or 'scrypt' for new and upgraded hashes
+    """
+
+    def __init__(self, algorithm=DEFAULT_ALGORITHM, pbkdf2_iterations=DEFAULT_PBKDF2_ITERATIONS,
+                 scrypt_n=2 ** 15, scrypt_r=8, scrypt_p=1):
+        self.hashers = {
+            'pbkdf2_sha256': PBKDF2Hasher(pbkdf2_iterations),
+            'scrypt': ScryptHasher(scrypt_n, scrypt_r, scrypt_p),
+            'md5': MD5Hasher(),
+        }
+        if algorithm not in ('pbkdf2_sha256', 'scrypt'):
+            raise ValueError(f"Unsupported password hash algorithm {algorithm!r}")
+        self.default = self.hashers[algorithm]
+        self._dummy_hash = None
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            algorithm=config.get('PASSWORD_HASH_ALGORITHM', DEFAULT_ALGORITHM),
+            pbkdf2_iterations=config.get_int('PASSWORD_PBKDF2_ITERATIONS', DEFAULT_PBKDF2_ITERATIONS),
+            scrypt_n=config.get_int('PASSWORD_SCRYPT_N', 2 ** 15),
+            scrypt_r=config.get_int('PASSWORD_SCRYPT_R', 8),
+            scrypt_p=config.get_int('PASSWORD_SCRYPT_P', 1),
+        )
+
+    def hash(self, password):
+        return self.default.encode(password)
+
+    def verify(self, password, encoded):
+        hasher = self.hashers.get(identify(encoded))
+        return hasher is not None and hasher.verify(password, encoded)
+
+    @property
+    def dummy_hash(self):
+        """
+        Hash of a random password at the configured cost: checking a password
+        for an unknown user against it takes as long as for a real user
+        """
+        if self._dummy_hash is None:
+            self._dummy_hash = self.hash(base64.b64encode(os.urandom(16)).decode())
+        return self._dummy_hash
+
+    def needs_rehash(self, encoded):
+        """Stored with another algorithm or other cost settings than the configured ones"""
+        return identify(encoded) != self.default.algorithm or self.default.needs_rehash(encoded)
+
+
+def available_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+class VerifierPool:
+    """
+    Bounded thread pool for password hashing work
+
+    hashlib's pbkdf2_hmac and scrypt release the GIL, so the threads really
+    run in parallel; the pool caps that at `workers` (default: available
+    cores), so a burst of logins queues here instead of starving every other
+    request of CPU. Beyond max_pending queued checks, submit() raises VerifierBusy.
+    """
+
+    def __init__(self, hasher, workers=None, max_pending=None):
+        self.hasher = hasher
+        self.workers = workers or available_cores()
+        self.max_pending = max_pending if max_pending is not None else self.workers * 16
+        self._lock = threading.Lock()
+        self._pid = None
+        self._executor = None
+        self._pending = 0
+        self._counters = {'verifications': 0, 'rejected': 0}
+
+    def _get_executor(self):
+        # Threads do not survive a fork: a forked worker builds its own pool
+        if self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password')
+            self._pid = os.getpid()
+            self._pending = 0
+        return self._executor
+
+    def _done(self, future):
+        with self._lock:
+            self._pending -= 1
+
+    def submit(self, fn, *args):
+        """Run fn(*args) on the pool; returns a Future"""
+        with self._lock:
+            executor = self._get_executor()
+            if self._pending >= self.workers + self.max_pending:
+                self._counters['rejected'] += 1
+                raise VerifierBusy("Too many password checks queued")
+            self._pending += 1
+        future = executor.submit(fn, *args)
+        future.add_done_callback(self._done)
+        return future
+
+    def verify_async(self, password, encoded):
+        """Future resolving to whether password matches the stored hash"""
+        with self._lock:
+            self._counters['verifications'] += 1
+        return self.submit(self.hasher.verify, password, encoded)
+
+    def verify(self, password, encoded):
+        return self.verify_async(password, encoded).result()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, workers=self.workers, pending=self._pending,
+                        max_pending=self.max_pending)
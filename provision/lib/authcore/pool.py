@@ -0,0 +1,252 @@
+"""
+Database Connection Pool
+Keeps long-lived MySQL connections around so request handlers do not pay
+a TCP handshake and login for every call
+"""
+
+import threading
+import time
+from collections import deque
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection could be checked out before the timeout"""
+
+
+class PoolClosed(Exception):
+    """Raised when a connection is requested from a closed pool"""
+
+
+class _Entry:
+    """Bookkeeping for one physical connection"""
+    __slots__ = ('raw', 'created_at', 'last_used')
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class PooledConnection:
+    """
+    Proxy handed out by the pool
+    Behaves like the underlying connection, but close() returns it to the pool
+    """
+
+    def __init__(self, pool, entry):
+        self._pool = pool
+        self._entry = entry
+
+    def __getattr__(self, name):
+        entry = self.__dict__.get('_entry')
+        if entry is None:
+            raise AttributeError(f"Connection already returned to pool (accessing '{name}')")
+        return getattr(entry.raw, name)
+
+    def close(self):
+        """Return the connection to the pool"""
+        entry, self._entry = self._entry, None
+        if entry is not None:
+            self._pool._release(entry)
+
+    def invalidate(self):
+        """Close the physical connection instead of returning it to the pool"""
+        entry, self._entry = self._entry, None
+        if entry is not None:
+            self._pool._release(entry, discard=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # The connection may be in an unknown state after an error
+            self.invalidate()
+        return False
+
+
+def _default_ping(conn):
+    return conn.is_connected()
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of database connections
+
+    connect      - zero-argument callable returning a new DB-API connection
+    size         - connections kept open while idle
+    max_overflow - extra connections opened under load, closed on return
+    timeout      - seconds to wait for a free connection before PoolTimeout
+    recycle      - reopen connections older than this many seconds (0 = never)
+    pre_ping     - check liveness of idle connections on checkout
+    """
+
+    def __init__(self, connect, size=5, max_overflow=10, timeout=5.0,
+                 recycle=3600, pre_ping=True, ping=_default_ping):
+        if size < 1:
+            raise ValueError("Pool size must be at least 1")
+        if max_overflow < 0:
+            raise ValueError("Pool max_overflow cannot be negative")
+
+        self._connect = connect
+        self._ping = ping
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+
+        self._idle = deque()
+        self._cond = threading.Condition()
+        self._open = 0          # physical connections (idle + checked out)
+        self._checked_out = 0
+        self._closed = False
+
+        self._counters = {
+            'checkouts': 0,
+            'connects': 0,
+            'connect_errors': 0,
+            'recycled': 0,
+            'ping_failures': 0,
+            'timeouts': 0,
+            'waits': 0,
+        }
+        self._wait_seconds = 0.0
+
+    def acquire(self):
+        """Check out a connection, waiting up to `timeout` seconds for one"""
+        deadline = time.monotonic() + self.timeout
+        waited = False
+        entry = None
+
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolClosed("Connection pool is closed")
+                if self._idle:
+                    # LIFO keeps the most recently used connections warm
+                    entry = self._idle.pop()
+                    break
+                if self._open < self.size + self.max_overflow:
+                    # Reserve a slot; the connect happens outside the lock
+                    self._open += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._counters['timeouts'] += 1
+                    raise PoolTimeout(
+                        f"No database connection available within {self.timeout}s "
+                        f"(size={self.size}, max_overflow={self.max_overflow})"
+                    )
+                if not waited:
+                    waited = True
+                    self._counters['waits'] += 1
+                wait_start = time.monotonic()
+                self._cond.wait(remaining)
+                self._wait_seconds += time.monotonic() - wait_start
+
+            self._checked_out += 1
+            self._counters['checkouts'] += 1
+
+        if entry is not None:
+            entry = self._check(entry)
+
+        if entry is None:
+            try:
+                entry = _Entry(self._connect())
+            except Exception:
+                with self._cond:
+                    self._open -= 1
+                    self._checked_out -= 1
+                    self._counters['connect_errors'] += 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._counters['connects'] += 1
+
+        return PooledConnection(self, entry)
+
+    def _check(self, entry):
+        """Return the entry if it is still usable, otherwise close it and return None"""
+        now = time.monotonic()
+        if self.recycle and now - entry.created_at > self.recycle:
+            self._close_raw(entry.raw)
+            with self._cond:
+                self._counters['recycled'] += 1
+            return None
+
+        if self.pre_ping:
+            try:
+                alive = self._ping(entry.raw)
+            except Exception:
+                alive = False
+            if not alive:
+                self._close_raw(entry.raw)
+                with self._cond:
+                    self._counters['ping_failures'] += 1
+                return None
+
+        return entry
+
+    def _release(self, entry, discard=False):
+        """Give a checked-out connection back to the pool"""
+        if not discard:
+            try:
+                # Never hand an open transaction to the next borrower
+                if getattr(entry.raw, 'in_transaction', False):
+                    entry.raw.rollback()
+            except Exception:
+                discard = True
+
+        with self._cond:
+            self._checked_out -= 1
+            keep = not discard and not self._closed and len(self._idle) < self.size
+            if keep:
+                entry.last_used = time.monotonic()
+                self._idle.append(entry)
+            else:
+                self._open -= 1
+            self._cond.notify()
+
+        if not keep:
+            self._close_raw(entry.raw)
+
+    @staticmethod
+    def _close_raw(raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    @property
+    def checked_out(self):
+        """Connections currently borrowed (read without the lock, so momentary)"""
+        return self._checked_out
+
+    def stats(self):
+        """Snapshot of pool occupancy and lifetime counters"""
+        with self._cond:
+            stats = {
+                'size': self.size,
+                'max_overflow': self.max_overflow,
+                'open': self._open,
+                'idle': len(self._idle),
+                'checked_out': self._checked_out,
+                'overflow': max(0, self._open - self.size),
+                'wait_seconds_total': round(self._wait_seconds, 6),
+            }
+            stats.update(self._counters)
+            return stats
+
+    def close(self):
+        """Close idle connections; checked-out ones are closed when returned"""
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._open -= len(idle)
+            self._cond.notify_all()
+        for entry in idle:
+            self._close_raw(entry.raw)
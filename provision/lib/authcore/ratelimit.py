@@ -0,0 +1,160 @@
+"""
+Rate Limiting
+Token buckets keyed by client address or username, checked before any
+database work. Each key holds up to `burst` tokens that refill at `rate`
+per second; a request spends one (or `cost`) and is refused while the
+bucket is empty.
+
+Two interchangeable backends:
+- TokenBucketLimiter: a dict in this process, bounded by evicting the least
+  recently used keys (an idle key has refilled anyway, so dropping it loses
+  nothing). Each pre-forked worker then enforces the limits on its own.
+- SharedTokenBucketLimiter: a fixed-size table in a memory-mapped file
+  (under /dev/shm by default) shared by every worker on the host, so the
+  limits hold for the whole deployment.
+"""
+
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+
+def _refill(tokens, updated, now, rate, burst):
+    # A timestamp ahead of the clock (file left over from before a reboot) counts as now
+    return min(burst, tokens + max(0.0, now - updated) * rate)
+
+
+class TokenBucketLimiter:
+    """
+    In-process token buckets
+
+    rate     - tokens added per second
+    burst    - bucket size: requests allowed at once after being idle
+    max_keys - buckets kept before the least recently used is dropped
+    """
+
+    def __init__(self, rate, burst, max_keys=100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()   # key -> [tokens, updated]
+        self._lock = threading.Lock()
+        self._counters = {'allowed': 0, 'limited': 0, 'evictions': 0}
+
+    def _update(self, key, cost, take, force=False):
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                tokens = self.burst
+                if not take:
+                    return 0.0
+                bucket = self._buckets[key] = [tokens, now]
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+                    self._counters['evictions'] += 1
+            else:
+                tokens = _refill(bucket[0], bucket[1], now, self.rate, self.burst)
+                self._buckets.move_to_end(key)
+            return self._settle(bucket, tokens, now, cost, take, force)
+
+    def _settle(self, bucket, tokens, now, cost, take, force):
+        if tokens < cost and not force:
+            bucket[0], bucket[1] = tokens, now
+            self._counters['limited'] += 1
+            return (cost - tokens) / self.rate
+        if take:
+            tokens = max(0.0, tokens - cost)
+        bucket[0], bucket[1] = tokens, now
+        self._counters['allowed'] += 1
+        return 0.0
+
+    def acquire(self, key, cost=1):
+        """Spend cost tokens; returns 0 if allowed, else seconds until it would be"""
+        return self._update(key, cost, take=True)
+
+    def check(self, key, cost=1):
+        """Like acquire() without spending anything"""
+        return self._update(key, cost, take=False)
+
+    def charge(self, key, cost=1):
+        """Spend tokens unconditionally (down to empty), e.g. after a failed attempt"""
+        self._update(key, cost, take=True, force=True)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, keys=len(self._buckets), max_keys=self.max_keys,
+                        rate=self.rate, burst=self.burst, backend='memory')
+
+
+class SharedTokenBucketLimiter(TokenBucketLimiter):
+    """
+    Token buckets in a memory-mapped file shared by all processes on the host
+
+    The table has `slots` entries grouped in sets of `ways`; a key hashes to
+    one set and, when the set is full, takes over the least recently used
+    entry in it - memory stays fixed no matter how many keys are seen.
+    Each set is guarded by an fcntl record lock (between processes) and a
+    thread lock (between threads of one process, which fcntl doesn't separate).
+    Counters in stats() are per process.
+    """
+
+    ENTRY = struct.Struct('<Qdd')   # key hash (0 = free), tokens, updated (monotonic, host-wide)
+
+    def __init__(self, rate, burst, path, slots=65536, ways=8):
+        super().__init__(rate, burst, max_keys=slots)
+        self.path = path
+        self.ways = ways
+        self.sets = max(1, slots // ways)
+        size = self.sets * ways * self.ENTRY.size
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._fd).st_size != size:
+            os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+
+    @staticmethod
+    def default_path(name):
+        directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+        return os.path.join(directory, f'demo-ratelimit-{name}')
+
+    def _update(self, key, cost, take, force=False):
+        key_hash = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little') | 1
+        set_size = self.ways * self.ENTRY.size
+        start = (key_hash % self.sets) * set_size
+        with self._lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, set_size, start)
+            try:
+                now = time.monotonic()
+                victim, victim_updated = start, None
+                for offset in range(start, start + set_size, self.ENTRY.size):
+                    entry_hash, tokens, updated = self.ENTRY.unpack_from(self._map, offset)
+                    if entry_hash == key_hash:
+                        tokens = _refill(tokens, updated, now, self.rate, self.burst)
+                        break
+                    if entry_hash == 0:
+                        updated = float('-inf')
+                    if victim_updated is None or updated < victim_updated:
+                        victim, victim_updated = offset, updated
+                else:
+                    if not take:
+                        return 0.0
+                    if victim_updated != float('-inf'):
+                        self._counters['evictions'] += 1
+                    offset, tokens = victim, self.burst
+                bucket = [tokens, now]
+                wait = self._settle(bucket, tokens, now, cost, take, force)
+                self.ENTRY.pack_into(self._map, offset, key_hash, bucket[0], bucket[1])
+                return wait
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, set_size, start)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, slots=self.sets * self.ways, rate=self.rate,
+                        burst=self.burst, backend='shared', path=self.path)
@@ -0,0 +1,408 @@
+"""
+Read Replica Routing
+Sends lag-tolerant reads (the API's auth lookups, the user listing) to MySQL
+replicas of the primary, each with its own connection pool, picked
+round-robin or by fewest connections in use. Every replica's lag is measured
+each check_interval seconds; one that is more than max_lag seconds behind,
+not replicating or unreachable is ejected from rotation until a later check
+finds it caught up. With no replica in rotation, callers use the primary.
+
+Lag comes from a heartbeat row the router rewrites on the primary
+(replication_heartbeat, migration 2; the hosts' clocks must be in sync), or
+from SHOW REPLICA STATUS (needs the REPLICATION CLIENT privilege).
+A replica in rotation is at most max_staleness seconds behind the primary.
+"""
+
+import itertools
+import math
+import os
+import threading
+import time
+
+from . import db
+from . import log as logs
+from .pool import ConnectionPool, PoolClosed, PoolTimeout
+
+STRATEGIES = ('round_robin', 'least_in_flight')
+LAG_SOURCES = ('heartbeat', 'status')
+
+log = logs.get_logger('replicas')
+
+
+class ReplicaError(Exception):
+    """A replica cannot report its lag (not replicating, no heartbeat row)"""
+
+
+def write_heartbeat(conn, interval):
+    """Stamp the primary's heartbeat row, unless another process did within the last interval/2 seconds"""
+    cursor = conn.cursor()
+    cursor.execute("""
+        UPDATE replication_heartbeat SET beat = NOW(6)
+        WHERE id = 1 AND beat < NOW(6) - INTERVAL %s MICROSECOND
+    """, (int(interval * 500000),))
+    cursor.close()
+
+
+def heartbeat_lag(conn):
+    """Seconds between the replicated heartbeat and the replica's clock (includes the heartbeat's age)"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT TIMESTAMPDIFF(MICROSECOND, beat, NOW(6)) FROM replication_heartbeat WHERE id = 1")
+    row = cursor.fetchone()
+    cursor.close()
+    if row is None:
+        raise ReplicaError("no heartbeat row (run the schema migrations on the primary)")
+    return max(row[0] / 1e6, 0.0)
+
+
+def status_lag(conn):
+    """Seconds_Behind_Source from SHOW REPLICA STATUS (SHOW SLAVE STATUS on older servers)"""
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute("SHOW REPLICA STATUS")
+    except db.Error:
+        cursor.close()
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("SHOW SLAVE STATUS")
+    rows = cursor.fetchall()
+    cursor.close()
+    if not rows:
+        raise ReplicaError("not a replica (no replication channel)")
+    # One row per channel (multi-source); the slowest one decides
+    lags = [row.get('Seconds_Behind_Source', row.get('Seconds_Behind_Master')) for row in rows]
+    if any(lag is None for lag in lags):
+        raise ReplicaError("replication is not running")
+    return float(max(lags))
+
+
+class _Replica:
+    """One replica: its pool, rotation state and counters"""
+
+    def __init__(self, name, connect_kwargs):
+        self.name = name
+        self.connect_kwargs = connect_kwargs
+        self.pool = None
+        self.reset()
+
+    def reset(self):
+        self.state = 'unchecked'    # unchecked, in (rotation) or out
+        self.lag = None
+        self.checked_at = None      # monotonic start of the last check that measured lag
+        self.reason = None
+        self.counters = {'checks': 0, 'check_errors': 0, 'ejections': 0, 'reads': 0, 'read_errors': 0}
+
+
+class ReplicaRouter:
+    """
+    Route reads to replicas that keep up with the primary
+
+    replicas       - {name: mysql.connector.connect() keyword arguments}
+    pool_kwargs    - ConnectionPool keyword arguments for each replica's pool
+    primary        - zero-argument callable returning a primary connection
+                     (close() hands it back), used for the heartbeat
+    strategy       - round_robin or least_in_flight
+    max_lag        - seconds behind the primary before a replica is ejected
+    check_interval - seconds between lag checks
+    lag_source     - heartbeat or status
+    """
+
+    def __init__(self, replicas, pool_kwargs, primary=None, strategy='round_robin',
+                 max_lag=5.0, check_interval=1.0, lag_source='heartbeat'):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"DB_REPLICA_STRATEGY must be one of {', '.join(STRATEGIES)}, not {strategy!r}")
+        if lag_source not in LAG_SOURCES:
+            raise ValueError(f"DB_REPLICA_LAG_SOURCE must be one of {', '.join(LAG_SOURCES)}, not {lag_source!r}")
+        if lag_source == 'heartbeat' and primary is None:
+            raise ValueError("The heartbeat lag source needs a primary connection")
+
+        self.pool_kwargs = pool_kwargs
+        self.primary = primary
+        self.strategy = strategy
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.lag_source = lag_source
+        # A check older than two intervals (stuck checker thread) no longer vouches for a replica
+        self.valid_for = check_interval * 2
+        self._measure = heartbeat_lag if lag_source == 'heartbeat' else status_lag
+
+        self._replicas = [_Replica(name, kwargs) for name, kwargs in replicas.items()]
+        self._lock = threading.Lock()
+        self._pid = None
+        self._thread_pid = None
+        self._closed = False
+        self._reset_process()
+
+    @property
+    def max_staleness(self):
+        """Upper bound on how far behind the primary a read from a replica in rotation can be"""
+        return self.max_lag + self.valid_for
+
+    def describe(self):
+        names = ', '.join(replica.name for replica in self._replicas)
+        return (f"{names} ({self.strategy}, max lag {self.max_lag}s via {self.lag_source}, "
+                f"checked every {self.check_interval}s)")
+
+    def _reset_process(self):
+        """
+        Fresh pools and rotation state for this process. A forked child must
+        not share its parent's sockets, and its parent's checks say nothing
+        about whether the child's checker is running
+        """
+        for replica in self._replicas:
+            replica.pool = ConnectionPool(self._connector(replica.connect_kwargs), **self.pool_kwargs)
+            replica.reset()
+        self._rotation = itertools.count()
+        self._last_check = 0.0
+        self._beat_error = None
+        self._counters = {'primary_fallbacks': 0, 'heartbeat_errors': 0}
+        self._check_lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _process(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._reset_process()
+
+    @staticmethod
+    def _connector(connect_kwargs):
+        def connect_fn():
+            import mysql.connector
+            return mysql.connector.connect(autocommit=True, **connect_kwargs)
+        return connect_fn
+
+    def start(self):
+        """
+        Check every replica once and keep checking in daemon threads (one per
+        replica, plus the heartbeat writer); restarts them in a forked child
+        """
+        self._process()
+        with self._lock:
+            if self._thread_pid == os.getpid() or self._closed:
+                return
+            self._thread_pid = os.getpid()
+        self.check()
+        if self.lag_source == 'heartbeat':
+            threading.Thread(target=self._run, args=(self.beat,), name='replica-heartbeat', daemon=True).start()
+        for replica in self._replicas:
+            threading.Thread(target=self._run, args=(lambda replica=replica: self.check_replica(replica),),
+                             name=f'replica-check-{replica.name}', daemon=True).start()
+
+    def _run(self, step):
+        pid = os.getpid()
+        while True:
+            time.sleep(self.check_interval)
+            if self._closed or self._thread_pid != pid:
+                return
+            step()
+
+    def check(self):
+        """Write the heartbeat and measure every replica once, one after another"""
+        self._process()
+        with self._check_lock:
+            self._last_check = time.monotonic()
+            if self.lag_source == 'heartbeat':
+                self.beat()
+            for replica in self._replicas:
+                self.check_replica(replica)
+
+    def beat(self):
+        """Stamp the heartbeat on the primary; failures are counted and logged once per outage"""
+        try:
+            conn = self.primary()
+            try:
+                write_heartbeat(conn, self.check_interval)
+            except Exception:
+                conn.invalidate()
+                raise
+            conn.close()
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            with self._lock:
+                self._counters['heartbeat_errors'] += 1
+                first = self._beat_error is None
+                self._beat_error = error
+            if first:
+                log.warning("Replica heartbeat write failed", error=error)
+            return
+        if self._beat_error is not None:
+            self._beat_error = None
+            log.info("Replica heartbeat restored")
+
+    def check_replica(self, replica):
+        """Measure one replica's lag and eject or readmit it"""
+        started = time.monotonic()
+        lag = None
+        try:
+            conn = replica.pool.acquire()
+            try:
+                lag = self._measure(conn)
+            except Exception:
+                conn.invalidate()
+                raise
+            conn.close()
+        except Exception as e:
+            reason = f"{type(e).__name__}: {e}"
+        else:
+            reason = None if lag <= self.max_lag else f"lag {lag:.3f}s > {self.max_lag}s"
+
+        with self._lock:
+            previous = replica.state
+            replica.counters['checks'] += 1
+            if lag is None:
+                replica.counters['check_errors'] += 1
+            replica.lag = lag
+            replica.checked_at = started
+            replica.reason = reason
+            replica.state = 'out' if reason else 'in'
+            if reason and previous == 'in':
+                replica.counters['ejections'] += 1
+        if reason and previous != 'out':
+            log.warning("Replica ejected", replica=replica.name, reason=reason)
+        elif reason is None and previous != 'in':
+            log.info("Replica in rotation", replica=replica.name, lag=round(lag, 3))
+
+    def _eligible(self):
+        now = time.monotonic()
+        return [replica for replica in self._replicas
+                if replica.state == 'in' and now - replica.checked_at <= self.valid_for]
+
+    def acquire(self, background=False):
+        """
+        Pooled connection to a replica in rotation (its .replica names it), or
+        None when no replica is usable and the read belongs on the primary
+
+        background - keep the checker threads running (long-lived servers);
+                     otherwise a due check runs here, in the caller's thread
+        """
+        self._process()
+        if background:
+            self.start()
+        elif self._thread_pid != os.getpid() and time.monotonic() - self._last_check >= self.check_interval:
+            self.check()
+
+        candidates = self._eligible()
+        if candidates:
+            offset = next(self._rotation) % len(candidates)
+            candidates = candidates[offset:] + candidates[:offset]
+            if self.strategy == 'least_in_flight':
+                # Stable sort: ties keep the rotation, so idle replicas share the load
+                candidates.sort(key=lambda replica: replica.pool.checked_out)
+        for replica in candidates:
+            try:
+                conn = replica.pool.acquire()
+            except (PoolTimeout, PoolClosed):
+                # Busy (or being replaced), not broken: try the next one
+                continue
+            except Exception as e:
+                self._eject(replica, f"{type(e).__name__}: {e}")
+                continue
+            conn.replica = replica.name
+            with self._lock:
+                replica.counters['reads'] += 1
+            return conn
+        with self._lock:
+            self._counters['primary_fallbacks'] += 1
+        return None
+
+    def connection(self, name):
+        """Pooled connection to the named replica, whether it is in rotation or not"""
+        self._process()
+        for replica in self._replicas:
+            if replica.name == name:
+                conn = replica.pool.acquire()
+                conn.replica = name
+                return conn
+        raise KeyError(f"No replica named {name!r}")
+
+    def failed(self, conn, error):
+        """A query on a replica connection raised: discard the connection and eject the replica"""
+        name = getattr(conn, 'replica', None)
+        conn.invalidate()
+        for replica in self._replicas:
+            if replica.name == name:
+                with self._lock:
+                    replica.counters['read_errors'] += 1
+                self._eject(replica, f"{type(error).__name__}: {error}")
+
+    def _eject(self, replica, reason):
+        with self._lock:
+            previous = replica.state
+            replica.state = 'out'
+            replica.reason = reason
+            if previous == 'in':
+                replica.counters['ejections'] += 1
+        if previous != 'out':
+            log.warning("Replica ejected", replica=replica.name, reason=reason)
+
+    def stats(self):
+        """Rotation state, lag, pool occupancy and counters per replica, plus router counters"""
+        self._process()
+        now = time.monotonic()
+        with self._lock:
+            report = dict(self._counters)
+            report['in_rotation'] = len(self._eligible())
+            report['replicas'] = {
+                replica.name: dict(
+                    replica.counters,
+                    in_rotation=replica in self._eligible(),
+                    lag=None if replica.lag is None else round(replica.lag, 3),
+                    check_age=None if replica.checked_at is None else round(now - replica.checked_at, 3),
+                    reason=replica.reason,
+                    checked_out=replica.pool.checked_out,
+                    open=replica.pool.stats()['open'],
+                )
+                for replica in self._replicas
+            }
+        return report
+
+    def close(self):
+        """Stop the checker threads (after their current sleep) and close the replica pools"""
+        self._closed = True
+        for replica in self._replicas:
+            replica.pool.close()
+
+
+def parse_replicas(value, default_port=3306):
+    """'host1, host2:3307' -> [(name, host, port)]"""
+    replicas = []
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        host, _, port = item.partition(':')
+        replicas.append((item, host, int(port) if port else default_port))
+    return replicas
+
+
+def router_settings(config):
+    """Replica router settings from a config as a comparable tuple (empty when DB_REPLICAS is unset)"""
+    replicas = tuple(parse_replicas(config.get('DB_REPLICAS') or ''))
+    if not replicas:
+        return ()
+    return (
+        replicas,
+        config.get('DB_REPLICA_USER') or config.get('DB_USER'),
+        config.get('DB_REPLICA_PASS') or config.get('DB_PASS'),
+        (config.get('DB_REPLICA_STRATEGY') or 'round_robin').strip().lower(),
+        config.get_float('DB_REPLICA_MAX_LAG', 5),
+        config.get_float('DB_REPLICA_CHECK_INTERVAL', 1),
+        (config.get('DB_REPLICA_LAG_SOURCE') or 'heartbeat').strip().lower(),
+    )
+
+
+def from_config(config, primary=None):
+    """ReplicaRouter for DB_REPLICAS and DB_REPLICA_*, or None when no replica is configured"""
+    settings = router_settings(config)
+    if not settings:
+        return None
+    replicas, user, password, strategy, max_lag, check_interval, lag_source = settings
+    pool_kwargs = db.pool_settings(config)
+    database = config.get('DB_NAME')
+    # An unreachable replica should be ejected, not hold a request for the OS connect timeout
+    connect_timeout = max(1, math.ceil(pool_kwargs['timeout']))
+    return ReplicaRouter(
+        {name: {'host': host, 'port': port, 'database': database, 'user': user, 'password': password,
+                'connection_timeout': connect_timeout}
+         for name, host, port in replicas},
+        pool_kwargs, primary=primary, strategy=strategy, max_lag=max_lag,
+        check_interval=check_interval, lag_source=lag_source)
@@ -0,0 +1,128 @@
+"""
+Subscription Statistics
+Reads user counts from the `user_stats` table, which triggers on `users` keep
+up to date (one row per status and expiry date; see 03_mysql_setup.sh), so
+the numbers cost a scan of a few hundred rows instead of the users table.
+Counts that depend on today's date are derived when read, so they never go
+stale as days pass.
+"""
+
+from datetime import date, datetime
+
+from . import db
+
+# user_stats stores "no expiry" under this date (NULLs can't be part of the key)
+NO_EXPIRY = date(9999, 12, 31)
+
+FIELDS = ('total', 'active', 'inactive', 'lifetime', 'active_with_expiry', 'expired')
+
+REBUILD_SQL = """
+    INSERT INTO user_stats (status, expiry, users)
+    SELECT status, COALESCE(expiry, '9999-12-31'), COUNT(*)
+    FROM users
+    GROUP BY status, COALESCE(expiry, '9999-12-31')
+"""
+
+
+def _as_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value), '%Y-%m-%d').date()
+
+
+def _summarize(rows, today):
+    """Fold (status, expiry, users) rows into the summary counts"""
+    counts = dict.fromkeys(FIELDS, 0)
+    for status, expiry, users in rows:
+        users = int(users)
+        counts['total'] += users
+        if status != 'active':
+            counts['inactive'] += users
+            continue
+        counts['active'] += users
+        expiry = _as_date(expiry) if expiry is not None else NO_EXPIRY
+        if expiry == NO_EXPIRY:
+            counts['lifetime'] += users
+        elif expiry >= today:
+            counts['active_with_expiry'] += users
+        else:
+            counts['expired'] += users
+    return counts
+
+
+def _query(conn, sql):
+    cursor = conn.cursor()
+    cursor.execute(sql)
+    rows = cursor.fetchall()
+    cursor.close()
+    return rows
+
+
+def read_stats(conn, today=None):
+    """Summary counts from the maintained user_stats table"""
+    rows = _query(conn, "SELECT status, expiry, users FROM user_stats WHERE users <> 0")
+    return _summarize(rows, today or date.today())
+
+
+def recount(conn, today=None):
+    """Summary counts from a full scan of users (what user_stats must agree with)"""
+    rows = _query(conn, """
+        SELECT status, expiry, COUNT(*)
+        FROM users
+        GROUP BY status, expiry
+    """)
+    return _summarize(rows, today or date.today())
+
+
+def verify(conn, repair=False, today=None):
+    """
+    Compare user_stats with a full recount in one consistent snapshot
+    Returns {field: (maintained, recounted)} for every mismatch (empty when
+    they agree); with repair=True the table is rebuilt when they don't
+    """
+    today = today or date.today()
+    conn.commit()
+    cursor = conn.cursor()
+    # A SQLite read transaction sees one snapshot from its first read on
+    cursor.execute("BEGIN" if db.dialect(conn) == 'sqlite' else "START TRANSACTION WITH CONSISTENT SNAPSHOT")
+    cursor.close()
+    maintained = read_stats(conn, today)
+    recounted = recount(conn, today)
+    conn.commit()
+    mismatches = {
+        field: (maintained[field], recounted[field])
+        for field in FIELDS if maintained[field] != recounted[field]
+    }
+    if mismatches and repair:
+        rebuild(conn)
+    return mismatches
+
+
+def rebuild(conn):
+    """Recompute user_stats from users in one transaction"""
+    cursor = conn.cursor()
+    conn.commit()
+    if db.dialect(conn) == 'sqlite':
+        # BEGIN IMMEDIATE takes the database's write lock up front
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            cursor.execute("DELETE FROM user_stats")
+            cursor.execute(REBUILD_SQL)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+        return
+    # Lock users against writes so no trigger update falls between the delete and the recount
+    cursor.execute("LOCK TABLES users READ, user_stats WRITE")
+    try:
+        cursor.execute("DELETE FROM user_stats")
+        cursor.execute(REBUILD_SQL)
+        conn.commit()
+    finally:
+        cursor.execute("UNLOCK TABLES")
+        cursor.close()
@@ -0,0 +1,927 @@
+"""
+Storage Backends
+The user and subscription queries of the API, the subscription updater and
+the user management CLI behind one repository interface, with two backends:
+
+    mysql   MySQL/MariaDB as configured by DB_* (pooled connections for the API)
+    sqlite  a local SQLite file: read-write in WAL mode to run the whole stack
+            on one box (the schema is created on first open), or read-only to
+            serve /authenticate on an edge node from a copy exported from MySQL
+
+get_repository() picks the backend with STORAGE_BACKEND. Repository methods
+take a connection from acquire() (per request; close() hands it back) or
+connect() (scripts), so callers keep control of transactions; the
+repository owns the SQL and its dialect differences. changes.py and
+stats.py take either kind of connection (see db.dialect).
+
+Reads that tolerate a few seconds of lag may take acquire_replica() first:
+with DB_REPLICAS set, MySQL routes them to replicas that keep up with the
+primary (see replicas.py); writes and read-after-write stay on acquire().
+
+Export a copy for edge nodes (replaced atomically; readers switch to the new
+file within a second):
+    PYTHONPATH=/usr/local/lib/demo python3 -m authcore.storage --export-sqlite PATH
+"""
+
+import abc
+import argparse
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import date, datetime
+
+from . import changes
+from . import db
+from . import replicas as replica_routing
+from . import stats
+from .config import get_config
+
+BACKENDS = ('mysql', 'sqlite')
+
+USER_COLUMNS = ('id', 'username', 'password', 'status', 'expiry', 'created_at', 'updated_at')
+
+# Status changes applied to each batch of rows ({scope} selects the batch),
+# counted separately for the summary: (name, new status, condition, condition takes today's date)
+STATUS_UPDATES = (
+    # Users with expired subscriptions become inactive
+    ('expired', 'inactive', """
+        status = 'active'
+        AND expiry IS NOT NULL
+        AND expiry < %s
+    """, True),
+    # Users with future expiry dates become active again
+    # This handles cases where a user purchases a new subscription
+    ('reactivated', 'active', """
+        status = 'inactive'
+        AND expiry IS NOT NULL
+        AND expiry >= %s
+    """, True),
+    # Users with lifetime subscriptions (no expiry date) are always active
+    ('lifetime_reactivated', 'active', """
+        status = 'inactive'
+        AND expiry IS NULL
+    """, False),
+)
+
+# SQLite schema, mirroring 03_mysql_setup.sh and the migrations. Tables,
+# indexes and triggers are separate so an export can load before indexing.
+# username uses NOCASE like the case-insensitive MySQL collation (ASCII only:
+# fetch_users() folds the rest). updated_at is maintained by a trigger
+# instead of ON UPDATE; password changes leave it alone, as the API's rehash
+# asks for with updated_at = updated_at.
+SQLITE_TABLES = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username VARCHAR(50) NOT NULL UNIQUE COLLATE NOCASE,
+    password VARCHAR(255) NOT NULL,
+    status TEXT DEFAULT 'inactive' CHECK (status IN ('active', 'inactive')),
+    expiry DATE NULL,
+    created_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    updated_at TIMESTAMP DEFAULT (datetime('now', 'localtime'))
+);
+CREATE TABLE IF NOT EXISTS user_stats (
+    status TEXT NOT NULL,
+    expiry DATE NOT NULL,
+    users INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (status, expiry)
+);
+CREATE TABLE IF NOT EXISTS user_changes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    username VARCHAR(50) NOT NULL,
+    status TEXT NULL,
+    expiry DATE NULL,
+    source VARCHAR(32) NOT NULL,
+    changed_at TIMESTAMP NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime'))
+);
+"""
+
+SQLITE_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_updated_at ON users (updated_at);
+CREATE INDEX IF NOT EXISTS idx_status_expiry ON users (status, expiry);
+CREATE INDEX IF NOT EXISTS idx_auth_lookup ON users (username, password, status, expiry, updated_at);
+CREATE INDEX IF NOT EXISTS idx_changed_at ON user_changes (changed_at);
+"""
+
+SQLITE_TRIGGERS = """
+CREATE TRIGGER IF NOT EXISTS users_touch AFTER UPDATE OF username, status, expiry ON users
+FOR EACH ROW WHEN NEW.updated_at IS OLD.updated_at AND (
+    NEW.username IS NOT OLD.username OR NEW.status IS NOT OLD.status OR NEW.expiry IS NOT OLD.expiry)
+BEGIN
+    UPDATE users SET updated_at = datetime('now', 'localtime') WHERE id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS users_stats_insert AFTER INSERT ON users FOR EACH ROW
+BEGIN
+    INSERT INTO user_stats (status, expiry, users)
+    VALUES (NEW.status, COALESCE(NEW.expiry, '9999-12-31'), 1)
+    ON CONFLICT (status, expiry) DO UPDATE SET users = users + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS users_stats_update AFTER UPDATE OF status, expiry ON users
+FOR EACH ROW WHEN NEW.status IS NOT OLD.status OR NEW.expiry IS NOT OLD.expiry
+BEGIN
+    UPDATE user_stats SET users = users - 1
+    WHERE status = OLD.status AND expiry = COALESCE(OLD.expiry, '9999-12-31');
+    INSERT INTO user_stats (status, expiry, users)
+    VALUES (NEW.status, COALESCE(NEW.expiry, '9999-12-31'), 1)
+    ON CONFLICT (status, expiry) DO UPDATE SET users = users + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS users_stats_delete AFTER DELETE ON users FOR EACH ROW
+BEGIN
+    UPDATE user_stats SET users = users - 1
+    WHERE status = OLD.status AND expiry = COALESCE(OLD.expiry, '9999-12-31');
+END;
+"""
+
+# DATE and TIMESTAMP columns come back as date/datetime, like from mysql.connector
+sqlite3.register_adapter(date, lambda value: value.isoformat())
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(' '))
+sqlite3.register_converter('DATE', lambda value: date.fromisoformat(value.decode()))
+sqlite3.register_converter('TIMESTAMP', lambda value: datetime.fromisoformat(value.decode()))
+
+
+def __getattr__(name):
+    # storage.Error catches database errors of either backend; mysql.connector
+    # is only imported if it is installed (an edge node may run sqlite alone)
+    if name == 'Error':
+        try:
+            return (sqlite3.Error, db.Error)
+        except ImportError:
+            return (sqlite3.Error,)
+    raise AttributeError(f"module 'authcore.storage' has no attribute '{name}'")
+
+
+class SQLiteCursor:
+    """Cursor taking mysql.connector's %s parameters, with optional dict rows"""
+
+    def __init__(self, cursor, dictionary=False):
+        self._cursor = cursor
+        self._dictionary = dictionary
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def execute(self, sql, params=()):
+        self._cursor.execute(sql.replace('%s', '?'), tuple(params))
+
+    def executemany(self, sql, seq_of_params):
+        self._cursor.executemany(sql.replace('%s', '?'), seq_of_params)
+
+    def _row(self, row):
+        if row is None or not self._dictionary:
+            return row
+        return dict(zip([column[0] for column in self._cursor.description], row))
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchmany(self, size=1):
+        return [self._row(row) for row in self._cursor.fetchmany(size)]
+
+    def fetchall(self):
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+    def __iter__(self):
+        return (self._row(row) for row in self._cursor)
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    """
+    sqlite3 connection with the surface the callers use on MySQL ones
+    (cursor(dictionary=...), commit, rollback, close, invalidate); close()
+    hands a pooled connection back to its repository
+    """
+
+    dialect = 'sqlite'
+
+    def __init__(self, conn, inode, release=None):
+        self.conn = conn
+        self.inode = inode
+        self._release = release
+
+    def cursor(self, dictionary=False):
+        return SQLiteCursor(self.conn.cursor(), dictionary)
+
+    def commit(self):
+        self.conn.commit()
+
+    def rollback(self):
+        self.conn.rollback()
+
+    def close(self):
+        if self._release is not None:
+            self._release(self)
+        else:
+            self.conn.close()
+
+    def invalidate(self):
+        """Close instead of returning to the pool (state unknown after an error)"""
+        self._release = None
+        self.conn.close()
+
+
+class UserRepository(abc.ABC):
+    """
+    The user and subscription queries, written once with %s parameters;
+    subclasses supply connections and the few statements that differ by dialect
+    """
+
+    backend = None
+    # Escape character clause for LIKE patterns (filter_sql escapes with a backslash)
+    like_escape = ''
+    # replicas.ReplicaRouter for lag-tolerant reads, or None
+    replicas = None
+    # No writes at all (an exported SQLite copy on an edge node)
+    read_only = False
+
+    @property
+    def read_staleness(self):
+        """Seconds a replica read may lag the primary (0 without replicas); read your writes for this long"""
+        return self.replicas.max_staleness if self.replicas else 0
+
+    def acquire_replica(self, background=False):
+        """
+        Pooled replica connection for a read that tolerates read_staleness
+        seconds of lag, or None: use acquire() (the primary) instead
+        background - keep replica lag checked by threads (long-lived servers)
+        """
+        if self.replicas is None:
+            return None
+        return self.replicas.acquire(background)
+
+    def replica_failed(self, conn, error):
+        """Discard a replica connection whose query raised and eject the replica; retry on the primary"""
+        self.replicas.failed(conn, error)
+
+    def ping(self, conn):
+        """Round trip to the database; raises if it is unreachable"""
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1")
+        cursor.fetchall()
+        cursor.close()
+
+    @abc.abstractmethod
+    def acquire(self):
+        """Connection for one request; close() hands it back"""
+
+    @abc.abstractmethod
+    def connect(self, autocommit=True):
+        """Connection of its own (scripts and long transactions)"""
+
+    @abc.abstractmethod
+    def now(self, conn, minus_seconds=0):
+        """Database clock, optionally moved back (timestamps are compared with updated_at)"""
+
+    # API: authentication lookups and cache invalidation
+
+    def find_users(self, conn, usernames):
+        """Auth records (dicts) for usernames, matched case-insensitively like the column collation"""
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(f"""
+            SELECT id, username, password, status, expiry, updated_at
+            FROM users
+            WHERE username IN ({', '.join(['%s'] * len(usernames))})
+        """, tuple(usernames))
+        rows = cursor.fetchall()
+        cursor.close()
+        return rows
+
+    def changed_usernames(self, conn, since):
+        """Usernames of rows updated at or after since"""
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT username
+            FROM users
+            WHERE updated_at >= %s
+        """, (since,))
+        usernames = [row[0] for row in cursor.fetchall()]
+        cursor.close()
+        return usernames
+
+    def replace_password(self, conn, user_id, old_hash, new_hash):
+        """
+        Store new_hash if the stored hash is still old_hash; returns rows changed
+        updated_at is kept, so the change doesn't invalidate ETags or count as
+        an edit for caches and the updater
+        """
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE users
+            SET password = %s, updated_at = updated_at
+            WHERE id = %s AND password = %s
+        """, (new_hash, user_id, old_hash))
+        changed = cursor.rowcount
+        cursor.close()
+        return changed
+
+    # Subscription updater
+
+    def max_user_id(self, conn):
+        """Highest user id, or None for an empty table"""
+        cursor = conn.cursor()
+        cursor.execute("SELECT MAX(id) FROM users")
+        value = cursor.fetchone()[0]
+        cursor.close()
+        return value
+
+    def next_batch_end(self, conn, last_id, batch_size):
+        """
+        Highest id among the next batch_size rows after last_id (keyset pagination
+        over the primary key), or None when no rows are left
+        """
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT MAX(id) AS batch_end
+            FROM (
+                SELECT id FROM users
+                WHERE id > %s
+                ORDER BY id
+                LIMIT %s
+            ) AS batch
+        """, (last_id, batch_size))
+        value = cursor.fetchone()[0]
+        cursor.close()
+        return value
+
+    def apply_status_updates(self, conn, scope, scope_params, current_date, source):
+        """
+        Run every status change on the rows matched by scope; returns {change: rows}
+        Each change is first logged to the change feed with one INSERT ... SELECT
+        (which also locks the rows), then applied by the matching UPDATE
+        """
+        cursor = conn.cursor()
+        counts = {}
+        for name, new_status, condition, uses_date in STATUS_UPDATES:
+            where = f"({scope}) AND {condition}"
+            params = tuple(scope_params) + ((current_date,) if uses_date else ())
+            changes.record(cursor, where, params, source, status=new_status)
+            cursor.execute(f"""
+                UPDATE users
+                SET status = %s
+                WHERE {where}
+            """, (new_status,) + params)
+            counts[name] = cursor.rowcount
+        cursor.close()
+        return counts
+
+    def update_statuses_in_range(self, conn, after_id, last_id, current_date, source):
+        """apply_status_updates() for ids in (after_id, last_id]"""
+        return self.apply_status_updates(conn, "id > %s AND id <= %s", (after_id, last_id),
+                                         current_date, source)
+
+    def update_statuses_for_ids(self, conn, ids, current_date, source):
+        """apply_status_updates() for a list of ids"""
+        scope = f"id IN ({', '.join(['%s'] * len(ids))})"
+        return self.apply_status_updates(conn, scope, ids, current_date, source)
+
+    def expiring_user_ids(self, conn, since_date, until_date):
+        """Active users whose expiry date is in [since_date, until_date)"""
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT id
+            FROM users
+            WHERE expiry >= %s AND expiry < %s
+            AND status = 'active'
+        """, (since_date, until_date))
+        ids = [row[0] for row in cursor.fetchall()]
+        cursor.close()
+        return ids
+
+    def edited_user_ids(self, conn, since):
+        """Users updated at or after since"""
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT id
+            FROM users
+            WHERE updated_at >= %s
+        """, (since,))
+        ids = [row[0] for row in cursor.fetchall()]
+        cursor.close()
+        return ids
+
+    # User management CLI
+
+    def filter_sql(self, filters):
+        """
+        WHERE conditions and parameters for the listing filters:
+        username prefix, status, and an expiry range ('never' = no expiry date)
+        """
+        conditions, params = [], []
+        if filters.get('prefix'):
+            # Escape LIKE wildcards so the prefix is matched literally
+            prefix = filters['prefix'].replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            conditions.append(f"username LIKE %s{self.like_escape}")
+            params.append(prefix + '%')
+        if filters.get('status'):
+            conditions.append("status = %s")
+            params.append(filters['status'])
+        if filters.get('never_expires'):
+            conditions.append("expiry IS NULL")
+        if filters.get('expiry_from'):
+            conditions.append("expiry >= %s")
+            params.append(filters['expiry_from'])
+        if filters.get('expiry_to'):
+            conditions.append("expiry <= %s")
+            params.append(filters['expiry_to'])
+        return conditions, params
+
+    def users_page(self, conn, filters, start_id=0, page_size=25):
+        """
+        One page of users with id >= start_id, in id order (keyset pagination:
+        no OFFSET, so every page costs the same however deep it is)
+        Returns (users, has_more); only the displayed columns are selected
+        """
+        conditions, params = self.filter_sql(filters)
+        conditions.insert(0, "id >= %s")
+        params.insert(0, start_id)
+        # Unbuffered cursor on MySQL: rows are streamed from the server, not loaded up front
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(f"""
+            SELECT id, username, status, expiry
+            FROM users
+            WHERE {' AND '.join(conditions)}
+            ORDER BY id
+            LIMIT %s
+        """, tuple(params) + (page_size + 1,))
+        users = [row for row in cursor]
+        cursor.close()
+        return users[:page_size], len(users) > page_size
+
+    def previous_page_start(self, conn, filters, first_id, page_size=25):
+        """start_id of the page before the one beginning at first_id (0 if there is none)"""
+        conditions, params = self.filter_sql(filters)
+        conditions.insert(0, "id < %s")
+        params.insert(0, first_id)
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT MIN(id) FROM (
+                SELECT id
+                FROM users
+                WHERE {' AND '.join(conditions)}
+                ORDER BY id DESC
+                LIMIT %s
+            ) AS previous_page
+        """, tuple(params) + (page_size,))
+        start_id = cursor.fetchone()[0]
+        cursor.close()
+        return start_id or 0
+
+    def get_user(self, conn, user_id):
+        """id, username, status and expiry of one user, or None"""
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("""
+            SELECT id, username, status, expiry
+            FROM users
+            WHERE id = %s
+        """, (user_id,))
+        user = cursor.fetchone()
+        cursor.close()
+        return user
+
+    def update_subscription(self, conn, user_id, status, expiry, source):
+        """Set a user's status and expiry and log the change (the caller commits)"""
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE users
+            SET status = %s, expiry = %s
+            WHERE id = %s
+        """, (status, expiry, user_id))
+        changes.record(cursor, "id = %s", (user_id,), source)
+        cursor.close()
+
+    def resolve_user_ids(self, cursor, edits):
+        """Fill in 'id' for edits given by username (one query per batch); returns the unknown usernames"""
+        usernames = list(dict.fromkeys(edit['username'] for edit in edits if edit['id'] is None))
+        if not usernames:
+            return []
+        cursor.execute(f"""
+            SELECT id, username
+            FROM users
+            WHERE username IN ({', '.join(['%s'] * len(usernames))})
+        """, tuple(usernames))
+        # The column collation is case-insensitive
+        ids = {username.casefold(): user_id for user_id, username in cursor.fetchall()}
+        for edit in edits:
+            if edit['id'] is None:
+                edit['id'] = ids.get(edit['username'].casefold())
+        return [username for username in usernames if username.casefold() not in ids]
+
+    # Temporary table of one bulk edit batch, and the statements that flag the
+    # edits which change something and apply those (dialect specific)
+    BULK_TABLE_SQL = None
+    BULK_FLAG_SQL = None
+    BULK_APPLY_SQL = None
+
+    def apply_edit_batch(self, conn, edits, source, dry_run=False):
+        """
+        Apply one batch of edits in a single transaction with multi-row statements:
+        the edits go into a temporary table, then one UPDATE ... JOIN changes
+        every user that actually differs and one INSERT ... SELECT logs them
+        Returns (changed, unchanged, missing keys)
+        """
+        cursor = conn.cursor()
+        missing = self.resolve_user_ids(cursor, edits)
+        # Several edits for the same user in a batch: the last one wins
+        by_id = {edit['id']: edit for edit in edits if edit['id'] is not None}
+
+        cursor.execute(self.BULK_TABLE_SQL)
+        cursor.execute("DELETE FROM bulk_edits")
+        cursor.executemany("""
+            INSERT INTO bulk_edits (id, status, expiry, set_status, set_expiry)
+            VALUES (%s, %s, %s, %s, %s)
+        """, [(user_id, edit['status'], edit['expiry'], edit['set_status'], edit['set_expiry'])
+              for user_id, edit in by_id.items()])
+
+        # Flag the edits that change something; ids with no user keep changed = NULL
+        cursor.execute(self.BULK_FLAG_SQL)
+        cursor.execute("SELECT id FROM bulk_edits WHERE changed IS NULL")
+        missing += [str(row[0]) for row in cursor.fetchall()]
+        cursor.execute("SELECT COUNT(*), COALESCE(SUM(changed), 0) FROM bulk_edits WHERE changed IS NOT NULL")
+        matched, changed = (int(value) for value in cursor.fetchone())
+
+        if dry_run:
+            conn.rollback()
+        else:
+            cursor.execute(self.BULK_APPLY_SQL)
+            changes.record(cursor, "id IN (SELECT id FROM bulk_edits WHERE changed)", (), source)
+            conn.commit()
+        cursor.close()
+        return changed, matched - changed, missing
+
+
+class MySQLRepository(UserRepository):
+    """The production store: MySQL/MariaDB configured by DB_* (see db.py)"""
+
+    backend = 'mysql'
+
+    BULK_TABLE_SQL = """
+        CREATE TEMPORARY TABLE IF NOT EXISTS bulk_edits (
+            id INT PRIMARY KEY,
+            status ENUM('active', 'inactive') NULL,
+            expiry DATE NULL,
+            set_status BOOL NOT NULL,
+            set_expiry BOOL NOT NULL,
+            changed BOOL NULL
+        )
+    """
+    BULK_FLAG_SQL = """
+        UPDATE bulk_edits e JOIN users u ON u.id = e.id
+        SET e.changed = NOT (
+            IF(e.set_status, e.status, u.status) <=> u.status
+            AND IF(e.set_expiry, e.expiry, u.expiry) <=> u.expiry
+        )
+    """
+    BULK_APPLY_SQL = """
+        UPDATE users u JOIN bulk_edits e ON e.id = u.id AND e.changed
+        SET u.status = IF(e.set_status, e.status, u.status),
+            u.expiry = IF(e.set_expiry, e.expiry, u.expiry)
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.replicas = replica_routing.from_config(config, primary=self.acquire)
+
+    def describe(self):
+        pool = db.get_pool(self.config.env_path)
+        description = (f"MySQL {self.config.get('DB_HOST')}/{self.config.get('DB_NAME')}, pool size={pool.size}, "
+                       f"max_overflow={pool.max_overflow}, timeout={pool.timeout}s, recycle={pool.recycle}s")
+        if self.replicas:
+            description += f"; read replicas {self.replicas.describe()}"
+        return description
+
+    @property
+    def max_connections(self):
+        pool = db.get_pool(self.config.env_path)
+        return pool.size + pool.max_overflow
+
+    def acquire(self):
+        """Pooled connection for one request; close() hands it back"""
+        return db.get_pool(self.config.env_path).acquire()
+
+    def connect(self, autocommit=True):
+        """New unpooled connection (scripts and long transactions)"""
+        return db.connect(autocommit=autocommit, config=self.config)
+
+    def stats(self):
+        return db.get_pool(self.config.env_path).stats()
+
+    def now(self, conn, minus_seconds=0):
+        cursor = conn.cursor()
+        cursor.execute("SELECT NOW() - INTERVAL %s SECOND", (minus_seconds,))
+        value = cursor.fetchone()[0]
+        cursor.close()
+        return value
+
+    def close(self):
+        if self.replicas:
+            self.replicas.close()
+
+
+class SQLiteRepository(UserRepository):
+    """
+    A SQLite file. Read-write opens use WAL, so readers (API threads and
+    processes) never wait for the writer (updater, CLI). Read-only opens
+    (mode=ro) serve an exported copy; when the file is replaced, pooled
+    connections to the old one are dropped within check_interval seconds.
+
+    Connections are kept in a small pool (sqlite3 connections may move
+    between threads as long as one thread uses them at a time); a forked
+    child starts with an empty pool.
+    """
+
+    backend = 'sqlite'
+    like_escape = " ESCAPE '\\'"
+
+    BULK_TABLE_SQL = """
+        CREATE TEMPORARY TABLE IF NOT EXISTS bulk_edits (
+            id INTEGER PRIMARY KEY,
+            status TEXT NULL,
+            expiry DATE NULL,
+            set_status INTEGER NOT NULL,
+            set_expiry INTEGER NOT NULL,
+            changed INTEGER NULL
+        )
+    """
+    BULK_FLAG_SQL = """
+        UPDATE bulk_edits AS e
+        SET changed = NOT (
+            (CASE WHEN e.set_status THEN e.status ELSE u.status END) IS u.status
+            AND (CASE WHEN e.set_expiry THEN e.expiry ELSE u.expiry END) IS u.expiry
+        )
+        FROM users AS u
+        WHERE u.id = e.id
+    """
+    BULK_APPLY_SQL = """
+        UPDATE users AS u
+        SET status = CASE WHEN e.set_status THEN e.status ELSE u.status END,
+            expiry = CASE WHEN e.set_expiry THEN e.expiry ELSE u.expiry END
+        FROM bulk_edits AS e
+        WHERE e.id = u.id AND e.changed
+    """
+
+    def __init__(self, path, read_only=False, timeout=5, max_idle=15, check_interval=1.0):
+        self.path = path
+        self.read_only = read_only
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.check_interval = check_interval
+
+        self._lock = threading.Lock()
+        self._idle = []
+        self._pid = os.getpid()
+        self._inode = None
+        self._checked_at = 0.0
+        self._counters = {'opened': 0, 'reopened': 0, 'in_use': 0}
+        self._schema_ready = read_only
+        self._closed = False
+
+    def describe(self):
+        return f"SQLite {self.path} ({'read-only' if self.read_only else 'read-write, WAL'})"
+
+    @property
+    def max_connections(self):
+        return self.max_idle
+
+    def _open(self, autocommit):
+        """Returns (sqlite3 connection, inode of the file it opened)"""
+        # The inode is taken before opening: if the file is replaced in
+        # between, the connection is merely dropped early, never kept on a stale copy
+        inode = os.stat(self.path).st_ino if self.read_only else None
+        if self.read_only:
+            conn = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True, timeout=self.timeout,
+                                   detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
+                                   check_same_thread=False)
+        else:
+            conn = sqlite3.connect(self.path, timeout=self.timeout,
+                                   detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            if not self._schema_ready:
+                create_schema(conn)
+                self._schema_ready = True
+        # Reads come from the page cache without a read() per page
+        conn.execute("PRAGMA mmap_size=268435456")
+        conn.isolation_level = None if autocommit else ''
+        self._counters['opened'] += 1
+        return conn, inode if inode is not None else os.stat(self.path).st_ino
+
+    def _current_inode(self):
+        """Inode of the file at path, looked up at most every check_interval seconds"""
+        now = time.monotonic()
+        if self._inode is None or now - self._checked_at >= self.check_interval:
+            self._checked_at = now
+            if not self.read_only and not os.path.exists(self.path):
+                # Read-write: the first open creates the file (and its schema)
+                return None
+            inode = os.stat(self.path).st_ino
+            if self._inode is not None and inode != self._inode:
+                self._counters['reopened'] += 1
+            self._inode = inode
+        return self._inode
+
+    def acquire(self):
+        """Pooled autocommit connection for one request; close() hands it back"""
+        with self._lock:
+            if self._pid != os.getpid():
+                # Connections must not cross a fork; the parent keeps using its own
+                self._pid = os.getpid()
+                self._idle = []
+                self._counters['in_use'] = 0
+            inode = self._current_inode()
+            while self._idle:
+                conn = self._idle.pop()
+                if conn.inode == inode:
+                    self._counters['in_use'] += 1
+                    return conn
+                conn.invalidate()
+            self._counters['in_use'] += 1
+        try:
+            raw, inode = self._open(autocommit=True)
+        except Exception:
+            with self._lock:
+                self._counters['in_use'] -= 1
+            raise
+        return SQLiteConnection(raw, inode, release=self._release)
+
+    def _release(self, conn):
+        with self._lock:
+            self._counters['in_use'] -= 1
+            if not self._closed and conn.inode == self._inode and len(self._idle) < self.max_idle \
+                    and not conn.conn.in_transaction:
+                self._idle.append(conn)
+                return
+        conn.invalidate()
+
+    def connect(self, autocommit=True):
+        """New unpooled connection (scripts and long transactions)"""
+        raw, inode = self._open(autocommit)
+        return SQLiteConnection(raw, inode)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, idle=len(self._idle), max_idle=self.max_idle)
+
+    def now(self, conn, minus_seconds=0):
+        cursor = conn.cursor()
+        cursor.execute("""SELECT datetime('now', 'localtime', %s) AS "now [timestamp]" """,
+                       (f'-{int(minus_seconds)} seconds',))
+        value = cursor.fetchone()[0]
+        cursor.close()
+        return value
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.invalidate()
+
+
+def create_schema(conn):
+    """Create the SQLite tables, indexes and triggers that don't exist yet (sqlite3 connection)"""
+    conn.executescript(SQLITE_TABLES + SQLITE_INDEXES + SQLITE_TRIGGERS)
+
+
+def repository_settings(config):
+    """Backend and its settings from a config (a change means a new repository)"""
+    backend = config.get('STORAGE_BACKEND', 'mysql').strip().lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"STORAGE_BACKEND must be one of {', '.join(BACKENDS)}, not {backend!r}")
+    if backend == 'mysql':
+        return (backend, replica_routing.router_settings(config))
+    pool = db.pool_settings(config)
+    return (backend, config.get('SQLITE_PATH', '/var/lib/demo/auth.sqlite3'),
+            config.get_bool('SQLITE_READ_ONLY', False), pool['timeout'], pool['size'] + pool['max_overflow'])
+
+
+_repositories = {}
+_repositories_lock = threading.Lock()
+
+
+def get_repository(env_path=None):
+    """
+    Shared repository for the backend the .venv file selects with STORAGE_BACKEND
+    (mysql or sqlite); changed storage settings take effect on the next call
+    """
+    config = get_config(env_path)
+    settings = repository_settings(config)
+    current = _repositories.get(config.env_path)
+    if current is None or current[0] != settings:
+        with _repositories_lock:
+            current = _repositories.get(config.env_path)
+            if current is None or current[0] != settings:
+                if settings[0] == 'mysql':
+                    repository = MySQLRepository(config)
+                else:
+                    path, read_only, timeout, max_idle = settings[1:]
+                    repository = SQLiteRepository(path, read_only, timeout, max_idle)
+                if current is not None:
+                    current[1].close()
+                current = (settings, repository)
+                _repositories[config.env_path] = current
+    return current[1]
+
+
+def export_sqlite(path, config=None, batch_rows=10000, progress=None):
+    """
+    Copy users and the change log from MySQL into a new SQLite file at path
+
+    Both tables are read in one consistent snapshot and written next to path,
+    which is then renamed over it, so readers never see a partial copy;
+    user_stats is recounted from the copied users. The copy keeps the
+    change log ids, so an API serving it follows new users across exports.
+    It is written in rollback-journal mode for read-only serving: a file
+    that was opened read-write (WAL) must not be replaced this way.
+    Returns {'users': rows, 'user_changes': rows, 'bytes': size, 'seconds': elapsed}
+    """
+    config = config or get_config()
+    if os.path.exists(path + '-wal'):
+        raise RuntimeError(f"{path} is in WAL mode (opened read-write); export to a path that is only served read-only")
+    started = time.monotonic()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f'{path}.tmp-{os.getpid()}'
+    if os.path.exists(tmp_path):
+        os.unlink(tmp_path)
+
+    source = db.connect(config=config)
+    target = sqlite3.connect(tmp_path)
+    counts = {}
+    try:
+        source.start_transaction(consistent_snapshot=True, readonly=True)
+        # A half-written file is thrown away, so the load needs no journal
+        target.execute("PRAGMA journal_mode=OFF")
+        target.execute("PRAGMA synchronous=OFF")
+        target.executescript(SQLITE_TABLES)
+        for table, columns in (('users', USER_COLUMNS), ('user_changes', changes.COLUMNS)):
+            insert = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['?'] * len(columns))})"
+            # Unbuffered: rows stream in batches instead of the whole table in memory
+            cursor = source.cursor()
+            cursor.execute(f"SELECT {', '.join(columns)} FROM {table} ORDER BY id")
+            counts[table] = 0
+            while True:
+                rows = cursor.fetchmany(batch_rows)
+                if not rows:
+                    break
+                target.executemany(insert, rows)
+                counts[table] += len(rows)
+            cursor.close()
+            if progress:
+                progress(f"📥 {table}: {counts[table]} rows")
+        source.commit()
+
+        # Indexes and triggers after the load: one sorted build per index,
+        # and no per-row statistics upkeep
+        target.execute(stats.REBUILD_SQL)
+        target.commit()
+        target.executescript(SQLITE_INDEXES + SQLITE_TRIGGERS)
+        target.execute("ANALYZE")
+        target.commit()
+        target.execute("PRAGMA journal_mode=DELETE")
+        target.close()
+    except Exception:
+        target.close()
+        source.close()
+        os.unlink(tmp_path)
+        raise
+    source.close()
+    os.replace(tmp_path, path)
+    counts['bytes'] = os.path.getsize(path)
+    counts['seconds'] = round(time.monotonic() - started, 3)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SQLite copies of the user database')
+    action = parser.add_mutually_exclusive_group(required=True)
+    action.add_argument('--export-sqlite', metavar='PATH',
+                        help='copy users and the change log from MySQL into a read-only SQLite file')
+    action.add_argument('--init-sqlite', metavar='PATH',
+                        help='create an empty read-write SQLite database (WAL) with the schema')
+    parser.add_argument('--batch-rows', type=int, default=10000, help='rows per insert batch when exporting')
+    args = parser.parse_args()
+
+    if args.init_sqlite:
+        repository = SQLiteRepository(args.init_sqlite)
+        repository.connect().close()
+        print(f"✅ SQLite database ready at {args.init_sqlite}")
+        return
+    try:
+        summary = export_sqlite(args.export_sqlite, batch_rows=args.batch_rows, progress=print)
+    except (db.Error, sqlite3.Error, OSError, RuntimeError) as e:
+        print(f"❌ Export failed: {e}")
+        sys.exit(1)
+    print(f"✅ Exported {summary['users']} users and {summary['user_changes']} changes to "
+          f"{args.export_sqlite} ({summary['bytes'] / 2 ** 20:.1f} MiB, {summary['seconds']:.1f}s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -28,6 +28,7 @@ echo "📁 Copying PHP files to /var/www/html..."
 sudo cp www/register.php /var/www/html/
 sudo cp www/login.php /var/www/html/
 sudo cp www/env_loader.php /var/www/html/
+sudo cp www/password_hash.php /var/www/html/
 sudo cp system_scripts/software_client.py /var/www/html
 
 # Copy .htaccess if it exists
@@ -95,28 +95,123 @@ CREATE TABLE IF NOT EXISTS users (
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
 );
 
--- Index for better performance
-CREATE INDEX IF NOT EXISTS idx_username ON users(username);
-CREATE INDEX IF NOT EXISTS idx_status ON users(status);
-CREATE INDEX IF NOT EXISTS idx_expiry ON users(expiry);
+-- Status/expiry and auth lookup indexes come from the schema migrations
+-- (lib/authcore/migrations.py, applied by 06_finalize.sh)
+-- Used by the API's auth cache invalidation sweep
+CREATE INDEX IF NOT EXISTS idx_updated_at ON users(updated_at);
 EOF
 
     echo "✅ Database tables created"
 }
 
+# Function to create the maintained statistics table and its triggers
+# (safe to re-run; also brings backups taken before the table existed up to date)
+create_stats_table() {
+    echo "📈 Creating subscription statistics table..."
+
+    sudo mysql -u "$DB_USER" -p"$DB_PASS" "$DB_NAME" << 'EOF'
+-- User counts per status and expiry date, kept current by the triggers below
+-- ('9999-12-31' stands for "never expires"; read by lib/authcore/stats.py)
+CREATE TABLE IF NOT EXISTS user_stats (
+    status ENUM('active', 'inactive') NOT NULL,
+    expiry DATE NOT NULL,
+    users INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (status, expiry)
+);
+
+DROP TRIGGER IF EXISTS users_stats_insert;
+DROP TRIGGER IF EXISTS users_stats_update;
+DROP TRIGGER IF EXISTS users_stats_delete;
+
+DELIMITER $$
+CREATE TRIGGER users_stats_insert AFTER INSERT ON users FOR EACH ROW
+BEGIN
+    INSERT INTO user_stats (status, expiry, users)
+    VALUES (NEW.status, COALESCE(NEW.expiry, '9999-12-31'), 1)
+    ON DUPLICATE KEY UPDATE users = users + 1;
+END$$
+
+CREATE TRIGGER users_stats_update AFTER UPDATE ON users FOR EACH ROW
+BEGIN
+    IF NOT (NEW.status <=> OLD.status AND NEW.expiry <=> OLD.expiry) THEN
+        UPDATE user_stats SET users = users - 1
+        WHERE status = OLD.status AND expiry = COALESCE(OLD.expiry, '9999-12-31');
+        INSERT INTO user_stats (status, expiry, users)
+        VALUES (NEW.status, COALESCE(NEW.expiry, '9999-12-31'), 1)
+        ON DUPLICATE KEY UPDATE users = users + 1;
+    END IF;
+END$$
+
+CREATE TRIGGER users_stats_delete AFTER DELETE ON users FOR EACH ROW
+BEGIN
+    UPDATE user_stats SET users = users - 1
+    WHERE status = OLD.status AND expiry = COALESCE(OLD.expiry, '9999-12-31');
+END$$
+DELIMITER ;
+
+-- Start from an exact count of whatever users already holds
+LOCK TABLES users READ, user_stats WRITE;
+DELETE FROM user_stats;
+INSERT INTO user_stats (status, expiry, users)
+SELECT status, COALESCE(expiry, '9999-12-31'), COUNT(*)
+FROM users
+GROUP BY status, COALESCE(expiry, '9999-12-31');
+UNLOCK TABLES;
+EOF
+
+    echo "✅ Statistics table created"
+}
+
+# Function to create the change feed log (safe to re-run)
+create_change_log() {
+    echo "📜 Creating user change log..."
+
+    sudo mysql -u "$DB_USER" -p"$DB_PASS" "$DB_NAME" << 'EOF'
+-- Append-only log of user/subscription changes, served by the API's /changes feed
+-- (written in the same transaction as each change; pruned by the subscription updater)
+CREATE TABLE IF NOT EXISTS user_changes (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    user_id INT NOT NULL,
+    username VARCHAR(50) NOT NULL,
+    status ENUM('active', 'inactive') NULL,
+    expiry DATE NULL,
+    source VARCHAR(32) NOT NULL,
+    changed_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+    INDEX idx_changed_at (changed_at)
+);
+EOF
+
+    echo "✅ Change log created"
+}
+
+# Virtual environment for the Python backup tool (also set up by 05_cron_jobs.sh)
+ensure_backup_tool() {
+    if [ ! -x /usr/local/lib/mysql_backup/venv/bin/python3 ]; then
+        echo "🐍 Setting up backup tool virtual environment..."
+        sudo mkdir -p /usr/local/lib/mysql_backup
+        sudo python3 -m venv /usr/local/lib/mysql_backup/venv
+        sudo /usr/local/lib/mysql_backup/venv/bin/pip install mysql-connector-python
+    fi
+}
+
 # Function to restore from backup
 restore_backup() {
     local backup_file="$1"
     
-    if [ ! -f "$backup_file" ]; then
+    if [ ! -e "$backup_file" ]; then
         echo "❌ Backup file not found: $backup_file"
         return 1
     fi
     
     echo "🔄 Restoring database from backup: $backup_file"
-    
-    # Check if backup is compressed
-    if [[ "$backup_file" == *.gz ]]; then
+
+    # Backup directories from mysql_backup.sh (authcore.backup): parallel bulk load
+    if [ -d "$backup_file" ] || [[ "$backup_file" == */manifest.json ]]; then
+        ensure_backup_tool
+        DEMO_ENV_FILE="$PWD/config/.venv" PYTHONPATH="$PWD/lib" \
+            /usr/local/lib/mysql_backup/venv/bin/python3 -m authcore.backup --restore "${backup_file%/manifest.json}"
+    # Single-file dumps from older versions of mysql_backup.sh
+    elif [[ "$backup_file" == *.gz ]]; then
         gunzip -c "$backup_file" | sudo mysql -u "$DB_USER" -p"$DB_PASS" "$DB_NAME"
     else
         sudo mysql -u "$DB_USER" -p"$DB_PASS" "$DB_NAME" < "$backup_file"
@@ -140,7 +235,7 @@ prompt_for_backup() {
     read -p "Restore from backup? (y/N): " restore_choice
     
     if [[ "$restore_choice" =~ ^[Yy]$ ]]; then
-        read -p "Enter the full path to the backup file: " backup_path
+        read -p "Enter the full path to the backup (directory or .sql/.sql.gz file): " backup_path
         
         if [ -n "$backup_path" ]; then
             if restore_backup "$backup_path"; then
@@ -195,6 +290,10 @@ if ! prompt_for_backup; then
     create_sample_data
 fi
 
+# Statistics table and change log (after a restore too, for older backups)
+create_stats_table
+create_change_log
+
 # Test database connection
 echo "🧪 Testing database connection..."
 if mysql -u "$DB_USER" -p"$DB_PASS" -h "$DB_HOST" -e "USE $DB_NAME; SELECT 'Connection successful' AS status;" 2>/dev/null; then
@@ -7,8 +7,17 @@ echo "🐍 Setting up Python API with virtual environment..."
 # Create API directory
 sudo mkdir -p /var/www/api
 
-# Copy API file
+# Copy API files
 sudo cp api/app.py /var/www/api/
+sudo cp api/asgi_app.py /var/www/api/
+sudo cp api/gunicorn.conf.py /var/www/api/
+
+# Install the shared runtime package used by the API and the system scripts
+sudo mkdir -p /usr/local/lib/demo
+sudo rm -rf /usr/local/lib/demo/authcore
+sudo cp -r lib/authcore /usr/local/lib/demo/
+sudo find /usr/local/lib/demo -type d -exec chmod 755 {} +
+sudo find /usr/local/lib/demo -type f -exec chmod 644 {} +
 
 # Create virtual environment with sudo
 cd /var/www/api
@@ -16,11 +25,13 @@ sudo python3 -m venv venv
 
 # Install Python packages with sudo
 sudo ./venv/bin/pip install --upgrade pip
-sudo ./venv/bin/pip install flask mysql-connector-python requests
+sudo ./venv/bin/pip install flask mysql-connector-python requests uvicorn gunicorn cryptography
 
 # Set ownership to www-data AFTER everything is installed
 sudo chown -R www-data:www-data /var/www/api
 sudo chmod 755 /var/www/api
 sudo chmod 644 /var/www/api/app.py
+sudo chmod 644 /var/www/api/asgi_app.py
+sudo chmod 644 /var/www/api/gunicorn.conf.py
 
 echo "✅ Python API setup completed with virtual environment"
@@ -10,6 +10,13 @@ sudo mkdir -p /usr/local/bin
 # Copy system scripts from nested structure
 echo "📁 Installing system scripts..."
 
+# Shared runtime package (also installed by 04_python_api.sh)
+sudo mkdir -p /usr/local/lib/demo
+sudo rm -rf /usr/local/lib/demo/authcore
+sudo cp -r lib/authcore /usr/local/lib/demo/
+sudo find /usr/local/lib/demo -type d -exec chmod 755 {} +
+sudo find /usr/local/lib/demo -type f -exec chmod 644 {} +
+
 # Copy backup script
 sudo cp system_scripts/mysql_backup_script/mysql_backup.sh /usr/local/bin/
 
@@ -45,12 +52,23 @@ cd /usr/local/lib/user_management
 sudo python3 -m venv venv
 sudo ./venv/bin/pip install mysql-connector-python
 
+# Backup tool venv (also created by 03_mysql_setup.sh when restoring)
+echo "Setting up backup tool virtual environment..."
+sudo mkdir -p /usr/local/lib/mysql_backup
+cd /usr/local/lib/mysql_backup
+sudo python3 -m venv venv
+sudo ./venv/bin/pip install mysql-connector-python
+
 # Create log directories
 sudo mkdir -p /var/log/mysql_backups
 sudo mkdir -p /var/log/subscription_updates
 sudo chown $USER:$USER /var/log/mysql_backups
 sudo chown $USER:$USER /var/log/subscription_updates
 
+# Checkpoint directory for resumable subscription updates
+sudo mkdir -p /var/lib/demo
+sudo chown $USER:$USER /var/lib/demo
+
 # Add cron jobs - using a temporary file to avoid crontab issues
 echo "📅 Setting up cron jobs..."
 
@@ -67,8 +85,12 @@ fi
 # Add our cron jobs
 echo "# Authentication System Cron Jobs" >> "$TEMP_CRON"
 echo "0 2 * * * /usr/local/bin/mysql_backup.sh >> /var/log/mysql_backups/backup.log 2>&1" >> "$TEMP_CRON"
-echo "0 3 * * * /usr/local/lib/subscription_updater/venv/bin/python3 /usr/local/bin/subscription_updater.py >> /var/log/subscription_updates/updater.log 2>&1" >> "$TEMP_CRON"
-echo "0 4 * * * find /var/backups/mysql -name \"*.sql.gz\" -mtime +7 -delete >> /var/log/mysql_backups/cleanup.log 2>&1" >> "$TEMP_CRON"
+# Incremental: only rows whose expiry passed or that were edited since the last run
+# (falls back to a full pass when its state is missing or stale). For updates
+# right at midnight instead, run subscription_updater.py --daemon as a service
+echo "0 3 * * * /usr/local/lib/subscription_updater/venv/bin/python3 /usr/local/bin/subscription_updater.py --incremental >> /var/log/subscription_updates/updater.log 2>&1" >> "$TEMP_CRON"
+# Backups are directories (older ones single .sql.gz files)
+echo "0 4 * * * find /var/backups/mysql -maxdepth 1 -name \"*_backup_*\" -mtime +7 -exec rm -rf {} + >> /var/log/mysql_backups/cleanup.log 2>&1" >> "$TEMP_CRON"
 
 # Install the new crontab
 crontab "$TEMP_CRON"
@@ -76,7 +98,7 @@ rm -f "$TEMP_CRON"
 
 echo "✅ Cron jobs installed:"
 echo "   - Database backup: Daily at 2 AM"
-echo "   - Subscription updates: Daily at 3 AM (using virtual environment)" 
+echo "   - Subscription updates: Daily at 3 AM, incremental (using virtual environment)" 
 echo "   - Backup cleanup: Daily at 4 AM"
 
 # Display current crontab
@@ -90,7 +112,7 @@ echo "🔧 Creating wrapper scripts for manual execution..."
 # Wrapper for subscription updater
 sudo tee /usr/local/bin/update_subscriptions > /dev/null <<'EOF'
 #!/bin/bash
-/usr/local/lib/subscription_updater/venv/bin/python3 /usr/local/bin/subscription_updater.py
+/usr/local/lib/subscription_updater/venv/bin/python3 /usr/local/bin/subscription_updater.py "$@"
 EOF
 
 # Wrapper for user management
@@ -113,3 +135,4 @@ echo "💡 Manual commands:"
 echo "   Run subscription update: update_subscriptions"
 echo "   Manage users: manage_users"
 echo "   Run backup: /usr/local/bin/mysql_backup.sh"
+echo "   Verify a backup: PYTHONPATH=/usr/local/lib/demo /usr/local/lib/mysql_backup/venv/bin/python3 -m authcore.backup --verify <dir>"
@@ -22,6 +22,21 @@ else
     echo "❌ Warning: Apache cannot read .venv file"
 fi
 
+# License token signing key (the API signs, clients get only the public key)
+if [ ! -f /etc/demo/license_key.pem ]; then
+    sudo openssl genpkey -algorithm ed25519 -out /etc/demo/license_key.pem
+    echo "🔑 Generated license signing key"
+fi
+sudo chmod 640 /etc/demo/license_key.pem
+sudo chown root:www-data /etc/demo/license_key.pem
+sudo openssl pkey -in /etc/demo/license_key.pem -pubout -out /etc/demo/license_public.pem
+sudo chmod 644 /etc/demo/license_public.pem
+echo "✅ License public key for clients: /etc/demo/license_public.pem"
+
+# Schema migrations (idempotent; also brings a restored backup up to date)
+echo "🧬 Applying database schema migrations..."
+PYTHONPATH=/usr/local/lib/demo /var/www/api/venv/bin/python3 -m authcore.migrations
+
 echo "✅ All services will use /etc/demo/.venv for configuration"
 echo ""
 echo "🎉 Provisioning completed!"
@@ -9,16 +9,26 @@ if screen -list | grep -q "flask_api"; then
     sleep 2
 fi
 
+# API server:
+#   API_MODE=prefork (default) - gunicorn master with API_WORKERS worker processes
+#   API_MODE=asgi              - single-process async server
+#   API_MODE=dev               - Flask development server
+case "${API_MODE:-prefork}" in
+    asgi) API_SCRIPT="python3 asgi_app.py" ;;
+    dev)  API_SCRIPT="python3 app.py" ;;
+    *)    API_SCRIPT="gunicorn -c gunicorn.conf.py app:app" ;;
+esac
+
 # Start Flask API in a screen session using the virtual environment
-echo "🚀 Starting Flask API in screen session (using virtual environment)..."
-screen -dmS flask_api bash -c '
-    echo "Starting Flask Authentication API with virtual environment..."
+echo "🚀 Starting Flask API ($API_SCRIPT) in screen session (using virtual environment)..."
+screen -dmS flask_api bash -c "
+    echo 'Starting Authentication API ($API_SCRIPT) with virtual environment...'
     cd /var/www/api
     source venv/bin/activate
-    python3 app.py
-    echo "Flask API stopped. Press Ctrl+A then D to detach, or wait to exit."
+    $API_SCRIPT
+    echo 'Flask API stopped. Press Ctrl+A then D to detach, or wait to exit.'
     sleep 5
-'
+"
 
 # Wait a moment for the API to start
 sleep 3
@@ -65,3 +75,7 @@ echo "💡 Commands:"
 echo "   View API logs: screen -r flask_api"
 echo "   Stop API: screen -S flask_api -X quit"
 echo "   Restart everything: ./start_services.sh"
+echo "   Async (ASGI) API: API_MODE=asgi ./start_services.sh"
+echo "   Flask dev server: API_MODE=dev ./start_services.sh"
+echo "   Worker health: curl -s http://localhost:5000/status"
+echo "   Load balancer probes: /health/live (process up), /health/ready (database reachable)"
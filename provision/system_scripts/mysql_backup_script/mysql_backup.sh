@@ -9,8 +9,9 @@ source /etc/demo/.venv
 # Configuration
 BACKUP_DIR="/var/backups/mysql"
 DATE=$(date +%Y%m%d_%H%M%S)
-BACKUP_FILE="$BACKUP_DIR/${DB_NAME}_backup_$DATE.sql"
+BACKUP_PATH="$BACKUP_DIR/${DB_NAME}_backup_$DATE"
 LOG_FILE="/var/log/mysql_backups/backup.log"
+BACKUP_PYTHON="/usr/local/lib/mysql_backup/venv/bin/python3"
 
 # Ensure backup directory exists and has proper permissions
 sudo mkdir -p "$BACKUP_DIR"
@@ -25,23 +26,17 @@ log() {
 # Start backup
 log "Starting MySQL backup of database: $DB_NAME"
 
-# Perform the backup
-if mysqldump -h "$DB_HOST" -u "$DB_USER" -p"$DB_PASS" "$DB_NAME" | sudo tee "$BACKUP_FILE" > /dev/null; then
-    # Compress the backup
-    if sudo gzip "$BACKUP_FILE"; then
-        BACKUP_FILE="${BACKUP_FILE}.gz"
-        FILE_SIZE=$(sudo du -h "$BACKUP_FILE" | cut -f1)
-        log "Backup completed successfully: $BACKUP_FILE ($FILE_SIZE)"
-    else
-        log "Failed to compress backup: $BACKUP_FILE"
-        exit 1
-    fi
+# Parallel chunked dump from one consistent snapshot, with a checksummed
+# manifest (lib/authcore/backup.py); restore with 03_mysql_setup.sh or
+# PYTHONPATH=/usr/local/lib/demo $BACKUP_PYTHON -m authcore.backup --restore <dir>
+if PYTHONPATH=/usr/local/lib/demo "$BACKUP_PYTHON" -m authcore.backup --backup "$BACKUP_PATH" 2>&1 | sudo tee -a "$LOG_FILE" \
+        && [ -f "$BACKUP_PATH/manifest.json" ]; then
+    BACKUP_SIZE=$(du -sh "$BACKUP_PATH" | cut -f1)
+    log "Backup completed successfully: $BACKUP_PATH ($BACKUP_SIZE)"
 else
-    log "MySQL dump failed for database: $DB_NAME"
+    log "Backup failed for database: $DB_NAME"
+    rm -rf "$BACKUP_PATH"
     exit 1
 fi
 
-# Set proper ownership of the backup file
-sudo chown $USER:$USER "${BACKUP_FILE}.gz"
-
 log "Backup process completed"
@@ -2,18 +2,71 @@
 """
 Local Subscription Status Checker
 Requests username/password and checks subscription status via API
+
+When the server's license public key is available (DEMO_LICENSE_PUBLIC_KEY,
+default /etc/demo/license_public.pem) and the 'cryptography' package is
+installed, the signed license token returned by /authenticate is cached and
+later launches are checked offline until it nears the end of its validity window
+
+Otherwise the last result per user is kept on disk and revalidated with its
+ETag, so an unchanged subscription costs the server an empty 304 reply
+
+Benchmark mode replays a credential file against /authenticate (no prompts):
+    python3 software_client.py --benchmark creds.csv --concurrency 50 --rate 500 --duration 30
+creds.csv rows are `username,password[,kind]` with kind `valid` (default) or
+`expired`; wrong-password and unknown-user requests are derived from them.
+The server's rate limits throttle a load test from one host within seconds:
+benchmark with RATE_LIMIT_ENABLED=false (or much higher RATE_LIMIT_* values).
+Rate-limited requests (HTTP 429) are reported separately and left out of
+the latency summary
 """
 
 import requests
+import argparse
+import base64
+import csv
+import hashlib
 import json
+import os
+import random
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from getpass import getpass
 from datetime import datetime
 
 class SubscriptionChecker:
-    def __init__(self, api_url="http://localhost:5000"):
+    # Must not exceed AUTH_BATCH_MAX on the server
+    BATCH_SIZE = 100
+    # Renew a cached license once less than this fraction of its window is left
+    REFRESH_AHEAD = 0.25
+    # Iterations for the local password check guarding cached licenses
+    PASSWORD_ITERATIONS = 200000
+    
+    def __init__(self, api_url="http://localhost:5000", public_key_path=None, license_cache_path=None,
+                 result_cache_path=None):
         self.api_url = api_url.rstrip('/')
         self.session = requests.Session()
+        self.public_key = self._load_public_key(
+            public_key_path or os.environ.get('DEMO_LICENSE_PUBLIC_KEY', '/etc/demo/license_public.pem'))
+        cache_dir = os.path.join(os.path.expanduser('~'), '.cache', 'demo')
+        self.license_cache_path = license_cache_path or os.path.join(cache_dir, 'licenses.json')
+        self.result_cache_path = result_cache_path or os.path.join(cache_dir, 'results.json')
+    
+    @property
+    def offline_enabled(self):
+        return self.public_key is not None
+    
+    @staticmethod
+    def _load_public_key(path):
+        """Ed25519 public key used to verify license tokens, or None if unavailable"""
+        try:
+            from cryptography.hazmat.primitives import serialization
+            with open(path, 'rb') as f:
+                return serialization.load_pem_public_key(f.read())
+        except (ImportError, OSError, ValueError):
+            return None
     
     def check_api_status(self):
         """Check if the API is reachable"""
@@ -26,23 +79,45 @@ class SubscriptionChecker:
     def check_subscription_status(self, username, password):
         """
         Check subscription status for the given user
+        Uses a cached license token when one is valid, the server otherwise
         """
+        if self.offline_enabled:
+            result = self._check_cached_license(username, password)
+            if result is not None:
+                return result
+        
         try:
             # Prepare payload with only username and password
             payload = {
                 'username': username,
                 'password': password
             }
+            headers = {'Content-Type': 'application/json'}
+            cached = None
+            if self.offline_enabled:
+                payload['issue_token'] = True
+            else:
+                cached = self._read_json(self.result_cache_path).get(username)
+                if cached:
+                    headers['If-None-Match'] = f'"{cached["version"]}"'
             
             print("🔐 Checking subscription status...")
             response = self.session.post(
                 f"{self.api_url}/authenticate",
                 json=payload,
-                headers={'Content-Type': 'application/json'},
+                headers=headers,
                 timeout=30
             )
             
-            return self._handle_response(response)
+            if response.status_code == 304 and cached:
+                return cached['result']
+            
+            result = self._handle_response(response)
+            if result.get('license'):
+                self._store_license(username, password, result['license']['token'])
+            elif result.get('version'):
+                self._store_result(username, result)
+            return result
             
         except requests.exceptions.Timeout:
             return {
@@ -63,6 +138,196 @@ class SubscriptionChecker:
                 'subscription_active': False
             }
     
+    def check_many(self, credentials):
+        """
+        Check several users with the batch endpoint
+        credentials: iterable of (username, password) pairs
+        Returns one result per pair, in order, shaped like check_subscription_status()
+        """
+        credentials = list(credentials)
+        results = []
+        
+        for start in range(0, len(credentials), self.BATCH_SIZE):
+            chunk = credentials[start:start + self.BATCH_SIZE]
+            payload = {
+                'credentials': [
+                    {'username': username, 'password': password}
+                    for username, password in chunk
+                ]
+            }
+            
+            try:
+                response = self.session.post(
+                    f"{self.api_url}/authenticate/batch",
+                    json=payload,
+                    headers={'Content-Type': 'application/json'},
+                    timeout=30
+                )
+                data = response.json()
+            except requests.exceptions.Timeout:
+                results.extend(self._error_result('Request timeout - server took too long to respond') for _ in chunk)
+                continue
+            except requests.exceptions.ConnectionError:
+                results.extend(self._error_result(f'Cannot connect to {self.api_url}. Make sure Flask app is running.') for _ in chunk)
+                continue
+            except (requests.exceptions.RequestException, ValueError) as e:
+                results.extend(self._error_result(f'Unexpected error: {str(e)}') for _ in chunk)
+                continue
+            
+            if response.status_code != 200:
+                message = f'Error (HTTP {response.status_code}): {data.get("message", "Unknown error")}'
+                results.extend(self._error_result(message) for _ in chunk)
+                continue
+            
+            for entry in data.get('results', []):
+                results.append(self._result_for(entry.get('http_status'), entry))
+        
+        return results
+    
+    # License tokens: base64url(JSON claims) "." base64url(Ed25519 signature),
+    # as issued by authcore.license on the server
+    
+    def _verify_token(self, token):
+        """Claims of a correctly signed token (validity window not checked), or None"""
+        from cryptography.exceptions import InvalidSignature
+        try:
+            payload_b64, signature_b64 = token.split('.')
+            payload = base64.urlsafe_b64decode(payload_b64 + '=' * (-len(payload_b64) % 4))
+            signature = base64.urlsafe_b64decode(signature_b64 + '=' * (-len(signature_b64) % 4))
+            self.public_key.verify(signature, payload)
+            claims = json.loads(payload)
+        except (AttributeError, ValueError, InvalidSignature):
+            return None
+        return claims if claims.get('v') == 1 else None
+    
+    def _password_digest(self, password, salt):
+        return hashlib.pbkdf2_hmac('sha256', password.encode(), salt, self.PASSWORD_ITERATIONS).hex()
+    
+    @staticmethod
+    def _read_json(path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    @staticmethod
+    def _write_json(path, data):
+        """Replace a private (0600) cache file; cache write failures are ignored"""
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+    
+    def _store_result(self, username, result):
+        """Keep the last server result so the next check can be revalidated with its ETag"""
+        results = self._read_json(self.result_cache_path)
+        results[username] = {'version': result['version'], 'result': result}
+        self._write_json(self.result_cache_path, results)
+    
+    def _store_license(self, username, password, token):
+        """Cache a token together with a salted password digest for offline checks"""
+        licenses = self._read_json(self.license_cache_path)
+        salt = os.urandom(16)
+        licenses[username] = {
+            'token': token,
+            'salt': salt.hex(),
+            'password': self._password_digest(password, salt)
+        }
+        self._write_json(self.license_cache_path, licenses)
+    
+    def _drop_license(self, username):
+        licenses = self._read_json(self.license_cache_path)
+        if licenses.pop(username, None) is not None:
+            self._write_json(self.license_cache_path, licenses)
+    
+    def _check_cached_license(self, username, password):
+        """
+        Result from the cached license, refreshing it when it is near or past
+        the end of its window; None means the server has to be asked
+        """
+        entry = self._read_json(self.license_cache_path).get(username)
+        if not entry:
+            return None
+        if self._password_digest(password, bytes.fromhex(entry['salt'])) != entry['password']:
+            return None
+        
+        claims = self._verify_token(entry['token'])
+        if claims is None or str(claims.get('sub', '')).casefold() != username.casefold():
+            self._drop_license(username)
+            return None
+        
+        now = time.time()
+        remaining = claims['vu'] - now
+        if remaining > (claims['vu'] - claims['iat']) * self.REFRESH_AHEAD and claims['iat'] <= now + 300:
+            return self._license_result(claims, 'Active subscription (offline license)')
+        
+        refreshed = self.refresh_license(entry['token'])
+        if refreshed is not None:
+            if refreshed.get('license'):
+                self._store_license(username, password, refreshed['license']['token'])
+            elif not refreshed['success']:
+                self._drop_license(username)
+                if refreshed.get('reauthenticate'):
+                    # Token too old or password changed: check the password with the server
+                    return None
+            return refreshed
+        
+        # Server unreachable: the current token is still good until it lapses
+        if remaining > 0:
+            return self._license_result(claims, 'Active subscription (offline license, renewal pending)')
+        return None
+    
+    def refresh_license(self, token):
+        """
+        Renew a license token via /license/refresh
+        Returns a result dict ('reauthenticate' set when the server wants the
+        password again), or None if the server could not be reached
+        """
+        try:
+            response = self.session.post(
+                f"{self.api_url}/license/refresh",
+                json={'token': token},
+                headers={'Content-Type': 'application/json'},
+                timeout=5
+            )
+        except requests.exceptions.RequestException:
+            return None
+        if response.status_code >= 500:
+            return None
+        result = self._handle_response(response)
+        if response.status_code == 401:
+            result['reauthenticate'] = True
+        return result
+    
+    @staticmethod
+    def _license_result(claims, message):
+        return {
+            'success': True,
+            'message': message,
+            'user': {
+                'id': claims['uid'],
+                'username': claims['sub'],
+                'status': claims['st'],
+                'expiry': claims['exp']
+            },
+            'subscription_active': True,
+            'offline': True
+        }
+    
+    @staticmethod
+    def _error_result(message):
+        return {
+            'success': False,
+            'message': message,
+            'subscription_active': False
+        }
+    
     def _handle_response(self, response):
         """Handle API response"""
         try:
@@ -74,21 +339,33 @@ class SubscriptionChecker:
                 'subscription_active': False
             }
         
-        if response.status_code == 200:
-            return {
+        return self._result_for(response.status_code, data)
+    
+    def _result_for(self, status_code, data):
+        """Translate an HTTP status and /authenticate body into a result dict"""
+        if status_code == 200:
+            result = {
                 'success': True,
                 'message': data.get('message', 'Authentication successful'),
                 'user': data.get('user', {}),
                 'subscription_active': data.get('subscription_active', False)
             }
-        elif response.status_code == 403:
-            return {
+            if data.get('license'):
+                result['license'] = data['license']
+            if data.get('version'):
+                result['version'] = data['version']
+            return result
+        elif status_code == 403:
+            result = {
                 'success': False,
                 'message': data.get('message', 'Subscription inactive or expired'),
                 'user': data.get('user', {}),
                 'subscription_active': False
             }
-        elif response.status_code == 401:
+            if data.get('version'):
+                result['version'] = data['version']
+            return result
+        elif status_code == 401:
             return {
                 'success': False,
                 'message': data.get('message', 'Invalid username or password'),
@@ -97,7 +374,7 @@ class SubscriptionChecker:
         else:
             return {
                 'success': False,
-                'message': f'Error (HTTP {response.status_code}): {data.get("message", "Unknown error")}',
+                'message': f'Error (HTTP {status_code}): {data.get("message", "Unknown error")}',
                 'subscription_active': False
             }
     
@@ -152,24 +429,269 @@ def display_subscription_status(result, checker):
             print(f"📊 Current Status: {user_info.get('status', 'unknown')}")
             print(f"📅 Current Expiry: {checker.format_expiry_display(user_info.get('expiry'))}")
 
+# Benchmark mode
+
+# Result code each kind of request should get
+EXPECTED_STATUS = {'valid': 200, 'wrong_password': 401, 'unknown_user': 401, 'expired': 403}
+DEFAULT_MIX = 'valid=70,wrong_password=10,unknown_user=10,expired=10'
+
+def load_credentials(path):
+    """Read `username,password[,kind]` rows into {'valid': [...], 'expired': [...]}"""
+    credentials = {'valid': [], 'expired': []}
+    with open(path, newline='') as f:
+        for row in csv.reader(f):
+            if not row or row[0].startswith('#') or row[0] == 'username':
+                continue
+            kind = row[2].strip() if len(row) > 2 and row[2].strip() else 'valid'
+            if kind not in credentials:
+                raise ValueError(f"Unknown credential kind '{kind}' (expected valid or expired)")
+            credentials[kind].append((row[0].strip(), row[1]))
+    return credentials
+
+def parse_mix(text):
+    """'valid=70,expired=30' -> {'valid': 0.7, 'expired': 0.3}"""
+    weights = {}
+    for part in text.split(','):
+        kind, _, weight = part.partition('=')
+        kind = kind.strip()
+        if kind not in EXPECTED_STATUS:
+            raise ValueError(f"Unknown request kind '{kind}' (expected one of {', '.join(EXPECTED_STATUS)})")
+        weights[kind] = float(weight)
+    total = sum(weights.values())
+    return {kind: weight / total for kind, weight in weights.items() if weight > 0}
+
+class RequestMix:
+    """Draws (kind, username, password) according to the mix weights"""
+    
+    def __init__(self, credentials, mix, seed=None):
+        if mix.get('expired') and not credentials['expired']:
+            raise ValueError("Mix asks for expired users but the credential file has none")
+        if any(mix.get(kind) for kind in ('valid', 'wrong_password')) and not credentials['valid']:
+            raise ValueError("Mix asks for valid users but the credential file has none")
+        self.credentials = credentials
+        self.kinds = list(mix)
+        self.weights = [mix[kind] for kind in self.kinds]
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+    
+    def next(self):
+        with self.lock:
+            kind = self.random.choices(self.kinds, self.weights)[0]
+            if kind == 'unknown_user':
+                return kind, f"bench_unknown_{self.random.getrandbits(48):x}", 'not-a-password'
+            username, password = self.random.choice(self.credentials['expired' if kind == 'expired' else 'valid'])
+        if kind == 'wrong_password':
+            password = password + '-wrong'
+        return kind, username, password
+
+class BenchmarkRecorder:
+    """
+    Latencies per result code plus expected/unexpected counts per request kind
+    Rate-limited requests (429) are counted on their own: they measure the
+    limiter, not the authentication path
+    """
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.by_kind = {}
+    
+    def record(self, kind, code, latency):
+        with self.lock:
+            self.latencies.setdefault(code, []).append(latency)
+            counts = self.by_kind.setdefault(kind, {'requests': 0, 'unexpected': 0, 'rate_limited': 0})
+            counts['requests'] += 1
+            if code == 429:
+                counts['rate_limited'] += 1
+            elif code != EXPECTED_STATUS[kind]:
+                counts['unexpected'] += 1
+    
+    def report(self, elapsed):
+        codes = {}
+        everything = []
+        requests = 0
+        for code, values in self.latencies.items():
+            values = sorted(values)
+            requests += len(values)
+            if code != 429:
+                everything.extend(values)
+            codes[str(code)] = dict(latency_summary(values), requests=len(values))
+        everything.sort()
+        return {
+            'elapsed_seconds': round(elapsed, 3),
+            'requests': requests,
+            'rate_limited': len(self.latencies.get(429, ())),
+            'throughput_rps': round(requests / elapsed, 1) if elapsed else 0.0,
+            'latency_ms': latency_summary(everything),
+            'by_code': codes,
+            'by_kind': self.by_kind,
+        }
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def latency_summary(sorted_values):
+    summary = {}
+    for name, pct in (('p50', 50), ('p95', 95), ('p99', 99), ('max', 100)):
+        value = percentile(sorted_values, pct)
+        summary[name] = round(value * 1000, 3) if value is not None else None
+    return summary
+
+def run_benchmark(api_url, credentials, mix, concurrency=10, rate=0, duration=10, max_requests=0,
+                  timeout=10, seed=None):
+    """
+    Drive /authenticate and return a report dict
+
+    concurrency  - worker threads (each with its own SubscriptionChecker session)
+    rate         - open loop: Poisson arrivals per second, latency measured from
+                   the scheduled arrival so queueing delay is not hidden;
+                   0 runs closed loop (each worker sends as soon as it is done)
+    duration     - seconds to run; max_requests stops earlier when set
+    """
+    requests_mix = RequestMix(credentials, mix, seed)
+    recorder = BenchmarkRecorder()
+    local = threading.local()
+    
+    def send(scheduled):
+        checker = getattr(local, 'checker', None)
+        if checker is None:
+            checker = local.checker = SubscriptionChecker(api_url)
+        kind, username, password = requests_mix.next()
+        try:
+            response = checker.session.post(
+                f"{checker.api_url}/authenticate",
+                json={'username': username, 'password': password},
+                timeout=timeout
+            )
+            code = response.status_code
+        except requests.exceptions.Timeout:
+            code = 'timeout'
+        except requests.exceptions.RequestException:
+            code = 'error'
+        recorder.record(kind, code, time.perf_counter() - scheduled)
+    
+    started = time.perf_counter()
+    deadline = started + duration
+    issued = 0
+    
+    if rate > 0:
+        arrivals = random.Random(seed)
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            next_arrival = started
+            while next_arrival < deadline and (not max_requests or issued < max_requests):
+                delay = next_arrival - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(send, next_arrival)
+                issued += 1
+                next_arrival += arrivals.expovariate(rate)
+    else:
+        counter_lock = threading.Lock()
+        
+        def worker():
+            nonlocal issued
+            while time.perf_counter() < deadline:
+                with counter_lock:
+                    if max_requests and issued >= max_requests:
+                        return
+                    issued += 1
+                send(time.perf_counter())
+        
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    
+    return recorder.report(time.perf_counter() - started)
+
+def print_benchmark_report(report):
+    print("\n" + "="*72)
+    print(f"📊 {report['requests']} requests in {report['elapsed_seconds']}s "
+          f"= {report['throughput_rps']} req/s")
+    print("="*72)
+    print(f"{'Code':<10} {'Requests':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    rows = sorted(report['by_code'].items()) + [
+        ('all', dict(report['latency_ms'], requests=report['requests'] - report['rate_limited']))]
+    for code, stats in rows:
+        print(f"{code:<10} {stats['requests']:>9} " + ' '.join(
+            f"{stats[name]:>9.2f}" if stats[name] is not None else f"{'-':>9}"
+            for name in ('p50', 'p95', 'p99', 'max')))
+    print()
+    for kind, counts in sorted(report['by_kind'].items()):
+        marker = "✅" if counts['unexpected'] == 0 else "⚠️"
+        print(f"{marker} {kind}: {counts['requests']} requests, "
+              f"{counts['unexpected']} without the expected HTTP {EXPECTED_STATUS[kind]}, "
+              f"{counts['rate_limited']} rate limited")
+    if report['rate_limited']:
+        print(f"\n⚠️ {report['rate_limited']} requests were rate limited (HTTP 429, left out of 'all'). "
+              f"Benchmark with RATE_LIMIT_ENABLED=false or higher RATE_LIMIT_* values on the server")
+
+def benchmark_main(args):
+    credentials = load_credentials(args.benchmark)
+    mix = parse_mix(args.mix)
+    mode = f"open loop at {args.rate} req/s" if args.rate > 0 else "closed loop"
+    # Progress goes to stderr so that with --json stdout holds only the report
+    print(f"🏁 Benchmarking {args.api_url}/authenticate: {args.concurrency} workers, {mode}, "
+          f"{args.duration}s, mix {args.mix}", file=sys.stderr)
+    report = run_benchmark(args.api_url, credentials, mix, concurrency=args.concurrency, rate=args.rate,
+                           duration=args.duration, max_requests=args.requests,
+                           timeout=args.timeout, seed=args.seed)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_benchmark_report(report)
+    unexpected = sum(counts['unexpected'] for counts in report['by_kind'].values())
+    sys.exit(1 if args.fail_on_unexpected and unexpected else 0)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Check a subscription, or benchmark the auth API')
+    parser.add_argument('--api-url', default='http://localhost:5000')
+    bench = parser.add_argument_group('benchmark mode')
+    bench.add_argument('--benchmark', metavar='CREDENTIALS_CSV',
+                       help='replay credentials from a CSV file instead of prompting')
+    bench.add_argument('--concurrency', type=int, default=10, help='worker threads (default: 10)')
+    bench.add_argument('--rate', type=float, default=0,
+                       help='open-loop arrival rate in req/s (default: 0 = closed loop)')
+    bench.add_argument('--duration', type=float, default=10, help='seconds to run (default: 10)')
+    bench.add_argument('--requests', type=int, default=0, help='stop after this many requests')
+    bench.add_argument('--mix', default=DEFAULT_MIX, help=f'request kinds and weights (default: {DEFAULT_MIX})')
+    bench.add_argument('--timeout', type=float, default=10, help='per-request timeout in seconds')
+    bench.add_argument('--seed', type=int, help='random seed for a repeatable request sequence')
+    bench.add_argument('--json', action='store_true', help='print only the report, as JSON, on stdout')
+    bench.add_argument('--fail-on-unexpected', action='store_true',
+                       help='exit 1 if any request got a different code than its kind expects (for CI)')
+    return parser.parse_args()
+
 def main():
+    args = parse_args()
+    if args.benchmark:
+        benchmark_main(args)
+        return
+    
     print("🔒 Subscription Status Checker")
     print("="*40)
     
     # Initialize checker
-    checker = SubscriptionChecker()
+    checker = SubscriptionChecker(args.api_url)
     
     # Check API connection
     print("📡 Checking API connection...")
-    if not checker.check_api_status():
+    if checker.offline_enabled and os.path.exists(checker.license_cache_path):
+        # A cached license may make the server unnecessary; don't probe it up front
+        print("🎫 Offline license checks enabled")
+    elif not checker.check_api_status():
         print("❌ Cannot connect to the authentication server")
         print("Please make sure:")
         print("1. Your Flask app is running (python3 app.py)")
         print("2. It's running on http://localhost:5000")
         print("3. No firewall is blocking port 5000")
         sys.exit(1)
-    
-    print("✅ Connected to authentication server")
+    else:
+        print("✅ Connected to authentication server")
     print()
     
     # Get user credentials
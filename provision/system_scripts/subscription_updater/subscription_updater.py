@@ -4,176 +4,396 @@ Subscription Status Updater
 Cron job that runs daily to update user subscription statuses based on expiry dates
 """
 
-import mysql.connector
-from datetime import datetime, date
+from datetime import date, datetime, timedelta
+import argparse
+import json
+import signal
 import sys
 import os
+import tempfile
+import threading
+import time
 
-def load_env_file(env_path="/etc/demo/.venv"):
-    """Load environment variables from .venv file"""
-    env_vars = {}
-    try:
-        with open(env_path, 'r') as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith('#'):
-                    key, value = line.split('=', 1)
-                    env_vars[key.strip()] = value.strip().strip('"\'')
-        return env_vars
-    except FileNotFoundError:
-        print(f"❌ Error: Environment file not found at {env_path}")
-        sys.exit(1)
-    except Exception as e:
-        print(f"❌ Error reading environment file: {e}")
-        sys.exit(1)
+# Shared runtime package: /usr/local/lib/demo when deployed, provision/lib in a checkout
+sys.path.insert(0, os.environ.get('DEMO_LIB_PATH', '/usr/local/lib/demo'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'lib'))
+
+from authcore import changes
+from authcore import log as logs
+from authcore import stats
+from authcore import storage
+from authcore.config import get_config, load_env_file
+from authcore.storage import STATUS_UPDATES, get_repository
+
+log = logs.get_logger('subscription_updater')
 
 def get_db_connection():
-    """Create database connection using credentials from .venv file"""
-    env_vars = load_env_file()
+    """Open a connection to the configured storage backend (STORAGE_BACKEND in .venv)"""
+    load_env_file()
     
     try:
-        connection = mysql.connector.connect(
-            host=env_vars.get('DB_HOST', 'localhost'),
-            database=env_vars.get('DB_NAME', 'your_database_name'),
-            user=env_vars.get('DB_USER', 'your_username'),
-            password=env_vars.get('DB_PASS', 'your_password'),
-            autocommit=True
-        )
-        return connection
-    except mysql.connector.Error as e:
-        print(f"❌ Database connection error: {e}")
+        # Each batch is its own short transaction, committed explicitly
+        return get_repository().connect(autocommit=False)
+    except (storage.Error, OSError) as e:
+        log.error("Database connection error", error=str(e))
         return None
 
-def update_subscription_statuses():
-    """Update user subscription statuses based on expiry dates"""
-    print(f"🔄 Starting subscription status update - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+def read_user_stats(conn, current_date):
+    """User counts from the maintained user_stats table (full recount if it is missing)"""
+    try:
+        return stats.read_stats(conn, current_date)
+    except storage.Error as e:
+        log.warning("Statistics table unavailable, counting users instead", error=str(e))
+        return stats.recount(conn, current_date)
+
+def prune_change_log(conn):
+    """Drop change feed entries older than CHANGES_RETENTION_DAYS (0 = keep everything)"""
+    days = get_config().get_int('CHANGES_RETENTION_DAYS', 7)
+    if days <= 0:
+        return
+    deleted = changes.prune(conn, days)
+    if deleted:
+        log.info("Pruned change feed", rows=deleted, older_than_days=days)
+
+def verify_statistics(repair=False):
+    """Reconcile user_stats against a full recount of users; rebuilds it when repair is set"""
+    log.info("Verifying subscription statistics")
+    conn = get_db_connection()
+    if not conn:
+        log.error("Failed to connect to database")
+        return False
+    
+    try:
+        mismatches = stats.verify(conn, repair=repair)
+        conn.close()
+    except storage.Error as e:
+        log.error("Database error during verification", error=str(e))
+        conn.rollback()
+        conn.close()
+        return False
+    
+    if not mismatches:
+        log.info("Statistics match a full recount")
+        return True
+    for field, (maintained, recounted) in mismatches.items():
+        log.warning("Statistics mismatch", field=field, maintained=maintained, recounted=recounted)
+    if repair:
+        log.info("Statistics table rebuilt from users")
+        return True
+    log.error("Statistics out of date (run with --repair-stats to rebuild)")
+    return False
+
+def load_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def save_json(path, data):
+    """Atomically replace a checkpoint or state file"""
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def load_checkpoint(path, current_date):
+    """Progress of an interrupted run from today, or None"""
+    checkpoint = load_json(path)
+    if not checkpoint or checkpoint.get('date') != current_date.isoformat():
+        return None
+    return checkpoint
+
+def clear_checkpoint(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+def update_subscription_statuses(batch_size=None, batch_sleep=None, checkpoint_path=None, restart=False):
+    """
+    Update user subscription statuses based on expiry dates
+
+    Rows are processed in primary-key order, batch_size rows per short
+    transaction (0 = the whole table in one transaction), sleeping batch_sleep
+    seconds between batches. Progress is checkpointed after every batch, so a
+    run interrupted today resumes where it stopped.
+    """
+    log.info("Starting subscription status update")
     
     conn = get_db_connection()
     if not conn:
-        print("❌ Failed to connect to database")
+        log.error("Failed to connect to database")
         return False
     
+    config = get_config()
+    if batch_size is None:
+        batch_size = config.get_int('UPDATER_BATCH_SIZE', 1000)
+    if batch_sleep is None:
+        batch_sleep = config.get_float('UPDATER_BATCH_SLEEP', 0)
+    if checkpoint_path is None:
+        checkpoint_path = config.get('UPDATER_CHECKPOINT', '/var/lib/demo/subscription_updater.json')
+    
+    repository = get_repository()
     try:
-        cursor = conn.cursor(dictionary=True)
-        
         # Get current date
         current_date = date.today()
-        print(f"📅 Current date: {current_date}")
-        
-        # Count users before update
-        cursor.execute("SELECT COUNT(*) as total_users FROM users")
-        total_users = cursor.fetchone()['total_users']
-        
-        cursor.execute("""
-            SELECT COUNT(*) as active_users 
-            FROM users 
-            WHERE status = 'active'
-        """)
-        active_users_before = cursor.fetchone()['active_users']
-        
-        print(f"📊 Total users: {total_users}")
-        print(f"📊 Active users before update: {active_users_before}")
-        
-        # Update users with expired subscriptions to inactive
-        update_expired_query = """
-            UPDATE users 
-            SET status = 'inactive' 
-            WHERE status = 'active' 
-            AND expiry IS NOT NULL 
-            AND expiry < %s
-        """
-        
-        cursor.execute(update_expired_query, (current_date,))
-        expired_count = cursor.rowcount
-        
-        print(f"🔴 Set {expired_count} users to inactive (subscription expired)")
-        
-        # Update users with future expiry dates back to active
-        # This handles cases where a user purchases a new subscription
-        update_active_query = """
-            UPDATE users 
-            SET status = 'active' 
-            WHERE status = 'inactive' 
-            AND expiry IS NOT NULL 
-            AND expiry >= %s
-        """
-        
-        cursor.execute(update_active_query, (current_date,))
-        reactivated_count = cursor.rowcount
-        
-        print(f"🟢 Reactivated {reactivated_count} users (subscription valid)")
-        
-        # Handle users with lifetime subscriptions (no expiry date)
-        update_lifetime_query = """
-            UPDATE users 
-            SET status = 'active' 
-            WHERE status = 'inactive' 
-            AND expiry IS NULL
-        """
-        
-        cursor.execute(update_lifetime_query)
-        lifetime_reactivated = cursor.rowcount
-        
-        print(f"⭐ Reactivated {lifetime_reactivated} lifetime subscription users")
+        log.info("Current date", date=current_date)
+        
+        checkpoint = None if restart else load_checkpoint(checkpoint_path, current_date)
+        if checkpoint:
+            log.info("Resuming from checkpoint", last_id=checkpoint['last_id'],
+                     batches=checkpoint['batches'], path=checkpoint_path)
+        else:
+            # Count users before update (maintained statistics, no table scan)
+            counts_before = read_user_stats(conn, current_date)
+            total_users = counts_before['total']
+            active_users_before = counts_before['active']
+            conn.commit()
+            
+            checkpoint = {
+                'date': current_date.isoformat(),
+                'last_id': 0,
+                'batches': 0,
+                'total_users': total_users,
+                'active_before': active_users_before,
+                'counts': {name: 0 for name, new_status, condition, uses_date in STATUS_UPDATES},
+            }
+        
+        log.info("Users before update", total=checkpoint['total_users'], active=checkpoint['active_before'])
+        log.info("Batch settings", batch_size=batch_size or 'all', sleep=batch_sleep)
+        
+        started = time.monotonic()
+        while True:
+            last_id = checkpoint['last_id']
+            if batch_size > 0:
+                batch_end = repository.next_batch_end(conn, last_id, batch_size)
+            else:
+                batch_end = repository.max_user_id(conn)
+            if batch_end is None or batch_end <= last_id:
+                conn.commit()
+                break
+            
+            batch_counts = repository.update_statuses_in_range(conn, last_id, batch_end, current_date,
+                                                               'subscription_updater')
+            conn.commit()
+            
+            for name, count in batch_counts.items():
+                checkpoint['counts'][name] += count
+            checkpoint['last_id'] = batch_end
+            checkpoint['batches'] += 1
+            save_json(checkpoint_path, checkpoint)
+            log.debug("Batch committed", first_id=last_id + 1, last_id=batch_end, **batch_counts)
+            
+            if batch_size <= 0:
+                break
+            if batch_sleep > 0:
+                time.sleep(batch_sleep)
+        
+        counts = checkpoint['counts']
+        log.info("Users set to inactive (subscription expired)", count=counts['expired'])
+        log.info("Users reactivated (subscription valid)", count=counts['reactivated'])
+        log.info("Lifetime subscription users reactivated", count=counts['lifetime_reactivated'])
+        log.info("Batches processed", batches=checkpoint['batches'],
+                 seconds=round(time.monotonic() - started, 3))
         
         # Count users after update
-        cursor.execute("""
-            SELECT COUNT(*) as active_users 
-            FROM users 
-            WHERE status = 'active'
-        """)
-        active_users_after = cursor.fetchone()['active_users']
-        
-        print(f"📊 Active users after update: {active_users_after}")
-        print(f"📈 Net change: {active_users_after - active_users_before}")
-        
-        # Get detailed breakdown
-        cursor.execute("""
-            SELECT 
-                COUNT(*) as total,
-                SUM(CASE WHEN expiry IS NULL THEN 1 ELSE 0 END) as lifetime,
-                SUM(CASE WHEN expiry IS NOT NULL AND expiry >= %s THEN 1 ELSE 0 END) as active_with_expiry,
-                SUM(CASE WHEN expiry IS NOT NULL AND expiry < %s THEN 1 ELSE 0 END) as expired
-            FROM users 
-            WHERE status = 'active'
-        """, (current_date, current_date))
-        
-        breakdown = cursor.fetchone()
-        
-        print("\n📋 Active Users Breakdown:")
-        print(f"   • Total active: {breakdown['total']}")
-        print(f"   • Lifetime subscriptions: {breakdown['lifetime']}")
-        print(f"   • Active with expiry: {breakdown['active_with_expiry']}")
-        print(f"   • Expired (should be 0): {breakdown['expired']}")
-        
-        cursor.close()
+        counts_after = read_user_stats(conn, current_date)
+        conn.commit()
+        active_users_after = counts_after['active']
+        
+        log.info("Active users after update", active=active_users_after,
+                 net_change=active_users_after - checkpoint['active_before'])
+        
+        # Detailed breakdown
+        log.info("Active users breakdown", total=counts_after['active'], lifetime=counts_after['lifetime'],
+                 active_with_expiry=counts_after['active_with_expiry'], expired=counts_after['expired'])
+        
+        prune_change_log(conn)
+        conn.close()
+        clear_checkpoint(checkpoint_path)
+        
+        log.info("Subscription status update completed successfully")
+        return True
+        
+    except storage.Error as e:
+        log.error("Database error during update", error=str(e))
+        conn.rollback()
+        conn.close()
+        return False
+    except Exception as e:
+        log.exception("Unexpected error")
+        conn.rollback()
+        conn.close()
+        return False
+
+def db_now(conn, minus_seconds=0):
+    """Database clock, optionally moved back (timestamps are compared with updated_at)"""
+    value = get_repository().now(conn, minus_seconds)
+    conn.commit()
+    return value
+
+def update_incrementally(batch_size=None, state_path=None):
+    """
+    Only re-evaluate rows that can have changed since the last run:
+      - active users whose expiry date fell between the last run's date and today (idx_status_expiry)
+      - rows edited since the last run (idx_updated_at), e.g. a renewed subscription
+    Falls back to a full pass when there is no usable state (first run, or the
+    last run is more than UPDATER_FULL_AFTER_DAYS old)
+    """
+    config = get_config()
+    if batch_size is None:
+        batch_size = config.get_int('UPDATER_BATCH_SIZE', 1000)
+    if state_path is None:
+        state_path = config.get('UPDATER_STATE', '/var/lib/demo/subscription_updater_state.json')
+    full_after_days = config.get_int('UPDATER_FULL_AFTER_DAYS', 7)
+    # Rows committed by transactions that started before the previous run
+    # finished can carry an older updated_at; look back this far past it
+    edit_margin = config.get_int('UPDATER_EDIT_MARGIN', 300)
+    
+    current_date = date.today()
+    state = load_json(state_path)
+    last_date = date.fromisoformat(state['last_date']) if state else None
+    
+    conn = get_db_connection()
+    if not conn:
+        log.error("Failed to connect to database")
+        return False
+    
+    if last_date is None or (current_date - last_date).days > full_after_days or last_date > current_date:
+        log.info("No recent incremental state, running a full pass", state=state_path, last_date=last_date)
+        next_since = db_now(conn, edit_margin)
+        conn.close()
+        if not update_subscription_statuses(batch_size=batch_size):
+            return False
+        save_json(state_path, {'last_date': current_date.isoformat(), 'since': str(next_since)})
+        return True
+    
+    log.info("Starting incremental subscription status update", since_date=last_date,
+             since_edit=state['since'])
+    try:
+        next_since = db_now(conn, edit_margin)
+        repository = get_repository()
+        
+        # Expiry dates in [last_date, today) were still valid at the last run and are not now
+        expiring = repository.expiring_user_ids(conn, last_date, current_date)
+        edited = repository.edited_user_ids(conn, state['since'])
+        conn.commit()
+        
+        ids = sorted(set(expiring) | set(edited))
+        log.info("Candidate rows", expiring=len(expiring), edited=len(edited), total=len(ids))
+        
+        counts = {name: 0 for name, new_status, condition, uses_date in STATUS_UPDATES}
+        step = batch_size if batch_size > 0 else max(len(ids), 1)
+        for start in range(0, len(ids), step):
+            chunk = ids[start:start + step]
+            for name, count in repository.update_statuses_for_ids(conn, chunk, current_date,
+                                                                   'subscription_updater').items():
+                counts[name] += count
+            conn.commit()
+        
+        prune_change_log(conn)
         conn.close()
+        save_json(state_path, {'last_date': current_date.isoformat(), 'since': str(next_since)})
         
-        print(f"✅ Subscription status update completed successfully")
+        log.info("Users set to inactive (subscription expired)", count=counts['expired'])
+        log.info("Users reactivated (subscription valid)", count=counts['reactivated'])
+        log.info("Lifetime subscription users reactivated", count=counts['lifetime_reactivated'])
+        log.info("Incremental subscription status update completed successfully")
         return True
         
-    except mysql.connector.Error as e:
-        print(f"❌ Database error during update: {e}")
+    except storage.Error as e:
+        log.error("Database error during update", error=str(e))
+        conn.rollback()
         conn.close()
         return False
     except Exception as e:
-        print(f"❌ Unexpected error: {e}")
+        log.exception("Unexpected error")
+        conn.rollback()
         conn.close()
         return False
 
+def seconds_until_next_expiry_boundary(now=None):
+    """Seconds until local midnight, when yesterday's expiry dates lapse"""
+    now = now or datetime.now()
+    boundary = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+    return (boundary - now).total_seconds()
+
+def run_daemon(batch_size=None, state_path=None, poll_interval=None):
+    """
+    Run incremental updates at every expiry boundary (midnight), and every
+    poll_interval seconds in between to pick up edited rows (0 = only at midnight)
+    """
+    if poll_interval is None:
+        poll_interval = get_config().get_float('UPDATER_POLL_INTERVAL', 300)
+    stop = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *args: stop.set())
+    
+    log.info("Subscription updater daemon started", poll_interval=poll_interval or 'midnight only')
+    while not stop.is_set():
+        ok = update_incrementally(batch_size, state_path)
+        
+        # A second past midnight, so date.today() has already moved on
+        wait = seconds_until_next_expiry_boundary() + 1
+        if poll_interval > 0:
+            wait = min(wait, poll_interval)
+        if not ok:
+            wait = min(wait, 60)
+        log.info("Next run", in_seconds=round(wait, 1))
+        stop.wait(wait)
+    
+    log.info("Subscription updater daemon stopped")
+    return True
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Update subscription statuses from expiry dates')
+    parser.add_argument('--batch-size', type=int,
+                        help='rows per transaction, 0 = whole table at once (default: UPDATER_BATCH_SIZE or 1000)')
+    parser.add_argument('--sleep', type=float, dest='batch_sleep',
+                        help='seconds to pause between batches (default: UPDATER_BATCH_SLEEP or 0)')
+    parser.add_argument('--checkpoint', dest='checkpoint_path',
+                        help='progress file (default: UPDATER_CHECKPOINT)')
+    parser.add_argument('--restart', action='store_true',
+                        help="ignore today's checkpoint and start from the first row")
+    parser.add_argument('--incremental', action='store_true',
+                        help='only process rows whose expiry passed or that were edited since the last run')
+    parser.add_argument('--daemon', action='store_true',
+                        help='keep running, updating incrementally at each expiry boundary')
+    parser.add_argument('--state', dest='state_path',
+                        help='incremental state file (default: UPDATER_STATE)')
+    parser.add_argument('--poll-interval', type=float,
+                        help='daemon: seconds between runs for edited rows, 0 = midnight only '
+                             '(default: UPDATER_POLL_INTERVAL or 300)')
+    parser.add_argument('--verify-stats', action='store_true',
+                        help='compare the user_stats table with a full recount and exit')
+    parser.add_argument('--repair-stats', action='store_true',
+                        help='like --verify-stats, but rebuild user_stats when it disagrees')
+    return parser.parse_args()
+
 def main():
     """Main function"""
-    print("=" * 60)
-    print("🔐 AUTOMATIC SUBSCRIPTION STATUS UPDATER")
-    print("=" * 60)
+    args = parse_args()
+    load_env_file()
+    logs.setup_from_config(get_config())
+    log.info("AUTOMATIC SUBSCRIPTION STATUS UPDATER")
     
-    success = update_subscription_statuses()
+    if args.verify_stats or args.repair_stats:
+        success = verify_statistics(repair=args.repair_stats)
+    elif args.daemon:
+        success = run_daemon(args.batch_size, args.state_path, args.poll_interval)
+    elif args.incremental:
+        success = update_incrementally(args.batch_size, args.state_path)
+    else:
+        success = update_subscription_statuses(args.batch_size, args.batch_sleep, args.checkpoint_path, args.restart)
     
     if success:
-        print(f"🎉 Cron job completed successfully - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        log.info("Cron job completed successfully")
         sys.exit(0)
     else:
-        print(f"💥 Cron job failed - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        log.error("Cron job failed")
         sys.exit(1)
 
 if __name__ == "__main__":
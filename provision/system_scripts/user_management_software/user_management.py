@@ -3,68 +3,178 @@
 User Management Script
 Lists users from database and allows editing subscription status and expiry dates
 Uses environment variables from .venv file
+
+Bulk mode: user_management.py --bulk edits.csv [--dry-run] [--batch-size 1000]
 """
 
+import argparse
+import csv
+import itertools
+import json
 import os
-import mysql.connector
-from mysql.connector import Error
 from datetime import datetime, timedelta
 import sys
+import time
+
+# Shared runtime package: /usr/local/lib/demo when deployed, provision/lib in a checkout
+sys.path.insert(0, os.environ.get('DEMO_LIB_PATH', '/usr/local/lib/demo'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'lib'))
+
+from authcore import log as logs
+from authcore import stats
+from authcore import storage
+from authcore.config import DEFAULT_ENV_PATH, get_config, load_env_file
+from authcore.storage import get_repository
 
-def load_env_file(env_path):
-    """Load environment variables from .venv file"""
-    env_vars = {}
+log = logs.get_logger('user_management')
+
+def create_db_connection(env_path=None):
+    """Create a connection to the configured storage backend (STORAGE_BACKEND in .venv)"""
     try:
-        with open(env_path, 'r') as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith('#'):
-                    key, value = line.split('=', 1)
-                    env_vars[key.strip()] = value.strip().strip('"\'')
-        return env_vars
-    except FileNotFoundError:
-        print(f"Error: Environment file not found at {env_path}")
-        sys.exit(1)
-    except Exception as e:
-        print(f"Error reading environment file: {e}")
+        return get_repository(env_path).connect(autocommit=False)
+    except (storage.Error, OSError) as e:
+        log.error("Error connecting to the user database", error=str(e))
+        logs.flush()
         sys.exit(1)
 
-def create_db_connection(env_vars):
-    """Create database connection using environment variables"""
+# time.monotonic() of this session's last committed edit (None: no edits yet)
+_last_write = None
+
+def read_listing(connection, query):
+    """
+    Run query(repository, conn) for the user listing on a replica in rotation
+    (DB_REPLICAS), or on `connection` (the primary) when there is none, the
+    replica fails, or this session committed an edit that replicas may not
+    have yet, so the edit shows up in the list
+    """
+    repository = get_repository(DEFAULT_ENV_PATH)
+    fresh = _last_write is not None and time.monotonic() - _last_write < repository.read_staleness
+    replica = None if fresh else repository.acquire_replica()
+    if replica is not None:
+        try:
+            result = query(repository, replica)
+            replica.close()
+            return result
+        except storage.Error as e:
+            repository.replica_failed(replica, e)
+    result = query(repository, connection)
+    connection.commit()
+    return result
+
+def get_users_page(connection, filters, start_id=0, page_size=25):
+    """
+    One page of users with id >= start_id, in id order, and whether more follow
+    (keyset pagination, see UserRepository.users_page)
+    """
     try:
-        connection = mysql.connector.connect(
-            host=env_vars.get('DB_HOST', 'localhost'),
-            database=env_vars.get('DB_NAME', 'your_database_name'),
-            user=env_vars.get('DB_USER', 'your_username'),
-            password=env_vars.get('DB_PASS', 'your_password')
-        )
-        return connection
-    except Error as e:
-        print(f"Error connecting to MySQL database: {e}")
-        sys.exit(1)
+        return read_listing(connection, lambda repository, conn:
+                            repository.users_page(conn, filters, start_id, page_size))
+    except storage.Error as e:
+        log.error("Error fetching users", error=str(e))
+        return [], False
 
-def get_all_users(connection):
-    """Get all users from the database"""
+def get_previous_page_start(connection, filters, first_id, page_size=25):
+    """start_id of the page before the one beginning at first_id (0 if there is none)"""
     try:
-        cursor = connection.cursor(dictionary=True)
-        
-        # Get all users with status and expiry
-        cursor.execute("""
-            SELECT id, username, password, status, expiry
-            FROM users 
-            ORDER BY id
-        """)
-        users = cursor.fetchall()
-        cursor.close()
-        return users
-    except Error as e:
-        print(f"Error fetching users: {e}")
-        return []
+        return read_listing(connection, lambda repository, conn:
+                            repository.previous_page_start(conn, filters, first_id, page_size))
+    except storage.Error as e:
+        log.error("Error fetching users", error=str(e))
+        return 0
+
+def describe_filters(filters):
+    """Human readable summary of the active listing filters"""
+    parts = []
+    if filters.get('prefix'):
+        parts.append(f"username '{filters['prefix']}*'")
+    if filters.get('status'):
+        parts.append(f"status {filters['status']}")
+    if filters.get('never_expires'):
+        parts.append("expiry never")
+    if filters.get('expiry_from') or filters.get('expiry_to'):
+        parts.append(f"expiry {filters.get('expiry_from') or '...'} to {filters.get('expiry_to') or '...'}")
+    return ', '.join(parts) or 'none'
+
+def prompt_filters():
+    """Ask for listing filters; empty answers leave a filter off"""
+    filters = {}
+    prefix = input("Username starts with (empty = any): ").strip()
+    if prefix:
+        filters['prefix'] = prefix
+    
+    status = input("Status (active/inactive, empty = any): ").strip().lower()
+    if status in ('active', 'inactive'):
+        filters['status'] = status
+    elif status:
+        print("Unknown status, ignoring.")
+    
+    print("Expiry range: dates like '2024-12-31' or '+30'; 'never' for lifetime subscriptions")
+    expiry_from = input("Expiry from (empty = any): ").strip()
+    if expiry_from.lower() == 'never':
+        filters['never_expires'] = True
+        return filters
+    if expiry_from:
+        filters['expiry_from'] = parse_date_input(expiry_from)
+        if not filters['expiry_from']:
+            print("Invalid date format, ignoring.")
+            del filters['expiry_from']
+    expiry_to = input("Expiry to (empty = any): ").strip()
+    if expiry_to:
+        filters['expiry_to'] = parse_date_input(expiry_to)
+        if not filters['expiry_to']:
+            print("Invalid date format, ignoring.")
+            del filters['expiry_to']
+    return filters
+
+def get_user_stats(connection):
+    """Get user counts from the maintained statistics table"""
+    try:
+        counts = stats.read_stats(connection)
+        connection.commit()
+        return counts
+    except storage.Error as e:
+        log.error("Error reading user statistics", error=str(e))
+        return None
+
+def display_stats(counts):
+    """Display a one-line summary of subscription counts"""
+    if not counts:
+        return
+    print(f"\nUsers: {counts['total']}  Active: {counts['active']} "
+          f"(lifetime {counts['lifetime']}, with expiry {counts['active_with_expiry']}, "
+          f"expired {counts['expired']})  Inactive: {counts['inactive']}")
+
+def verify_stats(connection):
+    """Reconcile the statistics table against a full recount, offering a rebuild"""
+    try:
+        mismatches = stats.verify(connection)
+    except storage.Error as e:
+        log.error("Error verifying user statistics", error=str(e))
+        connection.rollback()
+        return
+    
+    if not mismatches:
+        print("Statistics match a full recount.")
+        return
+    
+    print(f"\n{'Count':<20} {'Maintained':>10} {'Recounted':>10}")
+    for field, (maintained, recounted) in mismatches.items():
+        print(f"{field:<20} {maintained:>10} {recounted:>10}")
+    
+    if input("\nRebuild the statistics table? (y/n): ").strip().lower() == 'y':
+        try:
+            stats.rebuild(connection)
+            log.info("User statistics rebuilt")
+            print("Statistics rebuilt.")
+        except storage.Error as e:
+            log.error("Error rebuilding user statistics", error=str(e))
+            connection.rollback()
+            print("Failed to rebuild statistics.")
 
 def display_users(users):
     """Display users in a formatted table"""
     if not users:
-        print("No users found in the database.")
+        print("No users found.")
         return
     
     print("\n" + "=" * 90)
@@ -107,35 +217,24 @@ def display_users(users):
 def get_user_by_id(connection, user_id):
     """Get a specific user by ID"""
     try:
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute("""
-            SELECT id, username, password, status, expiry
-            FROM users 
-            WHERE id = %s
-        """, (user_id,))
-        user = cursor.fetchone()
-        cursor.close()
-        return user
-    except Error as e:
-        print(f"Error fetching user: {e}")
+        return get_repository(DEFAULT_ENV_PATH).get_user(connection, user_id)
+    except storage.Error as e:
+        log.error("Error fetching user", user_id=user_id, error=str(e))
         return None
 
 def update_user_subscription(connection, user_id, new_status, new_expiry):
     """Update user's subscription status and expiry date"""
+    global _last_write
     try:
-        cursor = connection.cursor()
-        
-        cursor.execute("""
-            UPDATE users 
-            SET status = %s, expiry = %s 
-            WHERE id = %s
-        """, (new_status, new_expiry, user_id))
-        
+        get_repository(DEFAULT_ENV_PATH).update_subscription(connection, user_id, new_status, new_expiry,
+                                                             'user_management')
         connection.commit()
-        cursor.close()
+        _last_write = time.monotonic()
+        log.info("Subscription updated", user_id=user_id, status=new_status, expiry=new_expiry)
         return True
-    except Error as e:
-        print(f"Error updating subscription: {e}")
+    except storage.Error as e:
+        log.error("Error updating subscription", user_id=user_id, error=str(e))
+        connection.rollback()
         return False
 
 def parse_date_input(date_input):
@@ -168,25 +267,252 @@ def parse_date_input(date_input):
     
     return None
 
+BULK_FIELDS = ('id', 'username', 'status', 'expiry')
+
+def open_bulk_input(path, fmt=None):
+    """
+    Open a bulk edit file ('-' = stdin) and work out its format
+    Returns (line iterator, 'csv' or 'ndjson')
+    """
+    stream = sys.stdin if path == '-' else open(path, newline='')
+    if fmt is None:
+        if path.endswith('.csv'):
+            fmt = 'csv'
+        elif path.endswith(('.ndjson', '.jsonl', '.json')):
+            fmt = 'ndjson'
+        else:
+            # Peek at the first line: JSON objects start with '{'
+            first = stream.readline()
+            fmt = 'ndjson' if first.lstrip().startswith('{') else 'csv'
+            return itertools.chain([first], stream), fmt
+    return stream, fmt
+
+def read_bulk_records(lines, fmt):
+    """Yield (line number, record dict) from CSV (with a header row) or NDJSON lines"""
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        unknown = set(reader.fieldnames or ()) - set(BULK_FIELDS)
+        if unknown or not reader.fieldnames:
+            raise ValueError(f"CSV header must use the columns {', '.join(BULK_FIELDS)}")
+        for record in reader:
+            yield reader.line_num, record
+        return
+    for line_no, line in enumerate(lines, 1):
+        if line.strip():
+            try:
+                yield line_no, json.loads(line)
+            except ValueError:
+                yield line_no, None
+
+def parse_bulk_edit(record):
+    """
+    Normalize one bulk edit record; raises ValueError with the reason
+    Returns {'id', 'username', 'status', 'expiry', 'set_status', 'set_expiry'}
+    Status/expiry that are missing or 'current' stay as they are; an empty or
+    'never' expiry removes it, like in the interactive editor
+    """
+    if not isinstance(record, dict):
+        raise ValueError("not a JSON object")
+    
+    user_id = record.get('id')
+    username = record.get('username')
+    if user_id not in (None, ''):
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            raise ValueError(f"invalid id {user_id!r}")
+    else:
+        user_id = None
+    username = str(username).strip() if username not in (None, '') else None
+    if user_id is None and not username:
+        raise ValueError("id or username required")
+    
+    status = record.get('status')
+    status = str(status).strip().lower() if status is not None else ''
+    if status in ('', 'current'):
+        set_status, status = False, None
+    elif status in ('active', 'inactive'):
+        set_status = True
+    else:
+        raise ValueError(f"invalid status {status!r}")
+    
+    set_expiry = 'expiry' in record
+    expiry = record.get('expiry')
+    expiry = str(expiry).strip() if expiry is not None else ''
+    if not set_expiry or expiry.lower() == 'current':
+        set_expiry, expiry = False, None
+    elif expiry == '' or expiry.lower() == 'never':
+        expiry = None
+    else:
+        parsed = parse_date_input(expiry)
+        if not parsed:
+            raise ValueError(f"invalid expiry {expiry!r}")
+        expiry = parsed
+    
+    if not set_status and not set_expiry:
+        raise ValueError("nothing to change (no status or expiry)")
+    return {'id': user_id, 'username': username, 'status': status, 'expiry': expiry,
+            'set_status': set_status, 'set_expiry': set_expiry}
+
+def apply_edit_batch(connection, edits, dry_run=False):
+    """
+    Apply one batch of edits in a single transaction (see UserRepository.apply_edit_batch)
+    Returns (changed, unchanged, missing keys)
+    """
+    return get_repository(DEFAULT_ENV_PATH).apply_edit_batch(connection, edits, 'bulk_edit', dry_run)
+
+def apply_bulk_edits(connection, records, batch_size=1000, dry_run=False, progress=True):
+    """
+    Parse and apply (line number, record) pairs batch_size edits per transaction
+    Invalid records are reported and skipped; returns a summary dict
+    """
+    summary = {'read': 0, 'invalid': 0, 'changed': 0, 'unchanged': 0, 'missing': 0, 'batches': 0}
+    started = time.perf_counter()
+    
+    def flush(batch):
+        changed, unchanged, missing = apply_edit_batch(connection, batch, dry_run)
+        summary['changed'] += changed
+        summary['unchanged'] += unchanged
+        summary['missing'] += len(missing)
+        summary['batches'] += 1
+        for key in missing:
+            print(f"⚠️  No such user: {key}", file=sys.stderr)
+        if progress:
+            elapsed = time.perf_counter() - started
+            print(f"📦 {summary['read']} rows read, {summary['changed']} "
+                  f"{'would change' if dry_run else 'changed'} "
+                  f"({summary['read'] / elapsed:,.0f} rows/s)", file=sys.stderr)
+    
+    batch = []
+    for line_no, record in records:
+        summary['read'] += 1
+        try:
+            batch.append(parse_bulk_edit(record))
+        except ValueError as e:
+            summary['invalid'] += 1
+            print(f"❌ Line {line_no}: {e}", file=sys.stderr)
+            continue
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+    
+    summary['seconds'] = round(time.perf_counter() - started, 3)
+    return summary
+
+def bulk_main(args):
+    """Non-interactive bulk editing (--bulk); exits 1 if any row was invalid or unknown"""
+    connection = create_db_connection(DEFAULT_ENV_PATH)
+    try:
+        lines, fmt = open_bulk_input(args.bulk, args.format)
+        summary = apply_bulk_edits(connection, read_bulk_records(lines, fmt), args.batch_size,
+                                   args.dry_run, progress=not args.quiet)
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        connection.close()
+        sys.exit(1)
+    except storage.Error as e:
+        log.error("Bulk edit failed", error=str(e))
+        connection.rollback()
+        connection.close()
+        logs.flush()
+        sys.exit(1)
+    connection.close()
+    
+    log.info("Bulk edit finished", dry_run=args.dry_run, **summary)
+    verb = 'Would change' if args.dry_run else 'Changed'
+    print(f"{'🔍 Dry run: ' if args.dry_run else '✅ '}{verb} {summary['changed']} users, "
+          f"{summary['unchanged']} already up to date, {summary['missing']} not found, "
+          f"{summary['invalid']} invalid rows ({summary['read']} rows in {summary['seconds']}s)")
+    if summary['invalid'] or summary['missing']:
+        sys.exit(1)
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Browse and edit user subscriptions (interactive without --bulk)',
+        epilog="Bulk records: id or username, plus status (active/inactive) and/or expiry "
+               "(YYYY-MM-DD, +N days from today, 'never' or empty for none). "
+               "A missing column or 'current' keeps the value.")
+    parser.add_argument('--bulk', metavar='FILE',
+                        help="apply edits from a CSV (with header) or NDJSON file, '-' for stdin")
+    parser.add_argument('--format', choices=('csv', 'ndjson'),
+                        help='input format (default: from the file extension or first line)')
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        help='edits per transaction (default: 1000)')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='report what would change without writing')
+    parser.add_argument('--quiet', action='store_true', help='no per-batch progress output')
+    return parser.parse_args()
+
 def main():
-    # Load environment variables
-    env_path = "/etc/demo/.venv"  # Change this to your .venv file path
-    env_vars = load_env_file(env_path)
+    args = parse_args()
+    # Load environment variables (set DEMO_ENV_FILE to use another .venv file)
+    load_env_file(DEFAULT_ENV_PATH)
+    # Diagnostics go to stderr so they stay out of the interactive output
+    logs.setup_from_config(get_config(DEFAULT_ENV_PATH), stream=sys.stderr)
+    
+    if args.bulk:
+        bulk_main(args)
+        return
     
     # Create database connection
-    connection = create_db_connection(env_vars)
+    connection = create_db_connection(DEFAULT_ENV_PATH)
+    
+    page_size = get_config(DEFAULT_ENV_PATH).get_int('USER_PAGE_SIZE', 25)
+    filters = {}
+    start_id = 0
     
     while True:
-        # Display all users
-        users = get_all_users(connection)
+        # Display the current page
+        users, has_more = get_users_page(connection, filters, start_id, page_size)
+        display_stats(get_user_stats(connection))
         display_users(users)
+        if users:
+            print(f"Showing IDs {users[0]['id']}-{users[-1]['id']}"
+                  f"{' (more after this page)' if has_more else ' (last page)'}  Filters: {describe_filters(filters)}")
+        elif filters:
+            print(f"Filters: {describe_filters(filters)}")
         
         print("\nOptions:")
         print("1. Edit user subscription")
         print("2. Refresh list")
-        print("3. Exit")
+        print("3. Verify statistics")
+        print("4. Exit")
+        print("n. Next page   p. Previous page   j. Jump to ID   f. Search/filter   c. Clear filters")
+        
+        choice = input("\nEnter your choice (1-4, n/p/j/f/c): ").strip().lower()
         
-        choice = input("\nEnter your choice (1-3): ").strip()
+        if choice == 'n':
+            if has_more:
+                start_id = users[-1]['id'] + 1
+            else:
+                print("Already on the last page.")
+                input("\nPress Enter to continue...")
+            continue
+        
+        if choice == 'p':
+            first_id = users[0]['id'] if users else start_id
+            start_id = get_previous_page_start(connection, filters, first_id, page_size)
+            continue
+        
+        if choice == 'j':
+            try:
+                start_id = max(int(input("Show users from ID: ").strip()), 0)
+            except ValueError:
+                print("Invalid user ID. Please enter a number.")
+                input("\nPress Enter to continue...")
+            continue
+        
+        if choice == 'f':
+            filters = prompt_filters()
+            start_id = 0
+            continue
+        
+        if choice == 'c':
+            filters = {}
+            start_id = 0
+            continue
         
         if choice == '1':
             try:
@@ -257,11 +583,14 @@ def main():
             continue  # Refresh the list
         
         elif choice == '3':
+            verify_stats(connection)
+        
+        elif choice == '4':
             print("Goodbye!")
             break
         
         else:
-            print("Invalid choice. Please enter 1, 2, or 3.")
+            print("Invalid choice. Please enter 1-4 or n, p, j, f, c.")
         
         input("\nPress Enter to continue...")
     
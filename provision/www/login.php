@@ -1,6 +1,7 @@
 <?php
 // Load environment variables
 require_once 'env_loader.php';
+require_once 'password_hash.php';
 
 // Initialize variables
 $errors = [];
@@ -49,8 +50,13 @@ if ($_SERVER['REQUEST_METHOD'] == 'POST' && isset($_POST['login'])) {
             $stmt->execute([$username]);
             $user = $stmt->fetch(PDO::FETCH_ASSOC);
 
-            if ($user && md5($password) === $user['password']) {
-                // Login successful
+            if ($user && verify_user_password($password, $user['password'])) {
+                // Login successful; move old MD5 / lower-cost hashes to the current settings
+                if (user_password_needs_rehash($user['password'])) {
+                    $stmt = $pdo->prepare("UPDATE users SET password = ?, updated_at = updated_at WHERE id = ? AND password = ?");
+                    $stmt->execute([hash_user_password($password), $user['id'], $user['password']]);
+                }
+                
                 $_SESSION['user_id'] = $user['id'];
                 $_SESSION['username'] = $user['username'];
                 $_SESSION['status'] = $user['status'];
@@ -90,9 +96,14 @@ if ($_SERVER['REQUEST_METHOD'] == 'POST' && isset($_POST['purchase'])) {
                 $new_expiry = date('Y-m-d', strtotime("+$months months"));
             }
 
-            // Update user subscription in database
+            // Update user subscription in database (and log it for the API change feed)
+            $pdo->beginTransaction();
             $stmt = $pdo->prepare("UPDATE users SET status = ?, expiry = ? WHERE id = ?");
             $stmt->execute([$new_status, $new_expiry, $user_data['id']]);
+            $stmt = $pdo->prepare("INSERT INTO user_changes (user_id, username, status, expiry, source)
+                                   SELECT id, username, status, expiry, 'purchase' FROM users WHERE id = ?");
+            $stmt->execute([$user_data['id']]);
+            $pdo->commit();
 
             // Update session data
             $_SESSION['status'] = $new_status;
@@ -0,0 +1,44 @@
+<?php
+// password_hash.php - Stored password hashes shared with the API (lib/authcore/passwords.py)
+//
+// Formats: pbkdf2_sha256$<iterations>$<salt>$<hash> (unpadded base64)
+//          <32 hex digits> legacy unsalted MD5, verify only
+// scrypt hashes can only be checked by the API; keep PASSWORD_HASH_ALGORITHM
+// on pbkdf2_sha256 while these pages are in use.
+
+define('PASSWORD_PBKDF2_ITERATIONS', (int)(getenv('PASSWORD_PBKDF2_ITERATIONS') ?: 600000));
+
+function b64_unpadded($data) {
+    return rtrim(base64_encode($data), '=');
+}
+
+function hash_user_password($password) {
+    $salt = random_bytes(16);
+    $hash = hash_pbkdf2('sha256', $password, $salt, PASSWORD_PBKDF2_ITERATIONS, 32, true);
+    return 'pbkdf2_sha256$' . PASSWORD_PBKDF2_ITERATIONS . '$' . b64_unpadded($salt) . '$' . b64_unpadded($hash);
+}
+
+function verify_user_password($password, $stored) {
+    if (preg_match('/^[0-9a-fA-F]{32}$/', $stored)) {
+        return hash_equals(strtolower($stored), md5($password));
+    }
+    $parts = explode('$', $stored);
+    if (count($parts) !== 4 || $parts[0] !== 'pbkdf2_sha256' || !ctype_digit($parts[1])) {
+        return false;
+    }
+    $salt = base64_decode($parts[2]);
+    $expected = base64_decode($parts[3]);
+    if ($salt === false || $expected === false) {
+        return false;
+    }
+    $hash = hash_pbkdf2('sha256', $password, $salt, (int)$parts[1], strlen($expected), true);
+    return hash_equals($expected, $hash);
+}
+
+// True when the stored hash is MD5 or uses other PBKDF2 iterations than configured
+function user_password_needs_rehash($stored) {
+    $parts = explode('$', $stored);
+    return $parts[0] !== 'pbkdf2_sha256' || ($parts[1] ?? '') !== (string)PASSWORD_PBKDF2_ITERATIONS;
+}
+
+?>
@@ -1,6 +1,7 @@
 <?php
 // Load environment variables
 require_once 'env_loader.php'; // Update this path
+require_once 'password_hash.php';
 
 // Initialize variables
 $errors = [];
@@ -52,12 +53,17 @@ if ($_SERVER['REQUEST_METHOD'] == 'POST') {
             if ($stmt->rowCount() > 0) {
                 $errors[] = "Username already exists. Please choose a different one.";
             } else {
-                // Hash password using MD5
-                $hashed_password = md5($password);
+                // Salted PBKDF2 hash, same format as the API (password_hash.php)
+                $hashed_password = hash_user_password($password);
 
-                // Insert new user
+                // Insert new user (and log it for the API change feed)
+                $pdo->beginTransaction();
                 $stmt = $pdo->prepare("INSERT INTO users (username, password) VALUES (?, ?)");
                 $stmt->execute([$username, $hashed_password]);
+                $stmt = $pdo->prepare("INSERT INTO user_changes (user_id, username, status, expiry, source)
+                                       SELECT id, username, status, expiry, 'register' FROM users WHERE id = ?");
+                $stmt->execute([$pdo->lastInsertId()]);
+                $pdo->commit();
 
                 $success = "Registration successful!";
 